@@ -0,0 +1,103 @@
+// Live vehicle maps: keep a server-sent event stream open per map and
+// restyle its vehicle layers whenever the server pushes a new feed version.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    live_map: {
+        subscribe: function (config) {
+            const streams = (window.liveMapStreams = window.liveMapStreams || {});
+            if (streams[config.graph]) {
+                streams[config.graph].close();
+            }
+            const routes = {};
+
+            function setStatus(status) {
+                window.dash_clientside.set_props(JSON.parse(config.status), {
+                    children: status,
+                });
+            }
+
+            function plot() {
+                const graph = document.getElementById(config.graph);
+                return graph && graph.querySelector(".js-plotly-plot");
+            }
+
+            function redraw(gd) {
+                const vehicles = Object.values(routes);
+                const column = (name) => [].concat(...vehicles.map((v) => v[name]));
+                const ids = column("vehicle_id");
+                const stamps = column("timestamp");
+                const lat = column("lat");
+                const lon = column("lon");
+
+                const hover = config.hover_traces;
+                if (hover.length) {
+                    const customdata = column("route_id").map((r, i) => [r, stamps[i]]);
+                    window.Plotly.restyle(
+                        gd,
+                        {
+                            lat: hover.map(() => lat),
+                            lon: hover.map(() => lon),
+                            hovertext: hover.map(() => ids),
+                            customdata: hover.map(() => customdata),
+                        },
+                        hover
+                    );
+                }
+                const trains = config.train_traces;
+                if (trains.length) {
+                    const text = ids.map(
+                        (id, i) => `${config.label} ${id}<br>Last seen: ${stamps[i]}`
+                    );
+                    window.Plotly.restyle(
+                        gd,
+                        {
+                            lat: trains.map(() => lat),
+                            lon: trains.map(() => lon),
+                            text: trains.map(() => text),
+                        },
+                        trains
+                    );
+                }
+            }
+
+            function connect() {
+                const source = new EventSource(config.url);
+                streams[config.graph] = source;
+                source.onopen = () => setStatus("live");
+                source.addEventListener("vehicles", (event) => {
+                    const gd = plot();
+                    if (!gd) {
+                        // The page holding the map was left
+                        source.close();
+                        delete streams[config.graph];
+                        return;
+                    }
+                    const update = JSON.parse(event.data);
+                    const previous = routes[update.route];
+                    routes[update.route] = update;
+                    // The first event repeats what the page was rendered with
+                    const shown = previous ? previous.version : config.version;
+                    if (update.version !== shown) {
+                        redraw(gd);
+                    }
+                });
+                source.onerror = () => {
+                    if (source.readyState !== EventSource.CLOSED) {
+                        setStatus("reconnecting");
+                        return;
+                    }
+                    // Refused outright (the server is at its stream limit):
+                    // the browser will not retry on its own
+                    setStatus("unavailable");
+                    setTimeout(() => {
+                        if (streams[config.graph] === source && plot()) {
+                            connect();
+                        }
+                    }, 30000);
+                };
+            }
+
+            connect();
+            return "connecting";
+        },
+    },
+});
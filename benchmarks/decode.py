@@ -0,0 +1,173 @@
+"""Decode benchmark: vehicle positions feed to columns and records.
+
+Times the field-by-field decoder in ``utils.feed_decode`` against the
+per-entity loops it replaced, on the recorded vehicle positions feed:
+
+    parse     bytes -> FeedMessage
+    snapshot  FeedMessage -> VehicleSnapshot (the map's columns)
+    positions FeedMessage -> fetch_vehicle_positions rows
+    records   FeedMessage -> one dict per vehicle (extract_gtfs_data.py)
+
+    python benchmarks/decode.py
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from extract_gtfs_data import vehicle_records  # noqa: E402
+from standin_server import load_feed_fixtures  # noqa: E402
+from utils.feed_decode import BACKEND, decode_feed  # noqa: E402
+from utils.vehicles import VehicleSnapshot  # noqa: E402
+
+_OPTIONAL = {
+    "vehicle": ("current_stop_sequence", "stop_id", "current_status")
+    + ("congestion_level", "occupancy_status"),
+    "descriptor": ("label", "license_plate"),
+    "trip": ("direction_id", "start_time", "start_date", "schedule_relationship"),
+    "position": ("bearing", "odometer", "speed"),
+}
+
+
+def legacy_snapshot(feed) -> VehicleSnapshot:
+    """The per-entity loop VehicleSnapshot.from_feed used before"""
+    vehicle_id, trip_id, route_id, direction_id = [], [], [], []
+    latitude, longitude, bearing, speed, timestamp = [], [], [], [], []
+    nan = float("nan")
+    for entity in feed.entity:
+        vehicle = entity.vehicle
+        trip = vehicle.trip
+        position = vehicle.position
+        vehicle_id.append(vehicle.vehicle.id)
+        trip_id.append(trip.trip_id)
+        route_id.append(trip.route_id)
+        direction_id.append(trip.direction_id if trip.HasField("direction_id") else -1)
+        latitude.append(position.latitude)
+        longitude.append(position.longitude)
+        bearing.append(position.bearing if position.HasField("bearing") else nan)
+        speed.append(position.speed if position.HasField("speed") else nan)
+        timestamp.append(vehicle.timestamp)
+    return VehicleSnapshot.from_columns(
+        vehicle_id,
+        trip_id,
+        route_id,
+        direction_id,
+        latitude,
+        longitude,
+        bearing,
+        speed,
+        timestamp,
+    )
+
+
+def legacy_positions(feed) -> list:
+    """The per-entity dict building fetch_vehicle_positions used before"""
+    vehicles = []
+    for entity in feed.entity:
+        vehicle = entity.vehicle
+        timestamp = datetime.fromtimestamp(vehicle.timestamp)
+        vehicles.append(
+            {
+                "vehicle_id": vehicle.vehicle.id,
+                "trip_id": vehicle.trip.trip_id,
+                "route_id": vehicle.trip.route_id,
+                "latitude": vehicle.position.latitude,
+                "longitude": vehicle.position.longitude,
+                "speed": vehicle.position.speed
+                if vehicle.position.HasField("speed")
+                else "N/A",
+                "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+        )
+    return vehicles
+
+
+def positions(feed) -> list:
+    return VehicleSnapshot.from_feed(feed).to_records()
+
+
+def legacy_records(feed) -> list:
+    """The per-entity dict building vehicle_records used before"""
+    vehicles = []
+    for entity in feed.entity:
+        vehicle = entity.vehicle
+        messages = {
+            "vehicle": vehicle,
+            "descriptor": vehicle.vehicle,
+            "trip": vehicle.trip,
+            "position": vehicle.position,
+        }
+        optional = {
+            field: getattr(message, field) if message.HasField(field) else None
+            for level, message in messages.items()
+            for field in _OPTIONAL[level]
+        }
+        vehicles.append(
+            {
+                "vehicle_id": vehicle.vehicle.id,
+                "label": optional["label"],
+                "license_plate": optional["license_plate"],
+                "trip_id": vehicle.trip.trip_id,
+                "route_id": vehicle.trip.route_id,
+                "direction_id": optional["direction_id"],
+                "start_time": optional["start_time"],
+                "start_date": optional["start_date"],
+                "schedule_relationship": optional["schedule_relationship"],
+                "latitude": vehicle.position.latitude,
+                "longitude": vehicle.position.longitude,
+                "bearing": optional["bearing"],
+                "odometer": optional["odometer"],
+                "speed": optional["speed"],
+                "current_stop_sequence": optional["current_stop_sequence"],
+                "stop_id": optional["stop_id"],
+                "current_status": optional["current_status"],
+                "congestion_level": optional["congestion_level"],
+                "occupancy_status": optional["occupancy_status"],
+                "timestamp": datetime.fromtimestamp(vehicle.timestamp).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                ),
+            }
+        )
+    return vehicles
+
+
+def best(function, *args, number: int) -> float:
+    """Best of five runs, in seconds per call"""
+    return min(timeit.repeat(lambda: function(*args), number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+
+    content = load_feed_fixtures(os.path.join(ROOT, "data")).get(
+        "vehiclepositions.pb"
+    )
+    if content is None:
+        sys.exit("No recorded vehicle positions feed in data/")
+    feed = decode_feed(content)
+
+    stages = {
+        "parse": (None, decode_feed, content),
+        "snapshot": (legacy_snapshot, VehicleSnapshot.from_feed, feed),
+        "positions": (legacy_positions, positions, feed),
+        "records": (legacy_records, vehicle_records, feed),
+    }
+    print(f"protobuf backend {BACKEND}, {len(feed.entity)} vehicles")
+    for name, (legacy, current, argument) in stages.items():
+        seconds = best(current, argument, number=args.number)
+        line = f"{name:<10} {seconds * 1000:8.2f} ms"
+        if legacy is not None:
+            before = best(legacy, argument, number=args.number)
+            line += f"   was {before * 1000:8.2f} ms   {before / seconds:5.1f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
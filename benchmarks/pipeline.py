@@ -0,0 +1,284 @@
+"""Pipeline benchmark: the cost of each stage from upstream request to page.
+
+Replays the recorded GTFS realtime feeds and NexTrip responses from the
+stand-in server and times, as the median of ``--runs`` repetitions:
+
+    feeds/<feed>/fetch|parse|<builder>   HTTP fetch, protobuf parse, row/array build
+    nextrip/<path>/fetch|parse           NexTrip request and JSON decode
+    routes/<route_id>/figure|page        route map figure from scratch, page render
+    strips/match                         every vehicle matched to its route's line
+    strips/<route_id>/base|page|cached   strip map stops from scratch, page render
+    pages/<path>/render                  every other page's layout
+    pages/<path>/cached                  the same, served from the render cache
+    tables/<table>/page                  first page of each server-side table
+
+Results are written as JSON ({"environment": ..., "timings_ms": ...}), so
+runs from different releases can be kept and compared:
+
+    python benchmarks/pipeline.py --output results.json
+    python benchmarks/pipeline.py --compare results.json   # exit 1 on regressions
+"""
+
+import argparse
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from standin_server import (  # noqa: E402
+    StandInServer,
+    gtfs_routes,
+    load_feed_fixtures,
+    load_nextrip_fixtures,
+    nextrip_routes,
+)
+
+# Stop whose departure board is rendered; any stop in the trip updates works
+DEFAULT_STOP = "51433"
+
+
+def median_ms(function, runs: int) -> float:
+    """Median wall time of ``function()`` over ``runs`` calls, in milliseconds"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def environment() -> dict:
+    import dash
+    import numpy
+    import plotly
+
+    from utils.feed_decode import BACKEND
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "protobuf_backend": BACKEND,
+        "dash": dash.__version__,
+        "plotly": plotly.__version__,
+        "numpy": numpy.__version__,
+    }
+
+
+def run(runs: int, stop_id: str) -> dict:
+    """Time every stage against the stand-in named by the environment"""
+    # Imported here so the modules pick up the stand-in's base URLs
+    import dash
+
+    import app  # noqa: F401  (registers the pages)
+    from components.route_maps import route_base_figure, route_vehicle_trace
+    from components.strip_map import strip_base
+    from components.server_table import FEED_TABLES, TABLE_PAGE_SIZE, table_engine
+    from extract_gtfs_data import vehicle_records
+    from utils import http_client
+    from utils.feed_decode import decode_feed
+    from utils.gtfs_api import (
+        ALERTS_URL,
+        TRIP_UPDATES_URL,
+        VEHICLE_POSITIONS_URL,
+        get_vehicle_snapshot,
+        parse_service_alerts,
+        parse_trip_updates,
+    )
+    from utils.nextrip_api import NEXTRIP_BASE_URL
+    from utils.route_geometry import route_geometry
+    from utils.trip_index import TripIndex
+    from utils.vehicles import VehicleSnapshot
+
+    feeds = {
+        "vehicle_positions": (
+            VEHICLE_POSITIONS_URL,
+            {"snapshot": VehicleSnapshot.from_feed, "records": vehicle_records},
+        ),
+        "trip_updates": (
+            TRIP_UPDATES_URL,
+            {"rows": parse_trip_updates, "index": TripIndex.from_feed},
+        ),
+        "service_alerts": (
+            ALERTS_URL,
+            {"rows": parse_service_alerts},
+        ),
+    }
+    timings = {}
+
+    def fetch(url):
+        response = http_client.get(url, timeout=http_client.GTFS_REALTIME_TIMEOUT)
+        response.raise_for_status()
+        return response
+
+    for name, (url, builders) in feeds.items():
+        content = fetch(url).content
+        feed = decode_feed(content)
+        timings[f"feeds/{name}/fetch"] = median_ms(lambda: fetch(url), runs)
+        timings[f"feeds/{name}/parse"] = median_ms(lambda: decode_feed(content), runs)
+        for stage, build in builders.items():
+            timings[f"feeds/{name}/{stage}"] = median_ms(lambda: build(feed), runs)
+
+    for path in ("routes", "agencies", "directions/901", "stops/901/0", stop_id):
+        url = f"{NEXTRIP_BASE_URL}/{path}"
+        response = fetch(url)
+        timings[f"nextrip/{path}/fetch"] = median_ms(lambda: fetch(url), runs)
+        timings[f"nextrip/{path}/parse"] = median_ms(response.json, runs)
+
+    # Layouts as written, without the timing and render cache wrappers
+    layouts = {
+        page["path_template"] or page["path"]: inspect.unwrap(page["layout"])
+        for page in dash.page_registry.values()
+    }
+    cached = {
+        page["path_template"] or page["path"]: page["layout"]
+        for page in dash.page_registry.values()
+        if page.get("render_cache") is not None
+    }
+    version = route_geometry().version
+    snapshot = get_vehicle_snapshot()
+    for route_id in sorted(set(snapshot.route_id.tolist())):
+
+        def figure():
+            base = route_base_figure.__wrapped__(route_id, version)
+            return base["data"] + [
+                route_vehicle_trace(route_id, snapshot.for_route(route_id))
+            ]
+
+        render = layouts["/route-map/<route_id>"]
+        timings[f"routes/{route_id}/figure"] = median_ms(figure, runs)
+        timings[f"routes/{route_id}/page"] = median_ms(
+            lambda: render(route_id=route_id), runs
+        )
+
+    lines = route_geometry().lines
+    timings["strips/match"] = median_ms(
+        lambda: lines.match(
+            snapshot.route_id,
+            snapshot.direction_id,
+            snapshot.latitude,
+            snapshot.longitude,
+        ),
+        runs,
+    )
+    strip_path = "/strip-map/<route_id>"
+    for route_id in route_geometry().routes():
+        render = layouts[strip_path]
+        timings[f"strips/{route_id}/base"] = median_ms(
+            lambda: strip_base.__wrapped__(route_id, version), runs
+        )
+        timings[f"strips/{route_id}/page"] = median_ms(
+            lambda: render(route_id=route_id), runs
+        )
+        timings[f"strips/{route_id}/cached"] = median_ms(
+            lambda: cached[strip_path](route_id=route_id), runs
+        )
+
+    # Pages with a path template are timed above with real arguments
+    pages = {"/stop/<stop_id>": {"stop_id": stop_id}}
+    pages.update(
+        (page["path"], {})
+        for page in dash.page_registry.values()
+        if page["path_template"] is None
+    )
+    for path, arguments in pages.items():
+        layout = layouts[path]
+        timings[f"pages/{path}/render"] = median_ms(lambda: layout(**arguments), runs)
+        if path in cached:
+            timings[f"pages/{path}/cached"] = median_ms(
+                lambda: cached[path](**arguments), runs
+            )
+
+    for table_id in ["routes", *FEED_TABLES]:
+        timings[f"tables/{table_id}/page"] = median_ms(
+            lambda: table_engine(table_id).query("", [], 0, TABLE_PAGE_SIZE), runs
+        )
+    return timings
+
+
+def compare(timings: dict, previous: dict, tolerance: float, slack: float) -> list:
+    """Lines describing each timing slower than ``previous`` allows"""
+    regressions = []
+    for name, ms in timings.items():
+        before = previous.get(name)
+        if before is not None and ms > before * (1 + tolerance) + slack:
+            regressions.append(f"{name:<48} {ms:9.3f} ms   was {before:9.3f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--stop", default=DEFAULT_STOP, help="stop board to render")
+    parser.add_argument("--output", help="write the results here instead of stdout")
+    parser.add_argument("--compare", help="results of an earlier run to check against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown over the earlier run, as a fraction",
+    )
+    parser.add_argument(
+        "--slack",
+        type=float,
+        default=1.0,
+        help="extra milliseconds allowed, so sub-millisecond timings are not flaky",
+    )
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    fixtures = load_feed_fixtures(os.path.join(ROOT, "data"))
+    nextrip = load_nextrip_fixtures(os.path.join(ROOT, "data"), fixtures)
+    with tempfile.TemporaryDirectory() as scratch:
+        with StandInServer({**gtfs_routes(fixtures), **nextrip_routes(nextrip)}) as server:
+            os.environ.update(
+                FEED_POLLER="0",
+                GTFS_REALTIME_BASE_URL=f"{server.base_url}/mtgtfs",
+                NEXTRIP_BASE_URL=f"{server.base_url}/nextrip",
+                METADATA_CACHE_PATH=os.path.join(scratch, "metadata.sqlite3"),
+                RENDER_CACHE_PATH=os.path.join(scratch, "render_cache.sqlite3"),
+            )
+            results = {
+                "environment": dict(environment(), runs=args.runs),
+                "timings_ms": run(args.runs, args.stop),
+            }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["timings_ms"]
+        regressions = compare(
+            results["timings_ms"], previous, args.tolerance, args.slack
+        )
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
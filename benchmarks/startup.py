@@ -0,0 +1,170 @@
+"""Startup benchmark: import time of the app and its first page requests.
+
+Each sample runs in a fresh interpreter, importing ``app`` and then rendering
+every page once against the stand-in server, which is what a restarted
+worker does. The baseline is measured in the same run: a git revision of
+the project is exported to a scratch directory and sampled alternately with
+the working tree, so both see the same machine and load. The baseline is
+a fixed reference (``origin/main`` unless given), not the parent commit, so
+slowdowns cannot creep in a little per commit; ``BUDGET`` also caps each
+median outright. The script exits with status 1 if any median exceeds the
+baseline's by more than the tolerance and slack, or its budget, so it can
+run as a CI or pre-deploy check.
+
+    python benchmarks/startup.py                        # against origin/main
+    python benchmarks/startup.py --baseline v1.2.0
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from standin_server import StandInServer, gtfs_routes, load_feed_fixtures  # noqa: E402
+
+# Page timed under each name: (registered path or template, layout arguments)
+PAGES = {
+    "/": ("/", {}),
+    "/map": ("/map", {}),
+    "/blue-line-map": ("/blue-line-map", {}),
+    "/route-map/5": ("/route-map/<route_id>", {"route_id": "5"}),
+    "/trip-updates": ("/trip-updates", {}),
+}
+
+# Seconds no median may exceed, whatever the baseline: about twice today's
+# figures on a development machine, raised only on purpose
+BUDGET = {
+    "import": 3.0,
+    "/": 0.05,
+    "/map": 0.15,
+    "/blue-line-map": 0.05,
+    "/route-map/5": 0.05,
+    "/trip-updates": 0.05,
+}
+
+# Runs in the fresh interpreter; prints {"import": s, "<page>": s, ...}
+_SAMPLE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+import dash
+timings = {"import": time.perf_counter() - start}
+layouts = {
+    page["path_template"] or page["path"]: page["layout"]
+    for page in dash.page_registry.values()
+}
+for name, (path, arguments) in json.loads(sys.argv[1]).items():
+    if path not in layouts:
+        continue  # a page the baseline revision does not have yet
+    start = time.perf_counter()
+    layouts[path](**arguments)
+    timings[name] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def export_revision(revision: str, directory: str):
+    """Write the files of a git revision of the project into ``directory``"""
+    archive = subprocess.run(
+        ["git", "archive", "--format=tar", revision],
+        cwd=ROOT,
+        capture_output=True,
+        check=True,
+    ).stdout
+    with tempfile.TemporaryFile() as f:
+        f.write(archive)
+        f.seek(0)
+        with tarfile.open(fileobj=f) as tar:
+            tar.extractall(directory, filter="data")
+
+
+def sample(root: str, base_url: str) -> dict:
+    with tempfile.TemporaryDirectory() as scratch:
+        env = dict(
+            os.environ,
+            FEED_POLLER="0",
+            GTFS_REALTIME_BASE_URL=f"{base_url}/mtgtfs",
+            PYTHONDONTWRITEBYTECODE="1",
+            # An empty render store, so every sample renders its pages
+            RENDER_CACHE_PATH=os.path.join(scratch, "render_cache.sqlite3"),
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", _SAMPLE, json.dumps(PAGES)],
+            cwd=root,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown over the baseline, as a fraction",
+    )
+    parser.add_argument(
+        "--slack",
+        type=float,
+        default=0.025,
+        help="extra seconds allowed, so millisecond timings are not flaky",
+    )
+    parser.add_argument(
+        "--baseline",
+        default="origin/main",
+        help="git revision to compare the working tree with (a branch or tag)",
+    )
+    args = parser.parse_args()
+
+    fixtures = load_feed_fixtures(os.path.join(ROOT, "data"))
+    samples = {"baseline": [], "current": []}
+    with tempfile.TemporaryDirectory() as baseline_root:
+        try:
+            export_revision(args.baseline, baseline_root)
+        except subprocess.CalledProcessError:
+            parser.error(f"cannot export revision {args.baseline!r}")
+        roots = {"baseline": baseline_root, "current": ROOT}
+        with StandInServer(gtfs_routes(fixtures)) as server:
+            # Alternate trees so a change in machine load affects both alike
+            for _ in range(args.runs):
+                for tree, root in roots.items():
+                    samples[tree].append(sample(root, server.base_url))
+    medians = {
+        tree: {
+            name: statistics.median(s[name] for s in runs) for name in runs[0]
+        }
+        for tree, runs in samples.items()
+    }
+
+    baseline = medians["baseline"]
+    print(f"{'':<16} {'current':>11}   {args.baseline:>11}")
+    failed = False
+    for name, seconds in medians["current"].items():
+        line = f"{name:<16} {seconds * 1000:8.1f} ms"
+        if name in baseline:
+            limit = baseline[name] * (1 + args.tolerance) + args.slack
+            line += f"   {baseline[name] * 1000:8.1f} ms"
+            if seconds > limit:
+                line += "   REGRESSION"
+                failed = True
+        if seconds > BUDGET.get(name, float("inf")):
+            line += f"   OVER BUDGET ({BUDGET[name] * 1000:.0f} ms)"
+            failed = True
+        print(line)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import json
+import os
+from urllib.parse import urlencode
+
+import dash
+from _plotly_utils.utils import to_typed_array_spec
+from dash import html, dcc, Patch, no_update
+from dash.dependencies import ClientsideFunction, Input, Output, State, MATCH
+
+from utils.gtfs_api import VEHICLE_POSITIONS_URL, feed_version, get_vehicle_grid
+from utils.metrics import metrics
+
+# How often viewport maps check for new vehicle positions
+LIVE_MAP_INTERVAL_MS = int(os.environ.get("LIVE_MAP_INTERVAL_MS", "5000"))
+# Margin sent around a viewport, as a fraction of its size on each side, so a
+# short pan shows vehicles before the next refresh arrives
+VIEWPORT_PADDING = 0.25
+
+
+def _dom_id(component_id: dict) -> str:
+    # The element id Dash gives a component with a dictionary id
+    return json.dumps(component_id, sort_keys=True, separators=(",", ":"))
+
+
+def live_map(
+    key,
+    fig,
+    route_ids=(),
+    hover_traces=(0,),
+    train_traces=(),
+    label="Train",
+    viewport=False,
+):
+    """Wrap a vehicle map so its vehicle layers refresh in place.
+
+    ``hover_traces`` are plotly express vehicle layers (hovertext/customdata)
+    and ``train_traces`` are marker layers whose ``text`` starts with
+    ``label``; every other trace, such as the static track, is never sent
+    again after the first render.
+
+    The browser subscribes to ``/stream/vehicles`` for ``route_ids`` and
+    restyles the vehicle layers itself when a new version is pushed (see
+    assets/live_map.js), so open maps cost the server nothing between
+    feed versions. With ``viewport`` the map instead polls, and refreshes
+    only carry the vehicles in and around the area the user is looking at;
+    panning or zooming sends the vehicles of the new area.
+    """
+    if viewport:
+        return html.Div(
+            [
+                dcc.Graph(id={"type": "viewport-map", "index": key}, figure=fig),
+                dcc.Interval(
+                    id={"type": "viewport-map-interval", "index": key},
+                    interval=LIVE_MAP_INTERVAL_MS,
+                ),
+                dcc.Store(
+                    id={"type": "viewport-map-state", "index": key},
+                    data={
+                        "version": feed_version(VEHICLE_POSITIONS_URL),
+                        "route_ids": list(route_ids),
+                        "hover_traces": list(hover_traces),
+                        "train_traces": list(train_traces),
+                        "label": label,
+                        "bounds": None,
+                    },
+                ),
+            ]
+        )
+
+    graph_id = {"type": "live-map", "index": key}
+    query = urlencode({"route": ",".join(route_ids)}) if route_ids else ""
+    return html.Div(
+        [
+            dcc.Graph(id=graph_id, figure=fig),
+            dcc.Store(
+                id={"type": "live-map-stream", "index": key},
+                data={
+                    "url": dash.get_relative_path("/stream/vehicles")
+                    + (f"?{query}" if query else ""),
+                    "graph": _dom_id(graph_id),
+                    "status": _dom_id({"type": "live-map-status", "index": key}),
+                    "version": feed_version(VEHICLE_POSITIONS_URL),
+                    "hover_traces": list(hover_traces),
+                    "train_traces": list(train_traces),
+                    "label": label,
+                },
+            ),
+            html.Div(
+                id={"type": "live-map-status", "index": key},
+                style={"display": "none"},
+            ),
+        ]
+    )
+
+
+def viewport_bounds(relayout_data, padding: float = VIEWPORT_PADDING):
+    """[min_lat, min_lon, max_lat, max_lon] of a map's view, or None.
+
+    Plotly reports the corners of the visible map as ``map._derived`` in
+    the relayout event that ends a pan or zoom; other events carry none.
+    """
+    derived = (relayout_data or {}).get("map._derived") or {}
+    corners = derived.get("coordinates")
+    if not corners:
+        return None
+    lons, lats = zip(*corners)
+    lat_pad = (max(lats) - min(lats)) * padding
+    lon_pad = (max(lons) - min(lons)) * padding
+    return [
+        min(lats) - lat_pad,
+        min(lons) - lon_pad,
+        max(lats) + lat_pad,
+        max(lons) + lon_pad,
+    ]
+
+
+def _vehicle_patch(vehicles, state) -> Patch:
+    columns = vehicles.display_columns()
+    # Same base64 typed-array encoding plotly uses for the initial figure
+    lat = to_typed_array_spec(vehicles.latitude)
+    lon = to_typed_array_spec(vehicles.longitude)
+
+    patch = Patch()
+    for index in state["hover_traces"]:
+        patch["data"][index]["lat"] = lat
+        patch["data"][index]["lon"] = lon
+        patch["data"][index]["hovertext"] = columns["vehicle_id"].tolist()
+        patch["data"][index]["customdata"] = [
+            [route_id, timestamp]
+            for route_id, timestamp in zip(
+                columns["route_id"].tolist(), columns["timestamp"]
+            )
+        ]
+    for index in state["train_traces"]:
+        patch["data"][index]["lat"] = lat
+        patch["data"][index]["lon"] = lon
+        patch["data"][index]["text"] = [
+            f"{state['label']} {vehicle_id}<br>Last seen: {timestamp}"
+            for vehicle_id, timestamp in zip(columns["vehicle_id"], columns["timestamp"])
+        ]
+    return patch
+
+
+# Opens the map's event stream in the browser (assets/live_map.js)
+dash.clientside_callback(
+    ClientsideFunction(namespace="live_map", function_name="subscribe"),
+    Output({"type": "live-map-status", "index": MATCH}, "children"),
+    Input({"type": "live-map-stream", "index": MATCH}, "data"),
+)
+
+
+@dash.callback(
+    Output({"type": "viewport-map", "index": MATCH}, "figure"),
+    Output({"type": "viewport-map-state", "index": MATCH}, "data"),
+    Input({"type": "viewport-map-interval", "index": MATCH}, "n_intervals"),
+    Input({"type": "viewport-map", "index": MATCH}, "relayoutData"),
+    State({"type": "viewport-map-state", "index": MATCH}, "data"),
+    prevent_initial_call=True,
+)
+@metrics.timed("render", "viewport-map")
+def refresh_viewport_map(n_intervals, relayout_data, state):
+    """Send the vehicles in view when the feed changes or the view moves"""
+    version = feed_version(VEHICLE_POSITIONS_URL)
+    bounds = viewport_bounds(relayout_data) or state["bounds"]
+    if version is None or (version == state["version"] and bounds == state["bounds"]):
+        return no_update, no_update
+
+    vehicles, grid = get_vehicle_grid()
+    if bounds is not None:
+        vehicles = vehicles.select(grid.in_bbox(*bounds))
+    if state["route_ids"]:
+        vehicles = vehicles.for_route(*state["route_ids"])
+    return _vehicle_patch(vehicles, state), dict(state, version=version, bounds=bounds)
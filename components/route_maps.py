@@ -0,0 +1,175 @@
+import functools
+import json
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+from _plotly_utils.utils import to_typed_array_spec
+from dash import html, dcc
+
+from components.live_map import live_map
+from utils.gtfs_api import get_vehicle_snapshot
+from utils.route_geometry import route_geometry
+
+# Styling for routes with their own branding; other routes use the defaults
+ROUTE_STYLES = {
+    "901": {
+        "name": "Blue Line",
+        "color": "blue",
+        "symbol": "rail",
+        "zoom": 11,
+        "tracks": {
+            0: {
+                "name": "Blue Line Track (Northbound)",
+                "marker": {"size": 10, "color": "darkblue", "symbol": "circle"},
+                "line": {"width": 3, "color": "royalblue"},
+            },
+            1: {
+                "name": "Blue Line Track (Southbound)",
+                "marker": {"size": 8, "color": "blue"},
+                "line": {"width": 2, "color": "blue"},
+            },
+        },
+    },
+    "902": {
+        "name": "Green Line",
+        "color": "green",
+        "symbol": "rail",
+        "zoom": 12,
+        "tracks": {
+            0: {
+                "name": "Green Line Track (Eastbound)",
+                "marker": {"size": 8, "color": "green"},
+                "line": {"width": 3, "color": "green"},
+            },
+            1: {
+                "name": "Green Line Track (Westbound)",
+                "marker": {"size": 8, "color": "green"},
+                "line": {"width": 2, "color": "green"},
+            },
+        },
+    },
+}
+DEFAULT_ROUTE_COLOR = "#0055A5"
+# Maki icon of vehicles on routes without a style entry
+DEFAULT_VEHICLE_SYMBOL = "bus"
+DEFAULT_MAP_CENTER = {"lat": 44.9778, "lon": -93.2650}  # Downtown Minneapolis
+
+
+def route_style(route_id):
+    style = ROUTE_STYLES.get(route_id, {})
+    name = style.get("name", f"Route {route_id}")
+    color = style.get("color", DEFAULT_ROUTE_COLOR)
+    return name, color, style
+
+
+def vehicle_label(route_id):
+    # Only the branded rail lines have a style entry
+    return "Train" if route_id in ROUTE_STYLES else "Bus"
+
+
+@functools.lru_cache(maxsize=256)
+def route_base_figure(route_id, geometry_version):
+    """Static part of a route map (track and stops) as a JSON-ready dict.
+
+    Cached per route and geometry version, so requests only pay for adding
+    the current vehicles on top.
+    """
+    name, color, style = route_style(route_id)
+    geometry = route_geometry()
+    fig = go.Figure()
+    for direction_id in geometry.directions(route_id):
+        stops = geometry.stops_for(route_id, direction_id)
+        track = style.get("tracks", {}).get(direction_id, {})
+        fig.add_trace(
+            go.Scattermap(
+                mode="lines+markers",
+                lon=stops["longitude"],
+                lat=stops["latitude"],
+                marker=track.get("marker", {"size": 8, "color": color}),
+                line=track.get("line", {"width": 3 - direction_id, "color": color}),
+                name=track.get("name", f"{name} (Direction {direction_id})"),
+                text=stops["description"].tolist(),
+            )
+        )
+    stops = geometry.stops_for(route_id)
+    center = (
+        {
+            "lat": float(np.nanmean(stops["latitude"])),
+            "lon": float(np.nanmean(stops["longitude"])),
+        }
+        if len(stops)
+        else DEFAULT_MAP_CENTER
+    )
+    fig.update_layout(
+        map={"style": "open-street-map", "center": center, "zoom": style.get("zoom", 11)},
+        height=600,
+        margin={"r": 0, "t": 0, "l": 0, "b": 0},
+    )
+    return json.loads(fig.to_json())
+
+
+def route_vehicle_trace(route_id, vehicles):
+    """Marker layer for the vehicles currently on a route"""
+    name, color, style = route_style(route_id)
+    columns = vehicles.display_columns()
+    label = vehicle_label(route_id)
+    return {
+        "type": "scattermap",
+        "mode": "markers",
+        "lat": to_typed_array_spec(vehicles.latitude),
+        "lon": to_typed_array_spec(vehicles.longitude),
+        "marker": {
+            "size": 14,
+            "color": color,
+            "symbol": style.get("symbol", DEFAULT_VEHICLE_SYMBOL),
+        },
+        "name": f"{name} {label}s",
+        "text": [
+            f"{label} {vehicle_id}<br>Last seen: {timestamp}"
+            for vehicle_id, timestamp in zip(columns["vehicle_id"], columns["timestamp"])
+        ],
+    }
+
+
+def route_map_page(route_id):
+    """Map of one route's track with its current vehicles on top"""
+    name = route_style(route_id)[0]
+    label = vehicle_label(route_id)
+    base = route_base_figure(route_id, route_geometry().version)
+    vehicles = get_vehicle_snapshot().for_route(route_id)
+    figure = {
+        "data": base["data"] + [route_vehicle_trace(route_id, vehicles)],
+        "layout": base["layout"],
+    }
+    return html.Div(
+        [
+            html.H3(f"{name} {label} Map"),
+            dcc.Link("Strip map", href=f"/strip-map/{route_id}"),
+            live_map(
+                route_id,
+                figure,
+                route_ids=[route_id],
+                hover_traces=[],
+                train_traces=[len(figure["data"]) - 1],
+                label=label,
+            ),
+        ]
+    )
+
+
+def vehicle_map_figure(vehicles):
+    """Map of every vehicle in a snapshot"""
+    fig = px.scatter_map(
+        vehicles.display_columns(),
+        lat="latitude",
+        lon="longitude",
+        hover_name="vehicle_id",
+        hover_data=["route_id", "timestamp"],
+        color_discrete_sequence=["blue"],
+        zoom=10,
+        height=600,
+    )
+    fig.update_layout(mapbox_style="open-street-map")
+    fig.update_layout(margin={"r": 0, "t": 0, "l": 0, "b": 0})
+    return fig
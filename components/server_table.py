@@ -0,0 +1,114 @@
+import dash
+import requests
+from dash.dependencies import Input, Output, MATCH
+from google.protobuf.message import DecodeError
+
+from utils.gtfs_api import (
+    ALERTS_URL,
+    TRIP_UPDATES_URL,
+    VEHICLE_POSITIONS_URL,
+    derived,
+    load_feed,
+    parse_trip_updates,
+)
+from utils.alerts import alert_store
+from utils.metadata_cache import CachedMetroTransitAPI
+from utils.metrics import metrics
+from utils.render_cache import render_cache, render_key
+from utils.table_query import TableQueryEngine
+from utils.vehicles import VehicleSnapshot
+
+TABLE_PAGE_SIZE = 25
+
+# DataTable settings for tables whose rows are filtered, sorted and paged here
+SERVER_SIDE_TABLE = {
+    "page_action": "custom",
+    "sort_action": "custom",
+    "filter_action": "custom",
+    "page_current": 0,
+    "page_size": TABLE_PAGE_SIZE,
+}
+
+
+def _trip_table_rows(snapshot):
+    return parse_trip_updates(snapshot.feed)
+
+
+def _alert_table_rows(snapshot):
+    # Active alerts with when each was first and last published
+    alert_store.ingest(snapshot.feed)
+    return [record.to_row() for record in alert_store.active()]
+
+
+def _vehicle_table_rows(snapshot):
+    # The columns the maps use, so the feed is decoded once per version
+    return derived(snapshot, "vehicles", VehicleSnapshot.from_feed).to_records()
+
+
+# Table id -> (feed URL, builder of the table rows from a feed snapshot)
+FEED_TABLES = {
+    "trip-updates": (TRIP_UPDATES_URL, _trip_table_rows),
+    "service-alerts": (ALERTS_URL, _alert_table_rows),
+    "vehicle-positions": (VEHICLE_POSITIONS_URL, _vehicle_table_rows),
+}
+
+# NexTrip routes, shared with the other workers through the metadata cache
+metadata_api = CachedMetroTransitAPI()
+_routes_table = {"rows": None, "engine": None}
+
+
+def table_engine(table_id):
+    """Query engine over the current rows of a server-side table"""
+    if table_id == "routes":
+        # The cache returns the same list until the stored routes change
+        rows = metadata_api.get_routes()
+        if rows is not _routes_table["rows"]:
+            _routes_table["engine"] = TableQueryEngine(rows)
+            _routes_table["rows"] = rows
+        return _routes_table["engine"]
+
+    url, build_rows = FEED_TABLES[table_id]
+    snapshot = load_feed(url)
+    return derived(
+        snapshot,
+        f"table:{table_id}",
+        lambda feed: TableQueryEngine(build_rows(snapshot)),
+    )
+
+
+@dash.callback(
+    Output({"type": "server-table", "index": MATCH}, "data"),
+    Output({"type": "server-table", "index": MATCH}, "page_count"),
+    Input({"type": "server-table", "index": MATCH}, "page_current"),
+    Input({"type": "server-table", "index": MATCH}, "page_size"),
+    Input({"type": "server-table", "index": MATCH}, "sort_by"),
+    Input({"type": "server-table", "index": MATCH}, "filter_query"),
+)
+@metrics.timed("render", "server-table")
+def update_server_table(page_current, page_size, sort_by, filter_query):
+    """Return only the requested page of a table, filtered and sorted here"""
+    table_id = dash.ctx.outputs_list[0]["id"]["index"]
+
+    def render():
+        engine = table_engine(table_id)
+        return engine.query(filter_query, sort_by, page_current, page_size)
+
+    try:
+        if table_id not in FEED_TABLES:
+            return render()
+        # Feed tables page through one feed version, so viewers asking for
+        # the same page of it share a single query
+        version = load_feed(FEED_TABLES[table_id][0]).version
+        params = {
+            "filter_query": filter_query,
+            "sort_by": sort_by,
+            "page_current": page_current,
+            "page_size": page_size,
+        }
+        data, page_count = render_cache.get(
+            render_key(f"table:{table_id}", [version], params), render
+        )
+    except (requests.RequestException, DecodeError) as e:
+        print(f"Error loading {table_id} table: {e}")
+        return [], 1
+    return data, page_count
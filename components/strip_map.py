@@ -0,0 +1,162 @@
+import functools
+
+import dash
+import numpy as np
+from dash import html, dcc, Patch, no_update
+from dash.dependencies import Input, Output, State, MATCH
+
+from components.live_map import LIVE_MAP_INTERVAL_MS
+from components.route_maps import route_style, vehicle_label
+from utils.gtfs_api import VEHICLE_POSITIONS_URL, feed_version, get_vehicle_progress
+from utils.metrics import metrics
+from utils.route_geometry import route_geometry
+
+
+def _left(distance: float, length: float) -> dict:
+    return {"left": f"{100 * distance / length:.2f}%"}
+
+
+@functools.lru_cache(maxsize=256)
+def strip_base(route_id, geometry_version):
+    """Static part of a route's strips: (line, heading, stop marks) per direction.
+
+    Cached per route and geometry version, like ``route_base_figure``, so
+    requests only build the vehicle marks.
+    """
+    geometry = route_geometry()
+    lines = geometry.lines
+    _, color, _ = route_style(route_id)
+    descriptions = geometry.stops["description"]
+    strips = []
+    for direction_id in geometry.directions(route_id):
+        line = lines.line(route_id, direction_id)
+        if line < 0:
+            continue
+        length = lines.length[line] or 1.0
+        stop_marks = [
+            html.Div(
+                [
+                    html.Span(className="strip-stop", style={"borderColor": color}),
+                    html.Span(description, className="strip-stop-label"),
+                ],
+                className="strip-stop-mark",
+                style=_left(distance, length),
+            )
+            for description, distance in zip(
+                descriptions[lines.stop_rows[line]].tolist(),
+                lines.stop_distances[line].tolist(),
+            )
+        ]
+        terminal = descriptions[lines.stop_rows[line][-1]]
+        strips.append((line, f"Toward {terminal}", stop_marks))
+    return strips
+
+
+def vehicle_marks(route_id, line, vehicles, progress) -> list:
+    """Markers for the vehicles matched to ``line``, placed along it"""
+    geometry = route_geometry()
+    lines = geometry.lines
+    _, color, _ = route_style(route_id)
+    label = vehicle_label(route_id)
+    length = lines.length[line] or 1.0
+    rows = np.flatnonzero(progress["line"] == line)
+    on_line = vehicles.select(rows)
+    return [
+        html.Div(
+            "▶",
+            className="strip-vehicle",
+            title=f"{label} {vehicle_id}\nNext stop: {next_stop}\n"
+            f"Last seen: {timestamp}",
+            style={**_left(distance, length), "color": color},
+        )
+        for vehicle_id, distance, next_stop, timestamp in zip(
+            on_line.vehicle_id.tolist(),
+            progress["distance"][rows].tolist(),
+            geometry.stops["description"][progress["next_stop"][rows]].tolist(),
+            on_line.format_timestamps("%H:%M:%S"),
+        )
+    ]
+
+
+def strip_map_page(route_id):
+    """A route's directions drawn as straight lines, with vehicles on them.
+
+    Cheaper to draw than a tile map and easier to read for spacing: each
+    vehicle is placed by its distance along its direction's line, matched
+    once per feed version for every vehicle (``get_vehicle_progress``).
+    Only the vehicle marks are sent again when a new feed version arrives.
+    """
+    name, color, _ = route_style(route_id)
+    vehicles, progress = get_vehicle_progress()
+    base = strip_base(route_id, route_geometry().version)
+    if not base:
+        return html.Div(
+            [
+                html.H3(f"{name} Strip Map"),
+                html.P(f"There is no stop geometry for route {route_id}."),
+            ]
+        )
+    return html.Div(
+        [
+            html.H3(f"{name} Strip Map"),
+            dcc.Link("Map view", href=f"/route-map/{route_id}"),
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            html.H4(heading),
+                            html.Div(
+                                [
+                                    html.Div(
+                                        className="strip-line",
+                                        style={"backgroundColor": color},
+                                    ),
+                                    html.Div(stop_marks),
+                                    html.Div(
+                                        vehicle_marks(
+                                            route_id, line, vehicles, progress
+                                        )
+                                    ),
+                                ],
+                                className="strip",
+                            ),
+                        ]
+                    )
+                    for line, heading, stop_marks in base
+                ],
+                id={"type": "strip-map", "index": route_id},
+            ),
+            dcc.Interval(
+                id={"type": "strip-map-interval", "index": route_id},
+                interval=LIVE_MAP_INTERVAL_MS,
+            ),
+            dcc.Store(
+                id={"type": "strip-map-version", "index": route_id},
+                data=feed_version(VEHICLE_POSITIONS_URL),
+            ),
+        ]
+    )
+
+
+@dash.callback(
+    Output({"type": "strip-map", "index": MATCH}, "children"),
+    Output({"type": "strip-map-version", "index": MATCH}, "data"),
+    Input({"type": "strip-map-interval", "index": MATCH}, "n_intervals"),
+    State({"type": "strip-map-version", "index": MATCH}, "data"),
+    prevent_initial_call=True,
+)
+@metrics.timed("render", "strip-map")
+def refresh_strip_map(n_intervals, shown_version):
+    """Move the vehicles when a new vehicle positions version is available"""
+    version = feed_version(VEHICLE_POSITIONS_URL)
+    if version is None or version == shown_version:
+        return no_update, no_update
+    route_id = dash.ctx.outputs_list[0]["id"]["index"]
+    vehicles, progress = get_vehicle_progress()
+    patch = Patch()
+    base = strip_base(route_id, route_geometry().version)
+    for index, (line, _, _) in enumerate(base):
+        # strip index > its .strip div > the vehicle layer, its third child
+        layer = patch[index]["props"]["children"][1]["props"]["children"][2]
+        layer["props"]["children"] = vehicle_marks(route_id, line, vehicles, progress)
+    return patch, version
@@ -1,56 +1,76 @@
+import argparse
 import json
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
-from google.transit import gtfs_realtime_pb2
 from google.protobuf.message import DecodeError
 import requests
 
-
-def extract_service_alerts():
+from utils import http_client
+from utils.archive import ARCHIVE_ROOT, SCHEMAS, ArchiveWriter
+from utils.feed_decode import (
+    decode_feed,
+    format_posix,
+    records_from_columns,
+    vehicle_columns,
+)
+from utils.gtfs_api import (
+    ALERTS_URL,
+    TRIP_UPDATES_URL,
+    VEHICLE_POSITIONS_URL,
+    parse_feed,
+    parse_service_alerts,
+    parse_trip_updates,
+    peek_header_timestamp,
+    request_feed,
+    trip_update_times,
+)
+
+# Seconds between collection cycles, and cycles buffered per archive write
+COLLECT_INTERVAL = 30
+COLLECT_BATCH = 10
+
+
+def fetch_feed(url):
+    """Download and parse a GTFS realtime feed"""
+    response = http_client.get(url, timeout=http_client.GTFS_REALTIME_TIMEOUT)
+    response.raise_for_status()
+    return decode_feed(response.content)
+
+
+def save_records(name, records, feed, archive=None):
+    """Save extracted records as a timestamped JSON file, or to ``archive``"""
+    if archive is not None:
+        feed_timestamp = feed.header.timestamp or int(datetime.now().timestamp())
+        if archive.write(feed_timestamp, records):
+            print(f"Successfully archived {len(records)} {name.replace('_', ' ')}")
+        else:
+            print(f"{name.replace('_', ' ').capitalize()} already archived")
+        return
+
+    # Create output directory if it doesn't exist
+    os.makedirs("data", exist_ok=True)
+
+    # Generate filename with timestamp
+    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"data/{name}_{current_time}.json"
+
+    # Save to JSON file
+    with open(filename, "w") as f:
+        json.dump(records, f, indent=2)
+
+    print(f"Successfully saved {len(records)} {name.replace('_', ' ')} to {filename}")
+
+
+def extract_service_alerts(archive=None):
     """Extract service alerts from GTFS feed and save to JSON"""
-    url = "https://svc.metrotransit.org/mtgtfs/alerts.pb"
-    alerts_data = []
-
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-
-        for entity in feed.entity:
-            alert = entity.alert
-            alert_data = {
-                "id": entity.id,
-                "header": alert.header_text.translation[0].text
-                if alert.header_text.translation
-                else "No header",
-                "description": alert.description_text.translation[0].text
-                if alert.description_text.translation
-                else "No description",
-                "effect": str(alert.effect) if alert.effect else "UNKNOWN_EFFECT",
-                "cause": str(alert.cause) if alert.cause else "UNKNOWN_CAUSE",
-                "affected_routes": [
-                    entity.route_id
-                    for entity in alert.informed_entity
-                    if entity.route_id
-                ],
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            }
-            alerts_data.append(alert_data)
-
-        # Create output directory if it doesn't exist
-        os.makedirs("data", exist_ok=True)
-
-        # Generate filename with timestamp
-        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"data/service_alerts_{current_time}.json"
-
-        # Save to JSON file
-        with open(filename, "w") as f:
-            json.dump(alerts_data, f, indent=2)
-
-        print(f"Successfully saved {len(alerts_data)} service alerts to {filename}")
+        feed = fetch_feed(ALERTS_URL)
+        alerts_data = parse_service_alerts(feed)
+        save_records("service_alerts", alerts_data, feed, archive)
         return alerts_data
 
     except requests.RequestException as e:
@@ -61,58 +81,16 @@ def extract_service_alerts():
         return []
 
 
-def extract_trip_updates():
+def extract_trip_updates(archive=None):
     """Extract trip updates from GTFS feed and save to JSON"""
-    url = "https://svc.metrotransit.org/mtgtfs/tripupdates.pb"
-    updates = []
-
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-
-        for entity in feed.entity:
-            if entity.HasField("trip_update"):
-                trip = entity.trip_update.trip
-                stop_time = None
-                if entity.trip_update.stop_time_update:
-                    stop_time = entity.trip_update.stop_time_update[0]
-
-                update = {
-                    "trip_id": trip.trip_id,
-                    "route_id": trip.route_id if trip.HasField("route_id") else "N/A",
-                    "schedule": trip.schedule_relationship
-                    if trip.HasField("schedule_relationship")
-                    else "SCHEDULED",
-                    "stop_id": stop_time.stop_id if stop_time else "N/A",
-                    "arrival": datetime.fromtimestamp(stop_time.arrival.time).strftime(
-                        "%I:%M %p"
-                    )
-                    if stop_time and stop_time.HasField("arrival")
-                    else "N/A",
-                    "departure": datetime.fromtimestamp(
-                        stop_time.departure.time
-                    ).strftime("%I:%M %p")
-                    if stop_time and stop_time.HasField("departure")
-                    else "N/A",
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                }
-                updates.append(update)
-
-        # Create output directory if it doesn't exist
-        os.makedirs("data", exist_ok=True)
-
-        # Generate filename with timestamp
-        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"data/trip_updates_{current_time}.json"
-
-        # Save to JSON file
-        with open(filename, "w") as f:
-            json.dump(updates, f, indent=2)
-
-        print(f"Successfully saved {len(updates)} trip updates to {filename}")
+        feed = fetch_feed(TRIP_UPDATES_URL)
+        # The archive keeps the feed's POSIX times, JSON the clock times
+        if archive is not None:
+            updates = trip_update_times(feed)
+        else:
+            updates = parse_trip_updates(feed)
+        save_records("trip_updates", updates, feed, archive)
         return updates
 
     except requests.RequestException as e:
@@ -123,93 +101,32 @@ def extract_trip_updates():
         return []
 
 
-def extract_vehicle_data():
-    """Extract all available fields from GTFS vehicle position feed and save to JSON"""
-    url = "https://svc.metrotransit.org/mtgtfs/vehiclepositions.pb"
-    vehicles = []
+def vehicle_records(feed, raw: bool = False):
+    """All available fields of each vehicle in a vehicle positions feed.
+
+    ``timestamp`` is a local-time string, or the feed's POSIX seconds if
+    ``raw`` (as archived).
+    """
+    columns = vehicle_columns(feed)
+    records = records_from_columns(columns)
+    if raw:
+        return records
+    # Vehicles report in bursts, so most timestamps are shared
+    for record, timestamp in zip(records, format_posix(columns["timestamp"])):
+        record["timestamp"] = timestamp
+    return records
+
 
+def vehicle_archive_records(feed):
+    return vehicle_records(feed, raw=True)
+
+
+def extract_vehicle_data(archive=None):
+    """Extract all available fields from GTFS vehicle position feed and save to JSON"""
     try:
-        # Fetch the protobuf data
-        response = requests.get(url)
-        response.raise_for_status()
-
-        # Parse the protobuf message
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-
-        # Process each vehicle position
-        for entity in feed.entity:
-            vehicle = entity.vehicle
-            timestamp = datetime.fromtimestamp(vehicle.timestamp)
-
-            # Create comprehensive vehicle dictionary with all available fields
-            vehicle_data = {
-                # Basic vehicle information
-                "vehicle_id": vehicle.vehicle.id,
-                "label": vehicle.vehicle.label
-                if vehicle.vehicle.HasField("label")
-                else None,
-                "license_plate": vehicle.vehicle.license_plate
-                if vehicle.vehicle.HasField("license_plate")
-                else None,
-                # Trip information
-                "trip_id": vehicle.trip.trip_id,
-                "route_id": vehicle.trip.route_id,
-                "direction_id": vehicle.trip.direction_id
-                if vehicle.trip.HasField("direction_id")
-                else None,
-                "start_time": vehicle.trip.start_time
-                if vehicle.trip.HasField("start_time")
-                else None,
-                "start_date": vehicle.trip.start_date
-                if vehicle.trip.HasField("start_date")
-                else None,
-                "schedule_relationship": vehicle.trip.schedule_relationship
-                if vehicle.trip.HasField("schedule_relationship")
-                else None,
-                # Position information
-                "latitude": vehicle.position.latitude,
-                "longitude": vehicle.position.longitude,
-                "bearing": vehicle.position.bearing
-                if vehicle.position.HasField("bearing")
-                else None,
-                "odometer": vehicle.position.odometer
-                if vehicle.position.HasField("odometer")
-                else None,
-                "speed": vehicle.position.speed
-                if vehicle.position.HasField("speed")
-                else None,
-                # Current stop information
-                "current_stop_sequence": vehicle.current_stop_sequence
-                if vehicle.HasField("current_stop_sequence")
-                else None,
-                "stop_id": vehicle.stop_id if vehicle.HasField("stop_id") else None,
-                "current_status": vehicle.current_status
-                if vehicle.HasField("current_status")
-                else None,
-                # Additional information
-                "congestion_level": vehicle.congestion_level
-                if vehicle.HasField("congestion_level")
-                else None,
-                "occupancy_status": vehicle.occupancy_status
-                if vehicle.HasField("occupancy_status")
-                else None,
-                "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            }
-            vehicles.append(vehicle_data)
-
-        # Create output directory if it doesn't exist
-        os.makedirs("data", exist_ok=True)
-
-        # Generate filename with timestamp
-        current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"data/vehicle_positions_{current_time}.json"
-
-        # Save to JSON file
-        with open(filename, "w") as f:
-            json.dump(vehicles, f, indent=2)
-
-        print(f"Successfully saved {len(vehicles)} vehicle positions to {filename}")
+        feed = fetch_feed(VEHICLE_POSITIONS_URL)
+        vehicles = vehicle_records(feed, raw=archive is not None)
+        save_records("vehicle_positions", vehicles, feed, archive)
         return vehicles
 
     except requests.RequestException as e:
@@ -220,11 +137,166 @@ def extract_vehicle_data():
         return []
 
 
+# Archived feed -> (URL, builder of its archived rows, times as POSIX seconds)
+FEEDS = {
+    "vehicle_positions": (VEHICLE_POSITIONS_URL, vehicle_archive_records),
+    "trip_updates": (TRIP_UPDATES_URL, trip_update_times),
+    "service_alerts": (ALERTS_URL, parse_service_alerts),
+}
+
+
+class Collector:
+    """Fetches every feed on a fixed schedule and archives the snapshots that changed.
+
+    Feeds are requested concurrently and conditionally. A body whose header
+    timestamp matches the last archived snapshot is dropped before parsing,
+    and new snapshots are buffered and written every ``batch`` cycles.
+    """
+
+    def __init__(
+        self,
+        interval: float = COLLECT_INTERVAL,
+        batch: int = COLLECT_BATCH,
+        root: str = ARCHIVE_ROOT,
+    ):
+        self.interval = interval
+        self.batch = max(1, batch)
+        self.archives = {name: ArchiveWriter(name, root) for name in FEEDS}
+        self.cycles = 0
+        self._latest = {}
+        self._executor = ThreadPoolExecutor(max_workers=len(FEEDS))
+
+    def collect_feed(self, name: str):
+        """Fetch one feed and queue it if it changed; returns (status, timings)"""
+        url, build = FEEDS[name]
+        latest = self._latest.get(name)
+        timings = {}
+
+        start = time.perf_counter()
+        response = request_feed(url, latest)
+        timings["fetch"] = time.perf_counter() - start
+        if response is None:
+            self._latest[name] = latest.refreshed()
+            return "not modified", timings
+        version = peek_header_timestamp(response.content)
+        if latest is not None and version is not None and version == latest.version:
+            self._latest[name] = latest.refreshed(response)
+            return "unchanged", timings
+
+        start = time.perf_counter()
+        snapshot = parse_feed(url, response)
+        records = build(snapshot.feed)
+        timings["parse"] = time.perf_counter() - start
+
+        self._latest[name] = snapshot
+        feed_timestamp = snapshot.version or int(time.time())
+        if not self.archives[name].append(feed_timestamp, records):
+            return "already archived", timings
+        return f"{len(records)} rows", timings
+
+    def flush(self):
+        """Write every buffered snapshot; returns (parts written, seconds taken)"""
+        start = time.perf_counter()
+        parts = [path for archive in self.archives.values() for path in archive.flush()]
+        return len(parts), time.perf_counter() - start
+
+    def run_cycle(self) -> dict:
+        """Collect all feeds once, writing the archive when a batch is complete"""
+        futures = {
+            name: self._executor.submit(self.collect_feed, name) for name in FEEDS
+        }
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except requests.RequestException as e:
+                results[name] = (f"error: {e}", {})
+            except DecodeError as e:
+                results[name] = (f"decode error: {e}", {})
+        self.cycles += 1
+
+        report = [
+            f"{name} {status}"
+            + "".join(
+                f" {stage} {seconds * 1000:.0f}ms"
+                for stage, seconds in timings.items()
+            )
+            for name, (status, timings) in results.items()
+        ]
+        if self.cycles % self.batch == 0:
+            parts, seconds = self.flush()
+            report.append(f"wrote {parts} parts {seconds * 1000:.0f}ms")
+        print(f"cycle {self.cycles}: " + " | ".join(report))
+        return results
+
+    def run(self, cycles: int = None):
+        """Collect until interrupted or stopped (or for ``cycles`` cycles), then flush.
+
+        SIGTERM, as sent by systemd or ``docker stop``, is treated like
+        Ctrl-C so the buffered snapshots are written before exiting.
+        """
+        previous = None
+        if threading.current_thread() is threading.main_thread():
+            previous = signal.signal(signal.SIGTERM, _interrupt)
+        next_run = time.monotonic()
+        try:
+            while cycles is None or self.cycles < cycles:
+                self.run_cycle()
+                # Keep a fixed cadence, skipping slots a slow cycle overran
+                next_run += self.interval
+                now = time.monotonic()
+                if next_run < now:
+                    next_run = now
+                time.sleep(next_run - now)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            parts, seconds = self.flush()
+            print(f"wrote {parts} parts {seconds * 1000:.0f}ms")
+            self._executor.shutdown()
+            if previous is not None:
+                signal.signal(signal.SIGTERM, previous)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extract Metro Transit GTFS realtime data"
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="write timestamped JSON files to data/ instead of the archive",
+    )
+    parser.add_argument(
+        "--collect",
+        action="store_true",
+        help="keep collecting on a schedule until interrupted",
+    )
+    parser.add_argument("--interval", type=float, default=COLLECT_INTERVAL)
+    parser.add_argument("--batch", type=int, default=COLLECT_BATCH)
+    parser.add_argument("--cycles", type=int, default=None)
+    parser.add_argument("--archive-dir", default=ARCHIVE_ROOT)
+    args = parser.parse_args()
+
+    if args.collect:
+        if args.json:
+            parser.error("--collect always writes to the archive")
+        Collector(args.interval, args.batch, args.archive_dir).run(args.cycles)
+        raise SystemExit(0)
+
+    if args.json:
+        archives = {}
+    else:
+        archives = {feed: ArchiveWriter(feed, args.archive_dir) for feed in SCHEMAS}
+
     # Extract data from all three endpoints
-    vehicle_data = extract_vehicle_data()
-    service_alerts = extract_service_alerts()
-    trip_updates = extract_trip_updates()
+    vehicle_data = extract_vehicle_data(archives.get("vehicle_positions"))
+    service_alerts = extract_service_alerts(archives.get("service_alerts"))
+    trip_updates = extract_trip_updates(archives.get("trip_updates"))
 
     print("\nData extraction complete!")
     print(f"Extracted {len(vehicle_data)} vehicle positions")
@@ -1,36 +1,87 @@
+import asyncio
 import sys
 import json
-from utils.nextrip_api import MetroTransitAPI
 
+from utils.nextrip_api import AsyncMetroTransitAPI
+from utils.route_geometry import ROUTE_GEOMETRY_PATH, write_route_geometry
 
-def get_all_stops_with_location(route_id):
-    api = MetroTransitAPI()
+
+async def fetch_stops_with_location(route_id, api):
+    """Stops of every direction of a route, one request level at a time.
+
+    All directions' stop lists are requested together, then the details of
+    every stop at once, so a route costs about three round trips.
+    """
+    directions = await api.get_directions(route_id)
+    direction_ids = [direction.get("direction_id") for direction in directions]
+    stop_lists = await asyncio.gather(
+        *(api.get_stops(route_id, direction_id) for direction_id in direction_ids)
+    )
+    stops = [
+        (route_id, direction_id, stop.get("place_code"))
+        for direction_id, direction_stops in zip(direction_ids, stop_lists)
+        for stop in direction_stops
+    ]
+    details = await api.get_many_stop_details(stops)
+
+    stops_info = []
+    for (route_id, direction_id, place_code), stop_details in zip(stops, details):
+        if stop_details:
+            stop_info = {
+                "route_id": route_id,
+                "direction_id": direction_id,
+                "place_code": place_code,
+                "description": stop_details.get("description", place_code),
+                "latitude": stop_details.get("latitude"),
+                "longitude": stop_details.get("longitude"),
+                "stop_id": stop_details.get("stop_id"),
+            }
+            stops_info.append(stop_info)
+    return stops_info
+
+
+async def fetch_stops_for_all_routes(api):
+    """Stops with locations for every route, sharing one concurrency limit"""
+    route_ids = [route["route_id"] for route in await api.get_routes()]
+    results = await asyncio.gather(
+        *(fetch_stops_with_location(route_id, api) for route_id in route_ids),
+        return_exceptions=True,
+    )
     stops_info = []
-    directions = api.get_directions(route_id)
-    for direction in directions:
-        direction_id = direction.get("direction_id")
-        stops = api.get_stops(route_id, direction_id)
-        for stop in stops:
-            place_code = stop.get("place_code")
-            stop_details = api.get_stop_details(route_id, direction_id, place_code)
-            if stop_details:
-                stop_info = {
-                    "route_id": route_id,
-                    "direction_id": direction_id,
-                    "place_code": place_code,
-                    "description": stop_details.get("description", place_code),
-                    "latitude": stop_details.get("latitude"),
-                    "longitude": stop_details.get("longitude"),
-                    "stop_id": stop_details.get("stop_id"),
-                }
-                stops_info.append(stop_info)
+    for route_id, result in zip(route_ids, results):
+        if isinstance(result, Exception):
+            print(f"Error fetching stops for route {route_id}: {result}")
+        else:
+            stops_info.extend(result)
     return stops_info
 
 
+async def _with_client(fetch, *args):
+    async with AsyncMetroTransitAPI() as api:
+        return await fetch(*args, api)
+
+
+def get_all_stops_with_location(route_id):
+    return asyncio.run(_with_client(fetch_stops_with_location, route_id))
+
+
+def get_stops_for_all_routes():
+    """Stops with locations for every route"""
+    return asyncio.run(_with_client(fetch_stops_for_all_routes))
+
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python extract_route_stops.py <route_id> [output_file.json]")
+        print(f"       python extract_route_stops.py --all [{ROUTE_GEOMETRY_PATH}]")
         sys.exit(1)
+    if sys.argv[1] == "--all":
+        output_file = sys.argv[2] if len(sys.argv) > 2 else ROUTE_GEOMETRY_PATH
+        stops = get_stops_for_all_routes()
+        write_route_geometry(stops, output_file)
+        routes = len({stop["route_id"] for stop in stops})
+        print(f"Wrote {len(stops)} stops for {routes} routes to {output_file}")
+        sys.exit(0)
     route_id = sys.argv[1]
     stops = get_all_stops_with_location(route_id)
     output = json.dumps(stops, indent=2)
@@ -0,0 +1,33 @@
+# Gunicorn settings: `gunicorn` in the project directory picks this file up.
+import os
+
+wsgi_app = "app:server"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8050")
+workers = int(os.environ.get("WEB_CONCURRENCY", "4"))
+# Live maps hold a server-sent event stream open, which occupies a thread for
+# as long as the page is open; threaded workers keep serving pages meanwhile.
+# Streams per worker are capped by STREAM_MAX_CLIENTS (default 24).
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+
+# Import the app (dash, plotly, numpy, route geometry, warmed-up figures) once
+# in the master; forked workers share those pages copy-on-write and serve
+# their first request without importing or building anything
+preload_app = True
+
+
+def when_ready(server):
+    # Importing the app started a feed poller in the master. Stop it before
+    # any worker is forked, keeping the snapshots it already published so
+    # workers start with hot feeds.
+    from utils.feed_poller import poller
+
+    poller.stop(withdraw=False)
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork; each worker polls the feeds itself
+    from utils.feed_poller import poller
+
+    if os.environ.get("FEED_POLLER", "1") != "0":
+        poller.ensure_running()
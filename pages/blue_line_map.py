@@ -0,0 +1,15 @@
+import dash
+
+from components.route_maps import route_map_page
+from utils.gtfs_api import VEHICLE_POSITIONS_URL
+
+dash.register_page(
+    __name__,
+    path="/blue-line-map",
+    title="Blue Line Map",
+    render_cache=[VEHICLE_POSITIONS_URL],
+)
+
+
+def layout(**kwargs):
+    return route_map_page("901")
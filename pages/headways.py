@@ -0,0 +1,98 @@
+import time
+
+import dash
+from dash import html, dash_table
+
+from utils.gtfs_api import VEHICLE_POSITIONS_URL, get_vehicle_snapshot
+from utils.headways import (
+    BUNCHING_DISTANCE_M,
+    BUNCHING_RATIO,
+    bunched_pairs,
+    route_summary,
+)
+from utils.trajectories import trajectories
+
+dash.register_page(
+    __name__,
+    path="/headways",
+    title="Headways",
+    render_cache=[VEHICLE_POSITIONS_URL],
+)
+
+TABLE_STYLE = {
+    "style_header": {
+        "backgroundColor": "#0055A5",
+        "color": "white",
+        "fontWeight": "bold",
+    },
+    "style_cell": {
+        "textAlign": "left",
+        "padding": "10px",
+        "whiteSpace": "normal",
+        "height": "auto",
+    },
+    "style_data_conditional": [
+        {"if": {"row_index": "odd"}, "backgroundColor": "#f4f4f4"}
+    ],
+}
+
+
+def layout(**kwargs):
+    vehicles = get_vehicle_snapshot()
+    # The poller feeds the store; this covers running without it
+    trajectories.ingest(vehicles)
+    stats = trajectories.stats()
+    since = (
+        time.strftime("%H:%M", time.localtime(stats["since"]))
+        if stats["since"]
+        else "now"
+    )
+
+    return html.Div(
+        [
+            html.H3("Headways"),
+            html.P(
+                f"{stats['vehicles']} vehicles tracked since {since}. Headways are "
+                "the times between vehicles reaching each stop; those under "
+                f"{BUNCHING_RATIO:.0%} of the route's median count as bunched. "
+                "Regularity is the headways' coefficient of variation (0 is "
+                "perfectly even)."
+            ),
+            dash_table.DataTable(
+                id="headway-table",
+                columns=[
+                    {"name": "Route", "id": "route_id"},
+                    {"name": "Direction", "id": "direction_id", "type": "numeric"},
+                    {"name": "Vehicles", "id": "vehicles", "type": "numeric"},
+                    {"name": "Speed (km/h)", "id": "speed", "type": "numeric"},
+                    {"name": "Headway (min)", "id": "headway", "type": "numeric"},
+                    {"name": "Regularity", "id": "regularity", "type": "numeric"},
+                    {"name": "Headways", "id": "headways", "type": "numeric"},
+                    {"name": "Bunched (%)", "id": "bunched", "type": "numeric"},
+                    {"name": "Bunched Now", "id": "bunched_now", "type": "numeric"},
+                ],
+                data=route_summary(trajectories, vehicles),
+                sort_action="native",
+                filter_action="native",
+                page_size=25,
+                **TABLE_STYLE,
+            ),
+            html.H4("Bunched Now"),
+            html.P(
+                "Vehicles on the same route and direction within "
+                f"{BUNCHING_DISTANCE_M:.0f} m of each other."
+            ),
+            dash_table.DataTable(
+                id="bunching-table",
+                columns=[
+                    {"name": "Route", "id": "route_id"},
+                    {"name": "Direction", "id": "direction_id", "type": "numeric"},
+                    {"name": "Vehicles", "id": "vehicles"},
+                    {"name": "Distance (m)", "id": "distance", "type": "numeric"},
+                ],
+                data=bunched_pairs(vehicles),
+                page_size=10,
+                **TABLE_STYLE,
+            ),
+        ]
+    )
@@ -0,0 +1,51 @@
+import dash
+from dash import html
+
+from utils.gtfs_api import feed_summary
+
+dash.register_page(__name__, path="/", title="Metro Transit Dashboard")
+
+
+def _count(summary, name):
+    # Feeds not loaded yet (e.g. right after startup) have no count
+    count = summary[name]["count"]
+    return "—" if count is None else str(count)
+
+
+def layout(**kwargs):
+    # Counts come from feeds already in memory; this page never fetches
+    summary = feed_summary()
+
+    return html.Div(
+        [
+            html.H3("Welcome to the Metro Transit Dashboard!"),
+            html.P("Select a page from the navigation menu."),
+            html.Div(
+                [
+                    html.H4("System Status"),
+                    html.P(
+                        [
+                            "There are currently ",
+                            html.Strong(_count(summary, "alerts")),
+                            " active service alerts. ",
+                            html.A("View details", href="/service-alerts"),
+                        ]
+                    ),
+                    html.P(
+                        [
+                            html.Strong(_count(summary, "vehicles")),
+                            " vehicles are reporting positions and ",
+                            html.Strong(_count(summary, "trips")),
+                            " trips have predictions.",
+                        ]
+                    ),
+                ],
+                style={
+                    "marginTop": "20px",
+                    "padding": "15px",
+                    "backgroundColor": "#f8f9fa",
+                    "borderRadius": "5px",
+                },
+            ),
+        ]
+    )
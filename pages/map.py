@@ -0,0 +1,24 @@
+import dash
+from dash import html
+
+from components.live_map import live_map
+from components.route_maps import vehicle_map_figure
+from utils.gtfs_api import VEHICLE_POSITIONS_URL, get_vehicle_snapshot
+
+dash.register_page(
+    __name__, path="/map", title="Map View", render_cache=[VEHICLE_POSITIONS_URL]
+)
+
+
+def layout(**kwargs):
+    vehicles = get_vehicle_snapshot()
+    if len(vehicles):
+        fig = vehicle_map_figure(vehicles)
+        return html.Div([html.H3("Map View"), live_map("all", fig, viewport=True)])
+    else:
+        return html.Div(
+            [
+                html.H3("Map View"),
+                html.P("Could not load vehicle data for the map."),
+            ]
+        )
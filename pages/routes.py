@@ -0,0 +1,37 @@
+import dash
+from dash import html, dash_table
+
+from components.server_table import SERVER_SIDE_TABLE
+
+dash.register_page(__name__, path="/routes", title="Routes")
+
+
+def layout(**kwargs):
+    return html.Div(
+        [
+            html.H3("Routes"),
+            dash_table.DataTable(
+                id={"type": "server-table", "index": "routes"},
+                columns=[
+                    {"name": "Route", "id": "route_label"},
+                    {"name": "Route ID", "id": "route_id"},
+                    {"name": "Agency", "id": "agency_id", "type": "numeric"},
+                ],
+                style_header={
+                    "backgroundColor": "#0055A5",
+                    "color": "white",
+                    "fontWeight": "bold",
+                },
+                style_cell={
+                    "textAlign": "left",
+                    "padding": "10px",
+                    "whiteSpace": "normal",
+                    "height": "auto",
+                },
+                style_data_conditional=[
+                    {"if": {"row_index": "odd"}, "backgroundColor": "#f4f4f4"}
+                ],
+                **SERVER_SIDE_TABLE,
+            ),
+        ]
+    )
@@ -0,0 +1,52 @@
+import dash
+from dash import html, dash_table
+
+from components.server_table import SERVER_SIDE_TABLE
+
+dash.register_page(__name__, path="/service-alerts", title="Service Alerts")
+
+
+def layout(**kwargs):
+    return html.Div(
+        [
+            html.H3("Service Alerts"),
+            dash_table.DataTable(
+                id={"type": "server-table", "index": "service-alerts"},
+                columns=[
+                    {"name": "ID", "id": "id"},
+                    {"name": "Header", "id": "header"},
+                    {"name": "Description", "id": "description"},
+                    {"name": "Effect", "id": "effect"},
+                    {"name": "Cause", "id": "cause"},
+                    {"name": "Affected Routes", "id": "affected_routes"},
+                    {"name": "First Seen", "id": "first_seen"},
+                    {"name": "Last Seen", "id": "last_seen"},
+                ],
+                style_header={
+                    "backgroundColor": "#0055A5",
+                    "color": "white",
+                    "fontWeight": "bold",
+                },
+                style_cell={
+                    "textAlign": "left",
+                    "padding": "10px",
+                    "whiteSpace": "normal",
+                    "height": "auto",
+                    "minWidth": "100px",
+                    "maxWidth": "400px",
+                },
+                style_cell_conditional=[
+                    {"if": {"column_id": "description"}, "maxWidth": "400px"},
+                    {"if": {"column_id": "header"}, "maxWidth": "300px"},
+                    {"if": {"column_id": "effect"}, "maxWidth": "100px"},
+                    {"if": {"column_id": "cause"}, "maxWidth": "100px"},
+                    {"if": {"column_id": "id"}, "maxWidth": "100px"},
+                ],
+                style_data_conditional=[
+                    {"if": {"row_index": "odd"}, "backgroundColor": "#f4f4f4"}
+                ],
+                # Alerts have long descriptions, so show fewer per page
+                **{**SERVER_SIDE_TABLE, "page_size": 10},
+            ),
+        ]
+    )
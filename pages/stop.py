@@ -0,0 +1,71 @@
+import os
+
+import dash
+from dash import html, dcc, dash_table
+from dash.dependencies import Input, Output, MATCH
+
+from utils.departures import stop_departures
+from utils.metrics import metrics
+
+dash.register_page(__name__, path_template="/stop/<stop_id>", title="Departures")
+
+# How often departure boards refresh; NexTrip answers are shared between boards
+STOP_BOARD_INTERVAL_MS = int(os.environ.get("STOP_BOARD_INTERVAL_MS", "30000"))
+
+DEPARTURE_SOURCES = {
+    "nextrip": "Live departures from NexTrip.",
+    "trip-updates": "NexTrip is not responding; showing GTFS realtime predictions.",
+}
+
+
+def stop_board_content(stop_id):
+    """Heading, source note and departures table rows for one stop"""
+    rows, description, source = stop_departures(stop_id)
+    title = f"{description} ({stop_id})" if description else f"Stop {stop_id}"
+    note = DEPARTURE_SOURCES[source]
+    if not rows:
+        note += " No upcoming departures."
+    return f"{title} Departures", note, rows
+
+
+def stop_board_page(stop_id):
+    """Departure board for one stop, refreshed on an interval"""
+    title, note, rows = stop_board_content(stop_id)
+    return html.Div(
+        [
+            html.H3(title, id={"type": "stop-board-title", "index": stop_id}),
+            html.P(note, id={"type": "stop-board-note", "index": stop_id}),
+            dash_table.DataTable(
+                id={"type": "stop-board", "index": stop_id},
+                columns=[
+                    {"name": "Route", "id": "route"},
+                    {"name": "Destination", "id": "destination"},
+                    {"name": "Direction", "id": "direction"},
+                    {"name": "Departs", "id": "departure"},
+                    {"name": "Real-time", "id": "realtime"},
+                ],
+                data=rows,
+            ),
+            dcc.Interval(
+                id={"type": "stop-board-interval", "index": stop_id},
+                interval=STOP_BOARD_INTERVAL_MS,
+            ),
+        ]
+    )
+
+
+@dash.callback(
+    Output({"type": "stop-board-title", "index": MATCH}, "children"),
+    Output({"type": "stop-board-note", "index": MATCH}, "children"),
+    Output({"type": "stop-board", "index": MATCH}, "data"),
+    Input({"type": "stop-board-interval", "index": MATCH}, "n_intervals"),
+    prevent_initial_call=True,
+)
+@metrics.timed("render", "stop-board")
+def refresh_stop_board(n_intervals):
+    stop_id = dash.ctx.outputs_list[0]["id"]["index"]
+    return stop_board_content(stop_id)
+
+
+def layout(stop_id=None, **kwargs):
+    return stop_board_page(stop_id)
@@ -0,0 +1,15 @@
+import dash
+
+from components.strip_map import strip_map_page
+from utils.gtfs_api import VEHICLE_POSITIONS_URL
+
+dash.register_page(
+    __name__,
+    path_template="/strip-map/<route_id>",
+    title="Strip Map",
+    render_cache=[VEHICLE_POSITIONS_URL],
+)
+
+
+def layout(route_id=None, **kwargs):
+    return strip_map_page(route_id)
@@ -0,0 +1,40 @@
+import dash
+from dash import html, dash_table
+
+from components.server_table import SERVER_SIDE_TABLE
+
+dash.register_page(__name__, path="/trip-updates", title="Trip Updates")
+
+
+def layout(**kwargs):
+    return html.Div(
+        [
+            html.H3("Trip Updates"),
+            dash_table.DataTable(
+                id={"type": "server-table", "index": "trip-updates"},
+                columns=[
+                    {"name": "Trip ID", "id": "trip_id"},
+                    {"name": "Route", "id": "route_id"},
+                    {"name": "Schedule", "id": "schedule"},
+                    {"name": "Stop", "id": "stop_id"},
+                    {"name": "Arrival", "id": "arrival"},
+                    {"name": "Departure", "id": "departure"},
+                ],
+                style_header={
+                    "backgroundColor": "#0055A5",
+                    "color": "white",
+                    "fontWeight": "bold",
+                },
+                style_cell={
+                    "textAlign": "left",
+                    "padding": "10px",
+                    "whiteSpace": "normal",
+                    "height": "auto",
+                },
+                style_data_conditional=[
+                    {"if": {"row_index": "odd"}, "backgroundColor": "#f4f4f4"}
+                ],
+                **SERVER_SIDE_TABLE,
+            ),
+        ]
+    )
@@ -0,0 +1,50 @@
+import dash
+from dash import html, dash_table
+
+from components.server_table import SERVER_SIDE_TABLE
+
+dash.register_page(__name__, path="/vehicle-positions", title="Vehicle Positions")
+
+
+def layout(**kwargs):
+    return html.Div(
+        [
+            html.H3("Vehicle Positions"),
+            dash_table.DataTable(
+                id={"type": "server-table", "index": "vehicle-positions"},
+                columns=[
+                    {"name": "Vehicle ID", "id": "vehicle_id"},
+                    {"name": "Route", "id": "route_id"},
+                    {
+                        "name": "Latitude",
+                        "id": "latitude",
+                        "type": "numeric",
+                        "format": {"specifier": ".6f"},
+                    },
+                    {
+                        "name": "Longitude",
+                        "id": "longitude",
+                        "type": "numeric",
+                        "format": {"specifier": ".6f"},
+                    },
+                    {"name": "Speed", "id": "speed"},
+                    {"name": "Last Updated", "id": "timestamp"},
+                ],
+                style_header={
+                    "backgroundColor": "#0055A5",
+                    "color": "white",
+                    "fontWeight": "bold",
+                },
+                style_cell={
+                    "textAlign": "left",
+                    "padding": "10px",
+                    "whiteSpace": "normal",
+                    "height": "auto",
+                },
+                style_data_conditional=[
+                    {"if": {"row_index": "odd"}, "backgroundColor": "#f4f4f4"}
+                ],
+                **SERVER_SIDE_TABLE,
+            ),
+        ]
+    )
@@ -0,0 +1,424 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.transit import gtfs_realtime_pb2
+
+from utils.route_geometry import LEGACY_STOPS_PATTERN, ROUTE_GEOMETRY_PATH, RouteGeometry
+
+# Feed file served by the stand-in -> prefix of the JSON recordings it can be rebuilt from
+FEED_RECORDINGS = {
+    "alerts.pb": "service_alerts",
+    "tripupdates.pb": "trip_updates",
+    "vehiclepositions.pb": "vehicle_positions",
+}
+# NexTrip responses recorded with --record-nextrip, as data/nextrip/<path>.json
+NEXTRIP_RECORDINGS = "nextrip"
+NEXTRIP_UPSTREAM = "https://svc.metrotransit.org/nextrip"
+DIRECTION_NAMES = {0: "Northbound", 1: "Southbound"}
+
+
+def _parse_recorded_time(value):
+    return int(datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timestamp())
+
+
+def _new_feed(header_timestamp):
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = header_timestamp
+    return feed
+
+
+def build_vehicle_positions_feed(records, header_timestamp):
+    """Rebuild a vehicle positions feed from extract_vehicle_data() records"""
+    feed = _new_feed(header_timestamp)
+    for record in records:
+        entity = feed.entity.add()
+        entity.id = record["vehicle_id"]
+        vehicle = entity.vehicle
+        vehicle.vehicle.id = record["vehicle_id"]
+        for key in ("label", "license_plate"):
+            if record.get(key) is not None:
+                setattr(vehicle.vehicle, key, record[key])
+        vehicle.trip.trip_id = record["trip_id"]
+        vehicle.trip.route_id = record["route_id"]
+        for key in ("direction_id", "start_time", "start_date", "schedule_relationship"):
+            if record.get(key) is not None:
+                setattr(vehicle.trip, key, record[key])
+        vehicle.position.latitude = record["latitude"]
+        vehicle.position.longitude = record["longitude"]
+        for key in ("bearing", "odometer", "speed"):
+            if record.get(key) is not None:
+                setattr(vehicle.position, key, record[key])
+        for key in (
+            "current_stop_sequence",
+            "stop_id",
+            "current_status",
+            "congestion_level",
+            "occupancy_status",
+        ):
+            if record.get(key) is not None:
+                setattr(vehicle, key, record[key])
+        vehicle.timestamp = _parse_recorded_time(record["timestamp"])
+    return feed
+
+
+def build_alerts_feed(records, header_timestamp):
+    """Rebuild a service alerts feed from extract_service_alerts() records"""
+    feed = _new_feed(header_timestamp)
+    for record in records:
+        entity = feed.entity.add()
+        entity.id = record["id"]
+        alert = entity.alert
+        alert.header_text.translation.add(text=record["header"], language="en")
+        alert.description_text.translation.add(
+            text=record["description"], language="en"
+        )
+        if str(record.get("effect", "")).isdigit():
+            alert.effect = int(record["effect"])
+        if str(record.get("cause", "")).isdigit():
+            alert.cause = int(record["cause"])
+        for route_id in record.get("affected_routes", []):
+            alert.informed_entity.add(route_id=route_id)
+    return feed
+
+
+def build_trip_updates_feed(records, header_timestamp):
+    """Rebuild a trip updates feed from extract_trip_updates() records.
+
+    The recordings only keep the first stop and clock times, so arrival and
+    departure are placed on the day of the header timestamp.
+    """
+    feed = _new_feed(header_timestamp)
+    day = datetime.fromtimestamp(header_timestamp).date()
+    for record in records:
+        entity = feed.entity.add()
+        entity.id = record["trip_id"]
+        trip_update = entity.trip_update
+        trip_update.trip.trip_id = record["trip_id"]
+        if record.get("route_id") not in (None, "N/A"):
+            trip_update.trip.route_id = record["route_id"]
+        if isinstance(record.get("schedule"), int):
+            trip_update.trip.schedule_relationship = record["schedule"]
+        if record.get("stop_id") in (None, "N/A"):
+            continue
+        stop_time = trip_update.stop_time_update.add(stop_id=record["stop_id"])
+        for key in ("arrival", "departure"):
+            if record.get(key) not in (None, "N/A"):
+                clock = datetime.strptime(record[key], "%I:%M %p").time()
+                getattr(stop_time, key).time = int(
+                    datetime.combine(day, clock).timestamp()
+                )
+    return feed
+
+
+FEED_BUILDERS = {
+    "alerts.pb": build_alerts_feed,
+    "tripupdates.pb": build_trip_updates_feed,
+    "vehiclepositions.pb": build_vehicle_positions_feed,
+}
+
+
+def load_feed_fixtures(data_dir="data"):
+    """Return {feed file name: protobuf bytes} for every feed found in ``data_dir``.
+
+    A recorded ``<name>.pb`` is served as-is; otherwise the feed is rebuilt
+    from the most recent JSON recording written by extract_gtfs_data.py.
+    """
+    fixtures = {}
+    for name, prefix in FEED_RECORDINGS.items():
+        pb_path = os.path.join(data_dir, name)
+        if os.path.exists(pb_path):
+            with open(pb_path, "rb") as f:
+                fixtures[name] = f.read()
+            continue
+        recordings = sorted(glob.glob(os.path.join(data_dir, f"{prefix}_*.json")))
+        if not recordings:
+            continue
+        stamp = os.path.basename(recordings[-1])[len(prefix) + 1 : -len(".json")]
+        header_timestamp = int(datetime.strptime(stamp, "%Y%m%d_%H%M%S").timestamp())
+        with open(recordings[-1], "r", encoding="utf-8") as f:
+            records = json.load(f)
+        feed = FEED_BUILDERS[name](records, header_timestamp)
+        fixtures[name] = feed.SerializeToString()
+    return fixtures
+
+
+def _route_sort_key(route_id):
+    return (0, int(route_id), "") if route_id.isdigit() else (1, 0, route_id)
+
+
+def _departure_text(departure_time, now):
+    minutes = (departure_time - now) // 60
+    if minutes < 1:
+        return "Due"
+    if minutes <= 20:
+        return f"{minutes} Min"
+    return datetime.fromtimestamp(departure_time).strftime("%I:%M %p").lstrip("0")
+
+
+def build_nextrip_fixtures(fixtures: dict, geometry: RouteGeometry) -> dict:
+    """NexTrip responses consistent with the feed fixtures and route geometry.
+
+    Keys are paths below ``/nextrip/`` and values are JSON bodies. Routes
+    are those seen in the feeds or the geometry; directions, stops and stop
+    details come from the geometry, and departures for every stop in the
+    trip updates feed are listed as of the feed's header timestamp.
+    """
+    feeds = {
+        name: gtfs_realtime_pb2.FeedMessage.FromString(body)
+        for name, body in fixtures.items()
+    }
+    vehicles = feeds.get("vehiclepositions.pb", gtfs_realtime_pb2.FeedMessage())
+    trip_updates = feeds.get("tripupdates.pb", gtfs_realtime_pb2.FeedMessage())
+
+    route_ids = set(geometry.routes())
+    route_ids.update(e.vehicle.trip.route_id for e in vehicles.entity)
+    route_ids.update(e.trip_update.trip.route_id for e in trip_updates.entity)
+    route_ids = sorted(filter(None, route_ids), key=_route_sort_key)
+
+    responses = {
+        "agencies": [{"agency_id": 0, "agency_name": "Metro Transit"}],
+        "routes": [
+            {"route_id": route_id, "agency_id": 0, "route_label": route_id}
+            for route_id in route_ids
+        ],
+    }
+    stop_names = {}
+    for route_id in route_ids:
+        directions = geometry.directions(route_id) or [0, 1]
+        responses[f"directions/{route_id}"] = [
+            {"direction_id": d, "direction_name": DIRECTION_NAMES.get(d, str(d))}
+            for d in directions
+        ]
+        for direction_id in directions:
+            stops = geometry.stops_for(route_id, direction_id).tolist()
+            responses[f"stops/{route_id}/{direction_id}"] = [
+                {"place_code": stop[3], "description": stop[4]} for stop in stops
+            ]
+            for stop in stops:
+                stop_names[str(stop[2])] = stop[4]
+                responses[f"{route_id}/{direction_id}/{stop[3]}"] = {
+                    "stops": [
+                        {
+                            "stop_id": stop[2],
+                            "latitude": stop[5],
+                            "longitude": stop[6],
+                            "description": stop[4],
+                        }
+                    ],
+                    "alerts": [],
+                    "departures": [],
+                }
+        responses[f"vehicles/{route_id}"] = [
+            {
+                "trip_id": e.vehicle.trip.trip_id,
+                "direction_id": e.vehicle.trip.direction_id,
+                "location_time": e.vehicle.timestamp,
+                "route_id": route_id,
+                "latitude": e.vehicle.position.latitude,
+                "longitude": e.vehicle.position.longitude,
+                "bearing": e.vehicle.position.bearing,
+                "speed": e.vehicle.position.speed,
+            }
+            for e in vehicles.entity
+            if e.vehicle.trip.route_id == route_id
+        ]
+
+    now = trip_updates.header.timestamp
+    departures = {}
+    for entity in trip_updates.entity:
+        trip = entity.trip_update.trip
+        for stop_time in entity.trip_update.stop_time_update:
+            departure_time = stop_time.departure.time or stop_time.arrival.time
+            if not departure_time:
+                continue
+            departures.setdefault(stop_time.stop_id, []).append(
+                {
+                    "actual": True,
+                    "trip_id": trip.trip_id,
+                    "stop_id": stop_time.stop_id,
+                    "departure_text": _departure_text(departure_time, now),
+                    "departure_time": departure_time,
+                    "description": "",
+                    "route_id": trip.route_id,
+                    "route_short_name": trip.route_id,
+                    "direction_id": trip.direction_id,
+                    "direction_text": "",
+                }
+            )
+    for stop_id, rows in departures.items():
+        rows.sort(key=lambda row: row["departure_time"])
+        responses[stop_id] = {
+            "stops": [{"stop_id": stop_id, "description": stop_names.get(stop_id, "")}],
+            "alerts": [],
+            "departures": rows,
+        }
+    return {path: json.dumps(body).encode() for path, body in responses.items()}
+
+
+def load_nextrip_fixtures(data_dir="data", fixtures: dict = None, assets_dir="assets"):
+    """Return {NexTrip path: JSON bytes} for the stand-in server.
+
+    Responses recorded under ``data_dir/nextrip`` are served as-is; every
+    other path is built from the feed fixtures and the route geometry in
+    ``assets_dir``.
+    """
+    if fixtures is None:
+        fixtures = load_feed_fixtures(data_dir)
+    geometry = RouteGeometry.load(
+        os.path.join(assets_dir, os.path.basename(ROUTE_GEOMETRY_PATH)),
+        os.path.join(assets_dir, os.path.basename(LEGACY_STOPS_PATTERN)),
+    )
+    responses = build_nextrip_fixtures(fixtures, geometry)
+    root = os.path.join(data_dir, NEXTRIP_RECORDINGS)
+    for path in glob.glob(os.path.join(root, "**", "*.json"), recursive=True):
+        name = os.path.relpath(path, root)[: -len(".json")].replace(os.sep, "/")
+        with open(path, "rb") as f:
+            responses[name] = f.read()
+    return responses
+
+
+def record_nextrip(paths, data_dir="data", base_url=NEXTRIP_UPSTREAM):
+    """Save upstream NexTrip responses for ``paths`` as stand-in fixtures"""
+    import requests
+
+    root = os.path.join(data_dir, NEXTRIP_RECORDINGS)
+    for path in paths:
+        response = requests.get(
+            f"{base_url}/{path}", headers={"Accept": "application/json"}, timeout=10
+        )
+        response.raise_for_status()
+        target = os.path.join(root, *path.split("/")) + ".json"
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(response.content)
+        print(f"Recorded {path}")
+
+
+class StandInServer:
+    """Local HTTP server answering like svc.metrotransit.org for recorded data.
+
+    ``routes`` maps request paths (e.g. ``/mtgtfs/alerts.pb``) to response
+    bodies and can be changed while the server runs to simulate new feed
+    versions. Responses carry an ETag and conditional requests for an
+    unchanged body get a 304; ``requests`` records (path, status) per request.
+    """
+
+    def __init__(self, routes: dict, host: str = "127.0.0.1", port: int = 0):
+        self.routes = dict(routes)
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = server.routes.get(self.path)
+                if body is None:
+                    server.requests.append((self.path, 404))
+                    self.send_error(404)
+                    return
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    server.requests.append((self.path, 304))
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                server.requests.append((self.path, 200))
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                content_type = (
+                    "application/json"
+                    if self.path.startswith("/nextrip")
+                    else "application/octet-stream"
+                )
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def gtfs_routes(fixtures: dict) -> dict:
+    """Request paths for feed fixtures, matching the upstream layout"""
+    return {f"/mtgtfs/{name}": body for name, body in fixtures.items()}
+
+
+def nextrip_routes(responses: dict) -> dict:
+    """Request paths for NexTrip fixtures, matching the upstream layout"""
+    return {f"/nextrip/{path}": body for path, body in responses.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve recorded GTFS realtime feeds for local testing"
+    )
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--record-nextrip",
+        nargs="*",
+        metavar="PATH",
+        help="save upstream NexTrip responses (default: routes, agencies and "
+        "the directions and stops of every route with geometry) and exit",
+    )
+    args = parser.parse_args()
+
+    fixtures = load_feed_fixtures(args.data_dir)
+    if args.record_nextrip is not None:
+        paths = args.record_nextrip or [
+            path
+            for path in load_nextrip_fixtures(args.data_dir, fixtures)
+            if path in ("routes", "agencies")
+            or path.startswith(("directions/", "stops/"))
+        ]
+        record_nextrip(paths, args.data_dir)
+        raise SystemExit(0)
+
+    nextrip = load_nextrip_fixtures(args.data_dir, fixtures)
+    server = StandInServer(
+        {**gtfs_routes(fixtures), **nextrip_routes(nextrip)},
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Serving {', '.join(sorted(fixtures))} at {server.base_url}/mtgtfs/")
+    print(f"and {len(nextrip)} NexTrip responses at {server.base_url}/nextrip/")
+    print(
+        f"Run the dashboard with GTFS_REALTIME_BASE_URL={server.base_url}/mtgtfs"
+        f" NEXTRIP_BASE_URL={server.base_url}/nextrip"
+    )
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
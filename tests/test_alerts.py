@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+from google.transit import gtfs_realtime_pb2
+
+from utils.alerts import AlertsStore
+
+T0 = 1_700_000_000
+
+
+def feed(version, alerts):
+    # alerts: {alert_id: (header, [route_id, ...])}
+    message = gtfs_realtime_pb2.FeedMessage()
+    message.header.gtfs_realtime_version = "2.0"
+    message.header.timestamp = version
+    for alert_id, (header, route_ids) in alerts.items():
+        entity = message.entity.add(id=alert_id)
+        entity.alert.header_text.translation.add(text=header)
+        for route_id in route_ids:
+            entity.alert.informed_entity.add(route_id=route_id)
+    return message
+
+
+def kinds(events):
+    return sorted((event["kind"], event["alert"].id) for event in events)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AlertsStore(path=str(tmp_path / "alerts.sqlite3"))
+
+
+def test_versions_report_added_changed_and_removed(store):
+    first = store.ingest(
+        feed(T0, {"a": ("Detour", ["5"]), "b": ("Elevator out", ["901"])})
+    )
+    assert kinds(first) == [("added", "a"), ("added", "b")]
+
+    second = store.ingest(
+        feed(T0 + 60, {"a": ("Detour extended", ["5"]), "c": ("Snow", ["21"])})
+    )
+    assert kinds(second) == [("added", "c"), ("changed", "a"), ("removed", "b")]
+    events = {event["alert"].id: event["alert"] for event in second}
+    assert events["a"].first_seen == T0 and events["a"].last_seen == T0 + 60
+    assert events["b"].last_seen == T0 and events["b"].ended == T0 + 60
+
+    assert sorted(record.id for record in store.active()) == ["a", "c"]
+    assert [record.id for record in store.for_route("5")] == ["a"]
+    version, replayed, complete = store.changes(since=T0)
+    assert version == T0 + 60 and complete
+    assert kinds(replayed) == kinds(second)
+
+
+def test_unchanged_and_repeated_versions(store):
+    alerts = {"a": ("Detour", ["5"])}
+    store.ingest(feed(T0, alerts))
+    assert store.ingest(feed(T0, alerts)) == []
+    assert store.ingest(feed(T0 + 60, alerts)) == []
+    assert store.stats() == {"version": T0 + 60, "active": 1}
+
+
+def test_other_workers_read_back_the_stored_events(store):
+    other = AlertsStore(path=store.path)
+    events = store.ingest(feed(T0, {"a": ("Detour", ["5"])}))
+    assert kinds(other.ingest(feed(T0, {"a": ("Detour", ["5"])}))) == kinds(events)
+
+
+def test_failed_version_is_ingested_again(store, monkeypatch):
+    apply = store._apply
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(store, "_apply", locked)
+    with pytest.raises(sqlite3.OperationalError):
+        store.ingest(feed(T0, {"a": ("Detour", ["5"])}))
+
+    monkeypatch.setattr(store, "_apply", apply)
+    events = store.ingest(feed(T0, {"a": ("Detour", ["5"])}))
+    assert kinds(events) == [("added", "a")]
+    assert store.active()[0].first_seen == T0
@@ -0,0 +1,44 @@
+import os
+
+from utils.archive import ArchiveWriter, scan
+
+T0 = 1_700_000_000
+
+
+def trips(stop_id, arrival):
+    return [
+        {
+            "trip_id": "t1",
+            "route_id": "5",
+            "stop_id": stop_id,
+            "arrival": arrival,
+            "departure": None,
+        }
+    ]
+
+
+def test_round_trip_keeps_posix_times(tmp_path):
+    root = str(tmp_path)
+    ArchiveWriter("trip_updates", root).write(T0, trips("A", T0 + 90))
+    rows = scan("trip_updates", root=root)
+    assert rows["feed_timestamp"].tolist() == [T0]
+    assert rows["stop_id"].tolist() == ["A"]
+    assert rows["arrival"].tolist() == [T0 + 90]
+    assert rows["departure"].tolist() == [-1]
+
+
+def test_restarted_writer_does_not_rewrite_the_last_part(tmp_path):
+    root = str(tmp_path)
+    (path,) = ArchiveWriter("trip_updates", root).write(T0, trips("A", T0 + 90))
+    written = os.path.getmtime(path)
+
+    # A new writer, as after a restart, sees the same feed version again
+    writer = ArchiveWriter("trip_updates", root)
+    assert writer.newest == T0
+    assert writer.write(T0, trips("B", T0 + 95)) == []
+    assert os.path.getmtime(path) == written
+
+    assert writer.append(T0 + 30, trips("C", T0 + 120))
+    assert not writer.append(T0 + 30, trips("C", T0 + 120))
+    assert len(writer.flush()) == 1
+    assert scan("trip_updates", root=root)["stop_id"].tolist() == ["A", "C"]
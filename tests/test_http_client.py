@@ -0,0 +1,105 @@
+import io
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from utils import http_client
+from utils.http_client import BACKOFF_CAP, MAX_RETRIES, retry_after
+
+
+def response(retry_after_header=None, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO()
+    if retry_after_header is not None:
+        response.headers["Retry-After"] = retry_after_header
+    return response
+
+
+def test_retry_after_seconds():
+    assert retry_after(response("3")) == 3.0
+
+
+def test_retry_after_http_date():
+    seconds = retry_after(response(formatdate(time.time() + 30, usegmt=True)))
+    assert 28 <= seconds <= 30
+
+
+def test_retry_after_in_the_past_is_zero():
+    assert retry_after(response(formatdate(time.time() - 30, usegmt=True))) == 0.0
+
+
+def test_retry_after_missing_or_invalid():
+    assert retry_after(response()) is None
+    assert retry_after(response("soon")) is None
+
+
+class FakeSession:
+    """Answers each request with the next of ``replies``, raising exceptions"""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def get(self, url, headers=None, timeout=None):
+        self.calls += 1
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(http_client.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def serve(monkeypatch, *replies):
+    session = FakeSession(replies)
+    monkeypatch.setattr(http_client, "session", session)
+    return session
+
+
+def test_get_waits_as_long_as_retry_after_asks(monkeypatch, sleeps):
+    session = serve(monkeypatch, response("3", 503), response())
+    assert http_client.get("http://feed").status_code == 200
+    assert session.calls == 2
+    assert sleeps[0] >= 3
+
+
+def test_get_gives_up_when_retry_after_exceeds_the_cap(monkeypatch, sleeps):
+    session = serve(monkeypatch, response(str(int(BACKOFF_CAP) + 26), 429))
+    assert http_client.get("http://feed").status_code == 429
+    assert session.calls == 1
+    assert sleeps == []
+
+
+def test_get_returns_the_last_response_after_its_retries(monkeypatch, sleeps):
+    replies = [response(status_code=502) for _ in range(MAX_RETRIES + 1)]
+    session = serve(monkeypatch, *replies)
+    assert http_client.get("http://feed").status_code == 502
+    assert session.calls == MAX_RETRIES + 1
+    assert len(sleeps) == MAX_RETRIES
+    assert all(0 <= delay <= BACKOFF_CAP for delay in sleeps)
+
+
+def test_get_returns_other_errors_at_once(monkeypatch, sleeps):
+    session = serve(monkeypatch, response(status_code=404))
+    assert http_client.get("http://feed").status_code == 404
+    assert session.calls == 1 and sleeps == []
+
+
+def test_get_retries_connection_errors_then_raises(monkeypatch, sleeps):
+    session = serve(monkeypatch, requests.ConnectionError(), response())
+    assert http_client.get("http://feed").status_code == 200
+    assert len(sleeps) == 1
+
+    errors = [requests.Timeout() for _ in range(MAX_RETRIES + 1)]
+    session = serve(monkeypatch, *errors)
+    with pytest.raises(requests.Timeout):
+        http_client.get("http://feed")
+    assert session.calls == MAX_RETRIES + 1
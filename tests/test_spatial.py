@@ -0,0 +1,50 @@
+import numpy as np
+
+from utils.spatial import GridIndex, haversine
+
+# A few stops around downtown Minneapolis, and one without a position
+LATITUDE = np.array([44.9778, 44.9780, 44.9800, 44.9500, np.nan, 44.9779])
+LONGITUDE = np.array([-93.2650, -93.2655, -93.2700, -93.3000, np.nan, -93.2651])
+
+
+def brute_force_nearest(lat, lon, k):
+    distances = haversine(lat, lon, LATITUDE, LONGITUDE)
+    distances = np.where(np.isnan(distances), np.inf, distances)
+    order = np.argsort(distances, kind="stable")[:k]
+    return order[np.isfinite(distances[order])]
+
+
+def test_nearest_matches_brute_force():
+    grid = GridIndex.from_points(LATITUDE, LONGITUDE, cell_size=0.001)
+    for lat, lon in [(44.9778, -93.2650), (44.96, -93.28), (45.2, -93.0)]:
+        for k in (1, 3, 5):
+            rows, distances = grid.nearest(lat, lon, k=k)
+            assert rows.tolist() == brute_force_nearest(lat, lon, k).tolist()
+            assert np.all(np.diff(distances) >= 0)
+
+
+def test_nearest_skips_points_without_position():
+    grid = GridIndex.from_points(LATITUDE, LONGITUDE)
+    rows, _ = grid.nearest(44.9778, -93.2650, k=10)
+    assert len(rows) == 5
+    assert 4 not in rows.tolist()
+
+
+def test_nearest_respects_max_distance():
+    grid = GridIndex.from_points(LATITUDE, LONGITUDE)
+    rows, distances = grid.nearest(44.9778, -93.2650, k=5, max_distance=100)
+    assert rows.tolist() == [0, 5, 1]
+    assert distances.max() <= 100
+
+
+def test_in_bbox():
+    grid = GridIndex.from_points(LATITUDE, LONGITUDE, cell_size=0.001)
+    rows = grid.in_bbox(44.975, -93.27, 44.981, -93.26)
+    assert rows.tolist() == [0, 1, 2, 5]
+    assert grid.in_bbox(45.0, -93.0, 44.0, -92.0).tolist() == []
+
+
+def test_empty_grid():
+    grid = GridIndex.from_points([], [])
+    rows, distances = grid.nearest(44.9778, -93.2650)
+    assert len(rows) == 0 and len(distances) == 0
@@ -0,0 +1,131 @@
+import pytest
+
+from utils.table_query import TableQueryEngine, parse_filter_query
+
+ROWS = [
+    {"route_id": "10", "label": "Central", "stops": 12, "speed": 8.5},
+    {"route_id": "2", "label": "Franklin", "stops": 30, "speed": None},
+    {"route_id": 10, "label": "central ave", "stops": 7, "speed": 11.0},
+    {"route_id": "902", "label": "Green Line", "stops": 23, "speed": 9.25},
+    {"route_id": "21", "label": "Lake St", "stops": 30, "speed": 6.0},
+]
+
+
+def ids(rows):
+    return [row["label"] for row in rows]
+
+
+def query(filter_query="", sort_by=None, page_current=0, page_size=None):
+    return TableQueryEngine(ROWS).query(filter_query, sort_by, page_current, page_size)
+
+
+@pytest.mark.parametrize(
+    "filter_query, terms",
+    [
+        ("{stops} > 20", [("stops", "gt", 20, "")]),
+        ("{speed} <= 8.5", [("speed", "le", 8.5, "")]),
+        ('{route_id} = "10"', [("route_id", "eq", "10", "")]),
+        ("{label} icontains cen", [("label", "contains", "cen", "i")]),
+        ("{label} scontains Cen", [("label", "contains", "Cen", "s")]),
+        ("{label} ieq 'lake st'", [("label", "eq", "lake st", "i")]),
+        ("{label} contains `a b`", [("label", "contains", "a b", "")]),
+        ("{label} = Central", [("label", "eq", "Central", "")]),
+        (
+            "{stops} ge 12 && {route_id} ne 2",
+            [("stops", "ge", 12, ""), ("route_id", "ne", 2, "")],
+        ),
+        ("", []),
+        (None, []),
+        ("not a filter && {stops} lt 10", [("stops", "lt", 10, "")]),
+    ],
+)
+def test_parse_filter_query(filter_query, terms):
+    assert parse_filter_query(filter_query) == terms
+
+
+def test_number_matches_text_cells():
+    # A bare 10 matches both the number 10 and the text "10"
+    rows, _ = query("{route_id} = 10")
+    assert ids(rows) == ["Central", "central ave"]
+
+
+def test_quoted_number_only_matches_text():
+    rows, _ = query('{route_id} = "10"')
+    assert ids(rows) == ["Central"]
+
+
+def test_not_equal():
+    rows, _ = query("{route_id} != 10")
+    assert ids(rows) == ["Franklin", "Green Line", "Lake St"]
+
+
+def test_case_insensitive_and_sensitive_contains():
+    assert ids(query("{label} icontains CENTRAL")[0]) == ["Central", "central ave"]
+    assert ids(query("{label} scontains Central")[0]) == ["Central"]
+    assert ids(query("{label} contains central")[0]) == ["central ave"]
+
+
+def test_case_insensitive_equality():
+    assert ids(query("{label} ieq 'GREEN LINE'")[0]) == ["Green Line"]
+    assert ids(query("{label} ine 'green line'")[0]) == [
+        "Central",
+        "Franklin",
+        "central ave",
+        "Lake St",
+    ]
+
+
+def test_ordered_comparisons_skip_missing_values():
+    assert ids(query("{speed} < 9")[0]) == ["Central", "Lake St"]
+    assert ids(query("{speed} >= 9.25")[0]) == ["central ave", "Green Line"]
+    assert ids(query("{stops} > 12 && {stops} <= 23")[0]) == ["Green Line"]
+
+
+def test_ordered_comparisons_stay_within_text():
+    # "2" < "21" < "902" as text; the number 10 is not compared with text
+    rows, _ = query('{route_id} < "21"')
+    assert ids(rows) == ["Central", "Franklin"]
+
+
+def test_sort_ascending_puts_missing_last():
+    rows, _ = query(sort_by=[{"column_id": "speed", "direction": "asc"}])
+    assert ids(rows) == ["Lake St", "Central", "Green Line", "central ave", "Franklin"]
+
+
+def test_multi_column_sort_with_descending_ranks():
+    rows, _ = query(
+        sort_by=[
+            {"column_id": "stops", "direction": "desc"},
+            {"column_id": "label", "direction": "asc"},
+        ]
+    )
+    assert ids(rows) == ["Franklin", "Lake St", "Green Line", "Central", "central ave"]
+
+    rows, _ = query(
+        sort_by=[
+            {"column_id": "stops", "direction": "desc"},
+            {"column_id": "label", "direction": "desc"},
+        ]
+    )
+    assert ids(rows) == ["Lake St", "Franklin", "Green Line", "Central", "central ave"]
+
+
+def test_sort_is_stable_for_equal_values():
+    rows, _ = query(sort_by=[{"column_id": "stops", "direction": "desc"}])
+    assert ids(rows)[:2] == ["Franklin", "Lake St"]
+
+
+def test_filter_then_sort_then_page():
+    engine = TableQueryEngine(ROWS)
+    sort_by = [{"column_id": "stops", "direction": "asc"}]
+    first, pages = engine.query("{stops} > 10", sort_by, 0, 2)
+    second, _ = engine.query("{stops} > 10", sort_by, 1, 2)
+    assert pages == 2
+    assert ids(first) == ["Central", "Green Line"]
+    assert ids(second) == ["Franklin", "Lake St"]
+
+
+def test_empty_result_has_one_page():
+    rows, pages = query("{stops} > 100", page_size=10)
+    assert rows == []
+    assert pages == 1
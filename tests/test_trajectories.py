@@ -0,0 +1,125 @@
+import numpy as np
+
+from utils.headways import stop_headways
+from utils.route_geometry import RouteGeometry, stops_to_array
+from utils.trajectories import TERMINAL_REACH_M, TrajectoryStore
+from utils.vehicles import VehicleSnapshot
+
+# Five stops due north of each other, about 500 m apart
+STOP_LATITUDE = 44.95 + 0.0045 * np.arange(5)
+LONGITUDE = -93.25
+METERS_PER_DEGREE = 6371008.8 * np.pi / 180
+T0 = 1_700_000_000
+
+
+def geometry():
+    return RouteGeometry(
+        stops_to_array(
+            [
+                {
+                    "route_id": "5",
+                    "direction_id": 0,
+                    "stop_id": n + 1,
+                    "latitude": latitude,
+                    "longitude": LONGITUDE,
+                }
+                for n, latitude in enumerate(STOP_LATITUDE)
+            ]
+        )
+    )
+
+
+def snapshot(positions, timestamp):
+    # positions: {vehicle_id: meters north of the first stop}
+    count = len(positions)
+    return VehicleSnapshot.from_columns(
+        list(positions),
+        [""] * count,
+        ["5"] * count,
+        [0] * count,
+        [STOP_LATITUDE[0] + m / METERS_PER_DEGREE for m in positions.values()],
+        [LONGITUDE] * count,
+        [0] * count,
+        [0] * count,
+        [timestamp] * count,
+    )
+
+
+def drive(store, starts, seconds, speed=7.0, cadence=15):
+    # Each vehicle leaves the first stop at its start time and stops at the last
+    end = store.geometry.lines.length[0]
+    for t in range(T0, T0 + seconds, cadence):
+        store.ingest(
+            snapshot(
+                {v: min(max(t - s, 0) * speed, end) for v, s in starts.items()}, t
+            )
+        )
+
+
+def passages(store):
+    arrivals = store.arrivals(since=0)
+    order = np.lexsort((arrivals["timestamp"], arrivals["slot"]))
+    columns = [arrivals[name][order] for name in ("slot", "stop", "timestamp")]
+    return [
+        (store.vehicle_ids[slot], int(stop), int(timestamp))
+        for slot, stop, timestamp in zip(*columns)
+    ]
+
+
+def test_passages_are_interpolated_between_samples():
+    store = TrajectoryStore(window=3600, vehicles=4, geometry=geometry())
+    drive(store, {"A": T0 + 7}, seconds=400)
+    # The first stop is where vehicles lay over, so it is never passed
+    assert [stop for _, stop, _ in passages(store)] == [1, 2, 3, 4]
+    # No sample lands on a stop, yet each passage is within a second or two;
+    # the last stop is reached at the first sample close enough to it
+    true = T0 + 7 + store.geometry.lines.stop_distances[0][1:] / 7.0
+    error = np.array([timestamp for _, _, timestamp in passages(store)]) - true
+    assert np.abs(error[:-1]).max() <= 2
+    assert 0 <= error[-1] <= TERMINAL_REACH_M / 7.0
+
+
+def test_headways_between_vehicles():
+    store = TrajectoryStore(window=3600, vehicles=4, geometry=geometry())
+    drive(store, {"A": T0, "B": T0 + 100}, seconds=500)
+    headways = stop_headways(store.arrivals(since=0))
+    assert headways["stop"].tolist() == [1, 2, 3, 4]
+    assert np.abs(headways["headway"][:-1] - 100).max() <= 2
+
+
+def test_backward_jitter_does_not_pass_a_stop_twice():
+    store = TrajectoryStore(window=3600, vehicles=4, geometry=geometry())
+    for n, meters in enumerate([450, 510, 490, 530, 1200]):
+        store.ingest(snapshot({"A": meters}, T0 + 15 * n))
+    assert [stop for _, stop, _ in passages(store)] == [1, 2]
+
+
+def test_long_gaps_are_not_timed():
+    store = TrajectoryStore(window=3600, vehicles=4, geometry=geometry())
+    store.ingest(snapshot({"A": 100}, T0))
+    store.ingest(snapshot({"A": 1800}, T0 + 600))
+    store.ingest(snapshot({"A": 2100}, T0 + 615))
+    assert [stop for _, stop, _ in passages(store)] == [4]
+
+
+
+def test_vehicle_listed_twice_gets_one_row():
+    store = TrajectoryStore(window=60, vehicles=3, cadence=15)
+    for n, vehicle_ids in enumerate([["a", "a"], ["b", "c"], ["d", "e", "f"]]):
+        count = len(vehicle_ids)
+        store.ingest(
+            VehicleSnapshot.from_columns(
+                vehicle_ids,
+                [""] * count,
+                ["5"] * count,
+                [0] * count,
+                [STOP_LATITUDE[0]] * count,
+                [LONGITUDE] * count,
+                [0] * count,
+                [0] * count,
+                [T0 + 15 * n] * count,
+            )
+        )
+        tracked = [v for v in store.vehicle_ids.tolist() if v is not None]
+        assert sorted(tracked) == sorted(store._slots)
+    assert sorted(store._slots) == ["d", "e", "f"]
@@ -0,0 +1,63 @@
+from utils.trip_index import TripIndex
+
+TRIPS = [
+    ("t2", "5", [("A", 1, 1000, 1010), ("B", 2, 1100, -1), ("C", 3, -1, 1200)]),
+    ("t1", "21", [("B", 4, 1050, 1060), ("C", 5, 1150, 1160)]),
+    ("t3", "5", []),
+]
+
+
+def index():
+    return TripIndex.from_trips(TRIPS)
+
+
+def test_arrivals_are_in_time_order():
+    arrivals = index().arrivals("B", after=0)
+    assert [(a["trip_id"], a["arrival"]) for a in arrivals] == [
+        ("t1", 1050),
+        ("t2", 1100),
+    ]
+    assert arrivals[1]["departure"] is None
+    assert arrivals[1]["route_id"] == "5"
+
+
+def test_arrivals_after_and_limit():
+    assert [a["trip_id"] for a in index().arrivals("B", after=1051)] == ["t2"]
+    assert [a["trip_id"] for a in index().arrivals("B", after=0, limit=1)] == ["t1"]
+
+
+def test_departure_only_stop_uses_departure_time():
+    # t1 arrives at 1150, before ``after``; t2 only predicts its departure
+    arrivals = index().arrivals("C", after=1155)
+    assert [(a["trip_id"], a["arrival"], a["departure"]) for a in arrivals] == [
+        ("t2", None, 1200)
+    ]
+
+
+def test_unknown_stop_and_trip():
+    assert index().arrivals("Z", after=0) == []
+    assert index().trip_stops("nope") == []
+
+
+def test_trip_stops_in_feed_order():
+    stops = index().trip_stops("t2")
+    assert [(s["stop_id"], s["stop_sequence"]) for s in stops] == [
+        ("A", 1),
+        ("B", 2),
+        ("C", 3),
+    ]
+    assert index().trip_stops("t3") == []
+
+
+def test_next_stops_skip_trips_without_stops():
+    assert [(s["trip_id"], s["stop_id"]) for s in index().next_stops()] == [
+        ("t1", "B"),
+        ("t2", "A"),
+    ]
+
+
+def test_empty_index():
+    empty = TripIndex.empty()
+    assert len(empty) == 0
+    assert empty.arrivals("A", after=0) == []
+    assert empty.next_stops() == []
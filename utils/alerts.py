@@ -0,0 +1,327 @@
+import dataclasses
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from utils.gtfs_api import ALERTS_URL, loaded_snapshot, parse_service_alerts
+from utils.metrics import metrics
+from utils.shared import connect, open_store
+
+ALERTS_PATH = os.environ.get("ALERTS_PATH", os.path.join("data", "alerts.sqlite3"))
+# Seconds ended alerts and change events are kept, for readers catching up
+ALERT_HISTORY = float(os.environ.get("ALERT_HISTORY", str(24 * 60 * 60)))
+
+# Fields that make up an alert's content; a new hash of these is a change
+_CONTENT = ("header", "description", "effect", "cause", "affected_routes")
+
+
+def _content_hash(content: dict) -> str:
+    body = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(body.encode()).hexdigest()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    ended INTEGER
+);
+CREATE TABLE IF NOT EXISTS alert_events (
+    version INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (version, id)
+);
+CREATE TABLE IF NOT EXISTS alert_state (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def _state(db, name: str) -> int:
+    row = db.execute("SELECT value FROM alert_state WHERE name = ?", (name,)).fetchone()
+    return 0 if row is None else row[0]
+
+
+def _set_state(db, name: str, value: int):
+    db.execute(
+        "INSERT OR REPLACE INTO alert_state (name, value) VALUES (?, ?)", (name, value)
+    )
+
+
+def _format_time(timestamp) -> str:
+    if timestamp is None:
+        return ""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+
+def _record(body: str) -> "AlertRecord":
+    record = json.loads(body)
+    record["affected_routes"] = tuple(record["affected_routes"])
+    return AlertRecord(**record)
+
+
+@dataclass(frozen=True)
+class AlertRecord:
+    """One alert as last published, with when it was seen (feed timestamps)"""
+
+    id: str
+    header: str
+    description: str
+    effect: str
+    cause: str
+    affected_routes: tuple
+    content_hash: str
+    first_seen: int
+    last_seen: int
+    ended: int = None
+
+    def to_dict(self) -> dict:
+        record = dataclasses.asdict(self)
+        record["affected_routes"] = list(self.affected_routes)
+        return record
+
+    def to_row(self) -> dict:
+        """Table row, with the routes joined and the times formatted"""
+        return {
+            "id": self.id,
+            "header": self.header,
+            "description": self.description,
+            "effect": self.effect,
+            "cause": self.cause,
+            "affected_routes": ", ".join(self.affected_routes),
+            "first_seen": _format_time(self.first_seen),
+            "last_seen": _format_time(self.last_seen),
+        }
+
+
+class AlertsStore:
+    """Service alerts tracked by id across feed versions, shared by all workers.
+
+    Each new alerts feed version is compared with the last by alert id and
+    content hash, and only the differences are recorded: ``added``,
+    ``changed`` and ``removed`` events, stored under the feed version (its
+    header timestamp) that caused them. State lives in SQLite, so every
+    worker process numbers events alike and agrees on when an alert was
+    first seen; the first worker to ingest a version applies it inside a
+    write transaction and the others read its events back. Listeners in
+    each process get each version's events once, and ``changes`` replays
+    them to readers polling with the last version they saw. Ended alerts
+    and events are forgotten ``history`` seconds later. Active alerts are
+    also kept in memory per stored version, indexed by route for
+    ``for_route``.
+    """
+
+    def __init__(self, path: str = ALERTS_PATH, history: float = ALERT_HISTORY):
+        self.path = path
+        self.history = history
+        # Latest version this process ingested, and the active alerts and
+        # route index of the stored version last loaded
+        self.version = 0
+        self._loaded = (None, {}, {})
+        self._listeners = []
+        self._lock = threading.Lock()
+        open_store(path, _SCHEMA)
+
+    def subscribe(self, listener):
+        """Call ``listener(events)`` with the events of every changed version"""
+        self._listeners.append(listener)
+        return listener
+
+    def _apply(self, db, version: int, alerts: list) -> list:
+        # Compare a version with the stored alerts and record its events
+        stored = {
+            alert_id: _record(body)
+            for alert_id, body in db.execute("SELECT id, record FROM alerts")
+        }
+        last = _state(db, "version")
+        events = []
+        published = set()
+        for alert in alerts:
+            alert_id = alert["id"]
+            if alert_id in published:
+                continue
+            published.add(alert_id)
+            content = {name: alert[name] for name in _CONTENT}
+            digest = _content_hash(content)
+            content["affected_routes"] = tuple(content["affected_routes"])
+            current = stored.get(alert_id)
+            if current is None or current.ended is not None:
+                events.append(
+                    (
+                        "added",
+                        AlertRecord(
+                            id=alert_id,
+                            content_hash=digest,
+                            first_seen=version,
+                            last_seen=version,
+                            **content,
+                        ),
+                    )
+                )
+            elif current.content_hash != digest:
+                record = dataclasses.replace(
+                    current, content_hash=digest, last_seen=version, **content
+                )
+                events.append(("changed", record))
+        for alert_id, record in stored.items():
+            if record.ended is None and alert_id not in published:
+                # Active alerts were last seen in the last version applied
+                record = dataclasses.replace(record, last_seen=last, ended=version)
+                events.append(("removed", record))
+
+        for kind, record in events:
+            body = json.dumps(record.to_dict())
+            db.execute(
+                "INSERT OR REPLACE INTO alerts (id, record, ended) VALUES (?, ?, ?)",
+                (record.id, body, record.ended),
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO alert_events (version, id, kind, record)"
+                " VALUES (?, ?, ?, ?)",
+                (version, record.id, kind, body),
+            )
+        cutoff = version - self.history
+        db.execute("DELETE FROM alerts WHERE ended < ?", (cutoff,))
+        if db.execute("DELETE FROM alert_events WHERE version < ?", (cutoff,)).rowcount:
+            _set_state(db, "pruned", max(_state(db, "pruned"), int(cutoff)))
+        _set_state(db, "version", version)
+        return [
+            {"version": version, "kind": kind, "alert": record}
+            for kind, record in events
+        ]
+
+    def ingest(self, feed) -> list:
+        """Apply a service alerts feed and return its events.
+
+        Each version is compared once however many callers, in however many
+        processes, pass it in: a version another worker already applied
+        returns the events it stored. A version older than the latest this
+        process ingested returns nothing. A version counts as ingested only
+        once its transaction commits, so one that fails is tried again.
+        """
+        version = feed.header.timestamp
+        with self._lock:
+            if version <= self.version:
+                return []
+        alerts = parse_service_alerts(feed)
+        with connect(self.path) as db:
+            # Take the write lock first, so one worker applies each version
+            db.execute("BEGIN IMMEDIATE")
+            if version > _state(db, "version"):
+                events = self._apply(db, version, alerts)
+            else:
+                events = [
+                    {"version": version, "kind": kind, "alert": _record(body)}
+                    for kind, body in db.execute(
+                        "SELECT kind, record FROM alert_events WHERE version = ?"
+                        " ORDER BY rowid",
+                        (version,),
+                    )
+                ]
+        with self._lock:
+            # Another thread may have ingested the same version meanwhile
+            if version <= self.version:
+                return []
+            self.version = version
+
+        for listener in self._listeners if events else ():
+            try:
+                listener(events)
+            except Exception as e:
+                print(f"Error in alert listener: {e}")
+        return events
+
+    def ingest_feed(self, snapshot):
+        """Feed poller listener: apply each new service alerts version"""
+        if snapshot.url == ALERTS_URL:
+            self.ingest(snapshot.feed)
+
+    def _current(self):
+        # (version, active alerts by id, route index) of the stored state
+        with connect(self.path) as db:
+            version = _state(db, "version")
+            with self._lock:
+                if self._loaded[0] == version:
+                    return self._loaded
+            rows = db.execute(
+                "SELECT record FROM alerts WHERE ended IS NULL ORDER BY rowid"
+            ).fetchall()
+        alerts, routes = {}, {}
+        for (body,) in rows:
+            record = dataclasses.replace(_record(body), last_seen=version)
+            alerts[record.id] = record
+            for route_id in record.affected_routes:
+                routes.setdefault(route_id, []).append(record)
+        with self._lock:
+            self._loaded = (version, alerts, routes)
+        return self._loaded
+
+    def active(self) -> list:
+        """Alerts in the latest stored feed version"""
+        return list(self._current()[1].values())
+
+    def for_route(self, route_id: str) -> list:
+        """Active alerts affecting ``route_id``"""
+        return list(self._current()[2].get(route_id, ()))
+
+    def lookup(self, route_ids=None):
+        """``(version, alerts)``: the active alerts, of ``route_ids`` if given"""
+        version, alerts, routes = self._current()
+        if not route_ids:
+            return version, list(alerts.values())
+        records = {
+            record.id: record
+            for route_id in route_ids
+            for record in routes.get(route_id, ())
+        }
+        return version, list(records.values())
+
+    def changes(self, since: int = 0):
+        """``(version, events, complete)``: the events of versions after ``since``.
+
+        Pass the returned version as the next ``since``; every worker
+        answers alike. ``complete`` is False when events after ``since``
+        have already been forgotten, and the reader should start again from
+        ``active``.
+        """
+        with connect(self.path) as db:
+            version = _state(db, "version")
+            complete = since >= _state(db, "pruned")
+            events = [
+                {"version": event_version, "kind": kind, "alert": _record(body)}
+                for event_version, kind, body in db.execute(
+                    "SELECT version, kind, record FROM alert_events WHERE version > ?"
+                    " ORDER BY version, rowid",
+                    (since,),
+                )
+            ]
+        return version, events, complete
+
+    def stats(self) -> dict:
+        version, alerts, _ = self._current()
+        return {"version": version, "active": len(alerts)}
+
+
+alert_store = AlertsStore()
+
+
+def current_alerts() -> AlertsStore:
+    """The alert store, caught up with the alerts feed already in memory.
+
+    Never fetches; the feed poller normally keeps the store current.
+    """
+    snapshot = loaded_snapshot(ALERTS_URL)
+    if snapshot is not None:
+        alert_store.ingest(snapshot.feed)
+    return alert_store
+
+
+@metrics.collect
+def _alerts_active():
+    return [("alerts_active", {}, alert_store.stats()["active"])]
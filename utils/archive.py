@@ -0,0 +1,283 @@
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ARCHIVE_ROOT = os.path.join("data", "archive")
+
+# Column name -> kind, per archived feed. "str" columns are dictionary
+# encoded, "int" uses -1 and "float" NaN for missing values, and "time"
+# holds the feed's POSIX seconds (-1 if missing).
+SCHEMAS = {
+    "vehicle_positions": [
+        ("vehicle_id", "str"),
+        ("label", "str"),
+        ("license_plate", "str"),
+        ("trip_id", "str"),
+        ("route_id", "str"),
+        ("direction_id", "int"),
+        ("start_time", "str"),
+        ("start_date", "str"),
+        ("schedule_relationship", "int"),
+        ("latitude", "float"),
+        ("longitude", "float"),
+        ("bearing", "float"),
+        ("odometer", "float"),
+        ("speed", "float"),
+        ("current_stop_sequence", "int"),
+        ("stop_id", "str"),
+        ("current_status", "int"),
+        ("congestion_level", "int"),
+        ("occupancy_status", "int"),
+        ("timestamp", "time"),
+    ],
+    "trip_updates": [
+        ("trip_id", "str"),
+        ("route_id", "str"),
+        ("schedule", "str"),
+        ("stop_id", "str"),
+        ("arrival", "time"),
+        ("departure", "time"),
+    ],
+    "service_alerts": [
+        ("id", "str"),
+        ("header", "str"),
+        ("description", "str"),
+        ("effect", "str"),
+        ("cause", "str"),
+        ("affected_routes", "str"),
+    ],
+}
+
+
+def encode_records(records: list, schema: list) -> dict:
+    """Turn row dicts into the compact column arrays stored in the archive"""
+    columns = {}
+    for name, kind in schema:
+        values = [record.get(name) for record in records]
+        if kind == "str":
+            values = [
+                ", ".join(v) if isinstance(v, list) else None if v is None else str(v)
+                for v in values
+            ]
+            dictionary = sorted({v for v in values if v is not None})
+            lookup = {v: i for i, v in enumerate(dictionary)}
+            columns[f"{name}.codes"] = np.array(
+                [lookup.get(v, -1) for v in values], dtype=np.int32
+            )
+            columns[f"{name}.values"] = np.array(dictionary, dtype=str)
+        elif kind == "int":
+            columns[name] = np.array(
+                [-1 if v is None else v for v in values], dtype=np.int32
+            )
+        elif kind == "float":
+            columns[name] = np.array(
+                [np.nan if v is None else v for v in values], dtype=np.float32
+            )
+        elif kind == "time":
+            columns[name] = np.array(
+                [-1 if v is None else v for v in values], dtype=np.int64
+            )
+    return columns
+
+
+def _missing(kind: str, count: int) -> np.ndarray:
+    # ``count`` missing values of a column kind, as ``scan`` returns them
+    if kind == "str":
+        return np.full(count, None, dtype=object)
+    if kind == "float":
+        return np.full(count, np.nan, dtype=np.float32)
+    return np.full(count, -1, dtype=np.int32 if kind == "int" else np.int64)
+
+
+def _partition(feed_timestamp: int) -> str:
+    # Partitions are in UTC so daylight saving changes never reorder them
+    moment = datetime.fromtimestamp(feed_timestamp, tz=timezone.utc)
+    return os.path.join(f"date={moment:%Y-%m-%d}", f"hour={moment:%H}")
+
+
+def _newest_archived(root: str, feed: str) -> int:
+    # Last feed timestamp in the newest partition of ``feed``, or 0
+    directory = os.path.join(root, feed)
+    for _ in range(2):  # date=..., then hour=...
+        if not os.path.isdir(directory):
+            return 0
+        names = sorted(os.listdir(directory))
+        if not names:
+            return 0
+        directory = os.path.join(directory, names[-1])
+    if not os.path.isdir(directory):
+        return 0
+    return max(
+        (
+            int(name[: -len(".npz")].split("_")[1])
+            for name in os.listdir(directory)
+            if name.endswith(".npz")
+        ),
+        default=0,
+    )
+
+
+class ArchiveWriter:
+    """Appends feed snapshots to a partitioned, compressed columnar archive.
+
+    Snapshots are buffered with ``append`` and written by ``flush`` as one
+    ``.npz`` part per UTC hour touched, named after the first and last feed
+    timestamp it holds. Existing parts are never rewritten: snapshots no
+    newer than the newest already archived, as after a restart, are dropped.
+    """
+
+    def __init__(self, feed: str, root: str = ARCHIVE_ROOT):
+        self.feed = feed
+        self.root = root
+        self.schema = SCHEMAS[feed]
+        self.newest = _newest_archived(root, feed)
+        self._pending = []
+
+    def append(self, feed_timestamp: int, records: list) -> bool:
+        """Queue one snapshot's rows for the next ``flush``; False if a snapshot
+        this old is already archived or queued"""
+        feed_timestamp = int(feed_timestamp)
+        if feed_timestamp <= self.newest:
+            return False
+        self.newest = feed_timestamp
+        self._pending.append((feed_timestamp, records))
+        return True
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> list:
+        """Write the queued snapshots, returning the paths of the new parts"""
+        by_partition = {}
+        for feed_timestamp, records in self._pending:
+            partition = os.path.join(
+                self.root, self.feed, _partition(feed_timestamp)
+            )
+            by_partition.setdefault(partition, []).append((feed_timestamp, records))
+        self._pending = []
+
+        paths = []
+        for partition, snapshots in by_partition.items():
+            records = [record for _, rows in snapshots for record in rows]
+            columns = encode_records(records, self.schema)
+            columns["feed_timestamp"] = np.repeat(
+                np.array([ts for ts, _ in snapshots], dtype=np.int64),
+                [len(rows) for _, rows in snapshots],
+            )
+            first, last = snapshots[0][0], snapshots[-1][0]
+            os.makedirs(partition, exist_ok=True)
+            path = os.path.join(partition, f"{first}_{last}.npz")
+            # Write under a temporary name so readers never see a partial part
+            temporary = path + ".tmp"
+            with open(temporary, "wb") as f:
+                np.savez_compressed(f, **columns)
+            os.replace(temporary, path)
+            paths.append(path)
+        return paths
+
+    def write(self, feed_timestamp: int, records: list) -> list:
+        """Append and immediately write a single snapshot"""
+        self.append(feed_timestamp, records)
+        return self.flush()
+
+
+def _parts(root: str, feed: str, start: int = None, end: int = None):
+    """Part files that may hold snapshots between ``start`` and ``end`` inclusive"""
+    feed_dir = os.path.join(root, feed)
+    if not os.path.isdir(feed_dir):
+        return
+    start_hour = None if start is None else _partition(start)
+    end_hour = None if end is None else _partition(end)
+    for date_dir in sorted(os.listdir(feed_dir)):
+        for hour_dir in sorted(os.listdir(os.path.join(feed_dir, date_dir))):
+            # Prune whole hours by directory name before touching any file
+            hour = os.path.join(date_dir, hour_dir)
+            if start_hour is not None and hour < start_hour:
+                continue
+            if end_hour is not None and hour > end_hour:
+                continue
+            partition = os.path.join(feed_dir, hour)
+            for name in sorted(os.listdir(partition)):
+                if not name.endswith(".npz"):
+                    continue
+                first, last = (int(t) for t in name[: -len(".npz")].split("_"))
+                if start is not None and last < start:
+                    continue
+                if end is not None and first > end:
+                    continue
+                yield os.path.join(partition, name)
+
+
+def scan(
+    feed: str,
+    start: int = None,
+    end: int = None,
+    route_ids=None,
+    columns=None,
+    root: str = ARCHIVE_ROOT,
+) -> dict:
+    """Read archived rows between two POSIX times, optionally for some routes.
+
+    Only the parts overlapping the time range are opened, and from those only
+    ``feed_timestamp``, the route column (when filtering) and the requested
+    ``columns`` are decompressed. Returns {column: array} with string
+    columns decoded and missing strings as None.
+    """
+    schema = dict(SCHEMAS[feed])
+    columns = list(columns or schema)
+    chunks = {name: [] for name in ["feed_timestamp"] + columns}
+    for path in _parts(root, feed, start, end):
+        with np.load(path, allow_pickle=False) as part:
+            feed_timestamp = part["feed_timestamp"]
+            mask = np.ones(len(feed_timestamp), dtype=bool)
+            if start is not None:
+                mask &= feed_timestamp >= start
+            if end is not None:
+                mask &= feed_timestamp <= end
+            if route_ids is not None:
+                route_values = part["route_id.values"]
+                wanted = np.flatnonzero(np.isin(route_values, list(route_ids)))
+                mask &= np.isin(part["route_id.codes"], wanted)
+            if not mask.any():
+                continue
+            chunks["feed_timestamp"].append(feed_timestamp[mask])
+            for name in columns:
+                if schema[name] == "str" and f"{name}.codes" in part.files:
+                    codes = part[f"{name}.codes"][mask]
+                    values = np.append(part[f"{name}.values"].astype(object), None)
+                    chunks[name].append(values[codes])
+                elif schema[name] != "str" and name in part.files:
+                    chunks[name].append(part[name][mask])
+                else:
+                    # Written under an older schema (trip update times were
+                    # once clock strings); read as missing
+                    chunks[name].append(_missing(schema[name], mask.sum()))
+
+    result = {}
+    for name, parts in chunks.items():
+        if parts:
+            result[name] = np.concatenate(parts)
+        else:
+            kind = "time" if name == "feed_timestamp" else schema[name]
+            result[name] = _missing(kind, 0)
+    return result
+
+
+def read_frame(
+    feed: str,
+    start: int = None,
+    end: int = None,
+    route_ids=None,
+    columns=None,
+    root: str = ARCHIVE_ROOT,
+) -> pd.DataFrame:
+    """``scan`` as a pandas DataFrame, with repeated strings as categoricals"""
+    data = scan(feed, start, end, route_ids, columns, root)
+    schema = dict(SCHEMAS[feed])
+    frame = pd.DataFrame(data)
+    for name in data:
+        if schema.get(name) == "str":
+            frame[name] = frame[name].astype("category")
+    return frame
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils.gtfs_api import VEHICLE_POSITIONS_URL, derived, loaded_snapshot
+from utils.metrics import metrics
+from utils.vehicles import VehicleSnapshot
+
+# Channel carrying every vehicle, for clients that do not name a route
+ALL_ROUTES = "*"
+# Open streams allowed per process. Each holds a server thread, so keep this
+# below the worker's thread count to leave threads for page requests.
+STREAM_MAX_CLIENTS = int(os.environ.get("STREAM_MAX_CLIENTS", "24"))
+# Seconds between keep-alive comments on an idle stream, which also let the
+# server notice clients that went away
+STREAM_KEEPALIVE = 15.0
+
+
+def encode_event(channel: str, version: int, vehicles: VehicleSnapshot) -> bytes:
+    """One server-sent ``vehicles`` event with the positions on ``channel``"""
+    data = {
+        "route": channel,
+        "version": version,
+        "vehicle_id": vehicles.vehicle_id.tolist(),
+        "route_id": vehicles.route_id.tolist(),
+        "lat": np.round(vehicles.latitude.astype(np.float64), 6).tolist(),
+        "lon": np.round(vehicles.longitude.astype(np.float64), 6).tolist(),
+        "timestamp": vehicles.format_timestamps(),
+    }
+    body = json.dumps(data, separators=(",", ":"))
+    return f"id: {version}\nevent: vehicles\ndata: {body}\n\n".encode()
+
+
+class Subscription:
+    """The events waiting to be written to one open stream.
+
+    Only the newest event per channel is kept, so a client that reads
+    slowly skips versions instead of building up a backlog.
+    """
+
+    def __init__(self, channels):
+        self.channels = frozenset(channels)
+        self._pending = {}
+        self._ready = threading.Condition()
+
+    def offer(self, events: dict):
+        with self._ready:
+            for channel in self.channels:
+                if channel in events:
+                    self._pending[channel] = events[channel]
+            if self._pending:
+                self._ready.notify()
+
+    def wait(self, timeout: float = STREAM_KEEPALIVE) -> list:
+        """Events to send, or an empty list if none arrived within ``timeout``"""
+        with self._ready:
+            if not self._pending:
+                self._ready.wait(timeout)
+            events, self._pending = list(self._pending.values()), {}
+        return events
+
+
+class Broadcaster:
+    """Pushes each new vehicle positions version to every open stream.
+
+    Registered as a feed poller listener: when a new version is published,
+    the event for each route that has vehicles or subscribers is encoded
+    once and handed to the subscriptions that asked for it. The work per
+    version is the same with one open screen or a hundred.
+    """
+
+    def __init__(self, max_clients: int = STREAM_MAX_CLIENTS):
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._events = {}
+        self._version = None
+
+    def _encode(self, snapshot, channels) -> dict:
+        vehicles = derived(snapshot, "vehicles", VehicleSnapshot.from_feed)
+        with metrics.span("render", "stream"):
+            events = {}
+            for channel in channels:
+                rows = vehicles if channel == ALL_ROUTES else vehicles.for_route(channel)
+                events[channel] = encode_event(channel, snapshot.version, rows)
+        return events
+
+    def publish(self, snapshot):
+        """Feed poller listener: broadcast a new vehicle positions version"""
+        if snapshot.url != VEHICLE_POSITIONS_URL:
+            return
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        channels = {c for s in subscriptions for c in s.channels}
+        events = self._encode(snapshot, channels)
+        with self._lock:
+            self._events, self._version = events, snapshot.version
+        for subscription in subscriptions:
+            subscription.offer(events)
+        metrics.inc("stream_events_total", len(subscriptions))
+
+    def subscribe(self, channels):
+        """A new Subscription already holding the current events, or None if full"""
+        subscription = Subscription(channels or [ALL_ROUTES])
+        with self._lock:
+            if len(self._subscriptions) >= self.max_clients:
+                return None
+            self._subscriptions.add(subscription)
+            events = self._events
+            missing = subscription.channels - events.keys()
+        snapshot = loaded_snapshot(VEHICLE_POSITIONS_URL)
+        if missing and snapshot is not None:
+            events = dict(events, **self._encode(snapshot, missing))
+            with self._lock:
+                if self._version == snapshot.version:
+                    self._events = dict(self._events, **events)
+        subscription.offer(events)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def stream(self, subscription: Subscription):
+        """Server-sent event stream for ``subscription``, ending it on disconnect"""
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                events = subscription.wait()
+                yield b"".join(events) if events else b": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def clients(self) -> int:
+        with self._lock:
+            return len(self._subscriptions)
+
+
+broadcaster = Broadcaster()
+
+
+@metrics.collect
+def _stream_samples():
+    return [("stream_clients", {}, broadcaster.clients())]
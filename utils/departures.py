@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime
+
+import requests
+
+from utils.gtfs_api import get_trip_index
+from utils.metrics import cache_samples, metrics
+from utils.nextrip_api import MetroTransitAPI
+
+# NexTrip departures are reused for this many seconds per stop
+DEPARTURES_TTL = float(os.environ.get("DEPARTURES_TTL", "20"))
+# Stops kept in the cache; the least recently viewed are evicted first
+DEPARTURES_CACHE_SIZE = int(os.environ.get("DEPARTURES_CACHE_SIZE", "512"))
+# Seconds a viewer waits for NexTrip before the board uses GTFS trip updates
+DEPARTURES_WAIT = float(os.environ.get("DEPARTURES_WAIT", "1.5"))
+DEPARTURES_LIMIT = 20
+
+
+class DepartureCache:
+    """Shared, size-bounded cache of NexTrip departures per stop.
+
+    A stop is fetched from NexTrip at most once per ``ttl`` seconds no matter
+    how many boards show it: concurrent misses wait on the same request.
+    Requests run on a small worker pool, so a viewer can give up after a
+    short wait while the response still lands in the cache for the next one.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEPARTURES_TTL,
+        maxsize: int = DEPARTURES_CACHE_SIZE,
+        loader=None,
+        max_workers: int = 8,
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._loader = loader or MetroTransitAPI().get_departures_by_stop
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="nextrip")
+        self._counts = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "timeouts": 0,
+        }
+
+    def _fetch(self, stop_id: str):
+        try:
+            data = self._loader(stop_id)
+        except Exception:
+            with self._lock:
+                self._counts["errors"] += 1
+                del self._inflight[stop_id]
+            raise
+        with self._lock:
+            self._entries[stop_id] = (time.time(), data)
+            self._entries.move_to_end(stop_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            del self._inflight[stop_id]
+        return data
+
+    def get(self, stop_id: str, wait: float = DEPARTURES_WAIT):
+        """NexTrip's response for ``stop_id``, or None if not back within ``wait``"""
+        stop_id = str(stop_id)
+        with self._lock:
+            entry = self._entries.get(stop_id)
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                self._entries.move_to_end(stop_id)
+                self._counts["hits"] += 1
+                return entry[1]
+            future = self._inflight.get(stop_id)
+            if future is None:
+                self._counts["misses"] += 1
+                future = self._inflight[stop_id] = self._executor.submit(
+                    self._fetch, stop_id
+                )
+            else:
+                self._counts["coalesced"] += 1
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeout:
+            with self._lock:
+                self._counts["timeouts"] += 1
+            return None
+
+    def invalidate(self, stop_id: str = None):
+        """Drop the cached departures for ``stop_id``, or for every stop"""
+        with self._lock:
+            if stop_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(stop_id), None)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and the number of cached stops"""
+        with self._lock:
+            return dict(self._counts, stops=len(self._entries))
+
+
+departure_cache = DepartureCache()
+
+
+@metrics.collect
+def _departure_samples():
+    return cache_samples(
+        "departures",
+        departure_cache.stats(),
+        ("hits", "misses", "coalesced", "timeouts"),
+    )
+
+
+def departure_text(departure_time: int, now: float) -> str:
+    """NexTrip-style countdown: "Due", "N Min" within 20 minutes, else a clock time"""
+    minutes = int((departure_time - now) // 60)
+    if minutes < 1:
+        return "Due"
+    if minutes <= 20:
+        return f"{minutes} Min"
+    return datetime.fromtimestamp(departure_time).strftime("%I:%M %p").lstrip("0")
+
+
+def _nextrip_rows(data: dict) -> list:
+    return [
+        {
+            "route": departure.get("route_short_name") or departure.get("route_id"),
+            "destination": departure.get("description", ""),
+            "direction": departure.get("direction_text", ""),
+            "departure": departure.get("departure_text", ""),
+            "realtime": "Yes" if departure.get("actual") else "No",
+        }
+        for departure in data.get("departures", [])
+    ]
+
+
+def _trip_update_rows(stop_id: str, now: float, limit: int) -> list:
+    return [
+        {
+            "route": arrival["route_id"],
+            "destination": "",
+            "direction": "",
+            "departure": departure_text(
+                arrival["arrival"] or arrival["departure"], now
+            ),
+            "realtime": "Yes",
+        }
+        for arrival in get_trip_index().arrivals(stop_id, after=now, limit=limit)
+    ]
+
+
+def stop_departures(stop_id: str, limit: int = DEPARTURES_LIMIT, wait=DEPARTURES_WAIT):
+    """Departure board rows for a stop, and where they came from.
+
+    Returns (rows, stop description or None, source) where source is
+    "nextrip", or "trip-updates" when NexTrip failed or was too slow.
+    """
+    try:
+        data = departure_cache.get(stop_id, wait)
+    except (requests.RequestException, ValueError) as e:
+        print(f"Error fetching departures for stop {stop_id}: {e}")
+        data = None
+    if isinstance(data, dict) and "departures" in data:
+        stops = data.get("stops") or [{}]
+        return _nextrip_rows(data)[:limit], stops[0].get("description"), "nextrip"
+    return _trip_update_rows(str(stop_id), time.time(), limit), None, "trip-updates"
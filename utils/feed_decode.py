@@ -0,0 +1,128 @@
+import warnings
+from datetime import datetime
+
+import numpy as np
+from google.protobuf.internal import api_implementation
+from google.transit import gtfs_realtime_pb2
+
+# "upb" or "cpp" parse in native code; "python" is several times slower
+BACKEND = api_implementation.Type()
+
+if BACKEND == "python":
+    warnings.warn(
+        "protobuf is using its pure-Python backend, so GTFS realtime feeds "
+        "parse slowly; unset PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION or "
+        "install a protobuf wheel for this platform",
+        RuntimeWarning,
+    )
+
+# Column -> (message the field is on, field name, dtype, missing value).
+# Messages are the VehiclePosition ("vehicle"), its TripDescriptor ("trip"),
+# Position ("position") and VehicleDescriptor ("descriptor"). Numbers with a
+# missing value are checked for presence first; the strings that may be unset
+# are listed in OPTIONAL_STRINGS.
+VEHICLE_FIELDS = {
+    "vehicle_id": ("descriptor", "id", object, None),
+    "label": ("descriptor", "label", object, None),
+    "license_plate": ("descriptor", "license_plate", object, None),
+    "trip_id": ("trip", "trip_id", object, None),
+    "route_id": ("trip", "route_id", object, None),
+    "direction_id": ("trip", "direction_id", np.int8, -1),
+    "start_time": ("trip", "start_time", object, None),
+    "start_date": ("trip", "start_date", object, None),
+    "schedule_relationship": ("trip", "schedule_relationship", np.int8, -1),
+    "latitude": ("position", "latitude", np.float32, None),
+    "longitude": ("position", "longitude", np.float32, None),
+    "bearing": ("position", "bearing", np.float32, np.nan),
+    "odometer": ("position", "odometer", np.float64, np.nan),
+    "speed": ("position", "speed", np.float32, np.nan),
+    "current_stop_sequence": ("vehicle", "current_stop_sequence", np.int64, -1),
+    "stop_id": ("vehicle", "stop_id", object, None),
+    "current_status": ("vehicle", "current_status", np.int8, -1),
+    "congestion_level": ("vehicle", "congestion_level", np.int8, -1),
+    "occupancy_status": ("vehicle", "occupancy_status", np.int8, -1),
+    "timestamp": ("vehicle", "timestamp", np.int64, None),
+}
+
+# Optional string fields that read as None rather than "" when not set
+OPTIONAL_STRINGS = {"label", "license_plate", "start_time", "start_date", "stop_id"}
+
+
+def decode_feed(content: bytes):
+    """Parse a serialized FeedMessage"""
+    return gtfs_realtime_pb2.FeedMessage.FromString(content)
+
+
+def vehicle_columns(feed, fields=VEHICLE_FIELDS) -> dict:
+    """Read only ``fields`` of every vehicle in a feed, one column at a time.
+
+    Numeric columns become NumPy arrays of the listed dtype, using the
+    missing value where the feed leaves a field unset; string columns are
+    lists. Sub-messages are only visited when a requested field lives on
+    them.
+    """
+    vehicles = [
+        entity.vehicle for entity in feed.entity if entity.HasField("vehicle")
+    ]
+    messages = {"vehicle": vehicles}
+    levels = {VEHICLE_FIELDS[name][0] for name in fields}
+    if "trip" in levels:
+        messages["trip"] = [vehicle.trip for vehicle in vehicles]
+    if "position" in levels:
+        messages["position"] = [vehicle.position for vehicle in vehicles]
+    if "descriptor" in levels:
+        messages["descriptor"] = [vehicle.vehicle for vehicle in vehicles]
+
+    columns = {}
+    for name in fields:
+        level, field, dtype, missing = VEHICLE_FIELDS[name]
+        objs = messages[level]
+        if dtype is object:
+            if name in OPTIONAL_STRINGS:
+                columns[name] = [
+                    getattr(m, field) if m.HasField(field) else None for m in objs
+                ]
+            else:
+                columns[name] = [getattr(m, field) for m in objs]
+        elif missing is None:
+            columns[name] = np.array([getattr(m, field) for m in objs], dtype)
+        else:
+            columns[name] = np.array(
+                [getattr(m, field) if m.HasField(field) else missing for m in objs],
+                dtype,
+            )
+    return columns
+
+
+def format_posix(timestamps, fmt: str = "%Y-%m-%d %H:%M:%S") -> list:
+    """Local-time strings for POSIX timestamps, formatting each value once"""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    unique, inverse = np.unique(timestamps, return_inverse=True)
+    formatted = np.array(
+        [datetime.fromtimestamp(ts).strftime(fmt) for ts in unique.tolist()],
+        dtype=object,
+    )
+    return formatted[inverse].tolist()
+
+
+def _python_values(column, missing) -> list:
+    if isinstance(column, list):
+        return column
+    values = column.tolist()
+    if missing is None:
+        return values
+    if missing != missing:
+        return [None if v != v else v for v in values]
+    return [None if v == missing else v for v in values]
+
+
+def records_from_columns(columns: dict, fields=VEHICLE_FIELDS) -> list:
+    """One dict per row of ``vehicle_columns`` output, with None for unset fields"""
+    names = list(columns)
+    values = [
+        _python_values(columns[name], fields[name][3])
+        if name in fields
+        else list(columns[name])
+        for name in names
+    ]
+    return [dict(zip(names, row)) for row in zip(*values)]
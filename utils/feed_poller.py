@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+import requests
+from google.protobuf.message import DecodeError
+
+from utils.gtfs_api import (
+    ALERTS_URL,
+    TRIP_UPDATES_URL,
+    VEHICLE_POSITIONS_URL,
+    latest_snapshot,
+    parse_feed,
+    peek_header_timestamp,
+    publish_snapshot,
+    request_feed,
+    withdraw_snapshot,
+)
+
+# Seconds between polls of each feed; alerts change far less often than positions
+DEFAULT_POLL_INTERVALS = {
+    ALERTS_URL: 60.0,
+    TRIP_UPDATES_URL: 15.0,
+    VEHICLE_POSITIONS_URL: 10.0,
+}
+
+
+class FeedPoller:
+    """Keeps GTFS realtime feeds hot by polling each one on its own thread.
+
+    Polls are conditional requests, and the entities are only parsed when the
+    server reports a change and the header timestamp differs from the
+    published snapshot. New versions are published through
+    ``utils.gtfs_api.publish_snapshot`` so page callbacks read them without
+    doing any network I/O, and are passed to listeners registered with
+    ``subscribe``.
+    """
+
+    def __init__(self, intervals: dict = None):
+        self.intervals = dict(intervals or DEFAULT_POLL_INTERVALS)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    def subscribe(self, listener):
+        """Call ``listener(snapshot)`` whenever a new feed version is published"""
+        self._listeners.append(listener)
+        return listener
+
+    def is_running(self) -> bool:
+        return self._pid == os.getpid() and any(t.is_alive() for t in self._threads)
+
+    def ensure_running(self):
+        """Start polling unless already running in this process.
+
+        Threads do not survive ``fork``, so a poller started before a
+        pre-forking server spawns its workers is restarted in each worker.
+        """
+        with self._lock:
+            if self.is_running():
+                return
+            self._stop = threading.Event()
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(
+                    target=self._run,
+                    args=(url, interval, self._stop),
+                    name=f"feed-poller:{url.rsplit('/', 1)[-1]}",
+                    daemon=True,
+                )
+                for url, interval in self.intervals.items()
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, withdraw: bool = True):
+        """Stop polling and, by default, stop serving the polled snapshots"""
+        with self._lock:
+            self._stop.set()
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+            if withdraw:
+                for url in self.intervals:
+                    withdraw_snapshot(url)
+
+    def poll_once(self, url: str):
+        """Fetch ``url`` once and publish it; returns the current snapshot"""
+        current = latest_snapshot(url)
+        response = request_feed(url, current)
+        if response is None or (
+            current is not None
+            and peek_header_timestamp(response.content) == current.version
+        ):
+            # Unchanged feed: keep the parsed message, just note it is still fresh
+            snapshot = current.refreshed(response)
+            publish_snapshot(snapshot)
+            return snapshot
+
+        snapshot = parse_feed(url, response)
+        publish_snapshot(snapshot)
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"Error in feed listener for {url}: {e}")
+        return snapshot
+
+    def _run(self, url: str, interval: float, stop: threading.Event):
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                self.poll_once(url)
+            except requests.RequestException as e:
+                print(f"Error polling {url}: {e}")
+            except DecodeError as e:
+                print(f"Error decoding {url}: {e}")
+            stop.wait(max(0.0, interval - (time.monotonic() - started)))
+
+
+poller = FeedPoller()
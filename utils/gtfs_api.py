@@ -1,44 +1,355 @@
+import dataclasses
+import os
+import threading
+import time
+from dataclasses import dataclass
+
 import requests
 from google.transit import gtfs_realtime_pb2
 from google.protobuf.message import DecodeError
 from datetime import datetime
 
+from utils import http_client
+from utils.feed_decode import decode_feed
+from utils.metrics import cache_samples, metrics
+from utils.route_geometry import route_geometry
+from utils.shared import Inflight
+from utils.spatial import GridIndex
+from utils.trip_index import TripIndex
+from utils.vehicles import VehicleSnapshot
 
-def fetch_service_alerts():
-    """Fetch service alerts from Metro Transit GTFS realtime feed"""
-    url = "https://svc.metrotransit.org/mtgtfs/alerts.pb"
-    alerts_data = []
+# Point this at a local stand-in server (see standin_server.py) for testing
+GTFS_REALTIME_BASE_URL = os.environ.get(
+    "GTFS_REALTIME_BASE_URL", "https://svc.metrotransit.org/mtgtfs"
+)
+ALERTS_URL = f"{GTFS_REALTIME_BASE_URL}/alerts.pb"
+TRIP_UPDATES_URL = f"{GTFS_REALTIME_BASE_URL}/tripupdates.pb"
+VEHICLE_POSITIONS_URL = f"{GTFS_REALTIME_BASE_URL}/vehiclepositions.pb"
+
+# How long (in seconds) a parsed feed is served from memory before refetching
+FEED_CACHE_TTL = float(os.environ.get("FEED_CACHE_TTL", "15"))
+
+
+@dataclass(frozen=True)
+class FeedSnapshot:
+    """A parsed GTFS realtime feed together with when it was fetched"""
+
+    url: str
+    feed: gtfs_realtime_pb2.FeedMessage
+    fetched_at: float
+    etag: str = None
+    last_modified: str = None
+
+    @property
+    def version(self) -> int:
+        """Feed header timestamp, which changes whenever the publisher updates"""
+        return self.feed.header.timestamp
 
+    def age(self, now: float = None) -> float:
+        """Seconds since this snapshot was fetched"""
+        return (time.time() if now is None else now) - self.fetched_at
+
+    def refreshed(self, response: requests.Response = None) -> "FeedSnapshot":
+        """The same feed, marked as confirmed current just now.
+
+        Validators from ``response`` replace the stored ones when given.
+        """
+        if response is None:
+            return dataclasses.replace(self, fetched_at=time.time())
+        return dataclasses.replace(
+            self,
+            fetched_at=time.time(),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+
+
+def feed_name(url: str) -> str:
+    """Short name of a feed for metrics, e.g. ``vehiclepositions``"""
+    return url.rsplit("/", 1)[-1].split(".", 1)[0]
+
+
+def request_feed(url: str, previous: FeedSnapshot = None):
+    """Download a GTFS realtime feed, raising on HTTP errors.
+
+    The request is conditional on the validators of ``previous``; returns
+    None when the server answers 304 Not Modified, otherwise the response.
+    """
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-
-        for entity in feed.entity:
-            alert = entity.alert
-
-            alert_data = {
-                "id": entity.id,
-                "header": alert.header_text.translation[0].text
-                if alert.header_text.translation
-                else "No header",
-                "description": alert.description_text.translation[0].text
-                if alert.description_text.translation
-                else "No description",
-                "effect": str(alert.effect) if alert.effect else "UNKNOWN_EFFECT",
-                "cause": str(alert.cause) if alert.cause else "UNKNOWN_CAUSE",
-                "affected_routes": [
-                    entity.route_id
-                    for entity in alert.informed_entity
-                    if entity.route_id
-                ],
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        with metrics.span("fetch", feed_name(url)):
+            response = http_client.get(
+                url,
+                timeout=http_client.GTFS_REALTIME_TIMEOUT,
+                etag=previous.etag if previous else None,
+                last_modified=previous.last_modified if previous else None,
+            )
+            if response.status_code == 304 and previous is not None:
+                return None
+            response.raise_for_status()
+    except requests.RequestException as e:
+        metrics.inc(
+            "upstream_errors_total", upstream="gtfs-realtime", kind=type(e).__name__
+        )
+        raise
+    return response
+
+
+def parse_feed(url: str, response: requests.Response) -> FeedSnapshot:
+    """Parse a feed response into a snapshot, raising DecodeError if malformed"""
+    try:
+        with metrics.span("parse", feed_name(url)):
+            feed = decode_feed(response.content)
+    except DecodeError:
+        metrics.inc(
+            "upstream_errors_total", upstream="gtfs-realtime", kind="DecodeError"
+        )
+        raise
+    return FeedSnapshot(
+        url=url,
+        feed=feed,
+        fetched_at=time.time(),
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+    )
+
+
+def download_feed(url: str, previous: FeedSnapshot = None) -> FeedSnapshot:
+    """Download and parse a GTFS realtime feed, raising on HTTP or decode errors.
+
+    If the feed has not changed since ``previous``, that snapshot is reused
+    without parsing anything.
+    """
+    response = request_feed(url, previous)
+    if response is None:
+        return previous.refreshed()
+    return parse_feed(url, response)
+
+
+def _read_varint(content: bytes, pos: int):
+    result = shift = 0
+    while True:
+        byte = content[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def peek_header_timestamp(content: bytes):
+    """Read the feed header timestamp without parsing the entities.
+
+    Publishers write the header (field 1) first, so only that slice of the
+    message is decoded. Returns None if the header cannot be found there.
+    """
+    try:
+        if not content or content[0] != 0x0A:
+            return None
+        length, start = _read_varint(content, 1)
+        header = gtfs_realtime_pb2.FeedHeader()
+        header.ParseFromString(content[start : start + length])
+    except (IndexError, DecodeError):
+        return None
+    return header.timestamp if header.HasField("timestamp") else None
+
+
+class FeedCache:
+    """Keeps the last parsed feed per URL for ``ttl`` seconds.
+
+    Concurrent misses for the same URL are collapsed into a single download:
+    the first caller fetches while the others wait for its result.
+    """
+
+    def __init__(self, ttl: float = FEED_CACHE_TTL, loader=download_feed):
+        self.ttl = ttl
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._inflight = {}
+        self._counts = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    def get(self, url: str) -> FeedSnapshot:
+        """Return a fresh snapshot of ``url``, fetching it if the cached one expired"""
+        with self._lock:
+            snapshot = self._entries.get(url)
+            if snapshot is not None and snapshot.age() < self.ttl:
+                self._counts["hits"] += 1
+                return snapshot
+            inflight = self._inflight.get(url)
+            leader = inflight is None
+            if leader:
+                self._counts["misses"] += 1
+                inflight = self._inflight[url] = Inflight()
+            else:
+                self._counts["coalesced"] += 1
+        if not leader:
+            return inflight.wait()
+
+        try:
+            # The expired snapshot lets the loader make a conditional request
+            snapshot = self._loader(url, snapshot)
+        except Exception as e:
+            with self._lock:
+                self._counts["errors"] += 1
+                del self._inflight[url]
+            inflight.fail(e)
+            raise
+
+        with self._lock:
+            self._entries[url] = snapshot
+            del self._inflight[url]
+        inflight.resolve(snapshot)
+        return snapshot
+
+    def peek(self, url: str) -> FeedSnapshot:
+        """The cached snapshot of ``url``, however old, or None; never fetches"""
+        with self._lock:
+            return self._entries.get(url)
+
+    def invalidate(self, url: str = None):
+        """Drop the cached snapshot for ``url``, or every snapshot if omitted"""
+        with self._lock:
+            if url is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(url, None)
+
+    def stats(self) -> dict:
+        """Hit/miss counters plus the version and age of each cached feed"""
+        now = time.time()
+        with self._lock:
+            stats = dict(self._counts)
+            stats["feeds"] = {
+                url: {"version": snapshot.version, "age": snapshot.age(now)}
+                for url, snapshot in self._entries.items()
             }
-            alerts_data.append(alert_data)
+        return stats
+
+
+feed_cache = FeedCache()
+
+
+@metrics.collect
+def _feed_samples():
+    now = time.time()
+    samples = cache_samples("feeds", feed_cache.stats())
+    for url in (ALERTS_URL, TRIP_UPDATES_URL, VEHICLE_POSITIONS_URL):
+        snapshot = loaded_snapshot(url)
+        if snapshot is not None:
+            labels = {"feed": feed_name(url)}
+            samples.append(("feed_age_seconds", labels, round(snapshot.age(now), 3)))
+            samples.append(("feed_version", labels, snapshot.version))
+    return samples
+
+# Snapshots kept hot by the background poller (see utils/feed_poller.py)
+_published = {}
+
+
+def publish_snapshot(snapshot: FeedSnapshot):
+    """Make ``snapshot`` the one every reader of its URL sees"""
+    _published[snapshot.url] = snapshot
+
+
+def withdraw_snapshot(url: str):
+    """Stop serving the published snapshot of ``url``"""
+    _published.pop(url, None)
+
+
+def latest_snapshot(url: str) -> FeedSnapshot:
+    """The published snapshot of ``url``, or None if nothing is polling it"""
+    return _published.get(url)
+
+
+def load_feed(url: str) -> FeedSnapshot:
+    """Latest snapshot of ``url``: the polled one if available, else via the cache"""
+    snapshot = _published.get(url)
+    if snapshot is not None:
+        return snapshot
+    return feed_cache.get(url)
+
+
+def loaded_snapshot(url: str) -> FeedSnapshot:
+    """The newest snapshot of ``url`` already in memory, or None; never fetches"""
+    snapshot = _published.get(url)
+    if snapshot is not None:
+        return snapshot
+    return feed_cache.peek(url)
+
+
+def feed_version(url: str):
+    """Header timestamp of the latest snapshot of ``url``, or None if unavailable"""
+    try:
+        return load_feed(url).version
+    except (requests.RequestException, DecodeError):
+        return None
+
+
+_derived = {}
+_derived_locks = {}
+_derived_guard = threading.Lock()
+
+
+def derived(snapshot: FeedSnapshot, name: str, build):
+    """Return ``build(snapshot.feed)``, computed once per parsed feed.
+
+    Views derived from a feed (columnar vehicles, indexes, summaries) are
+    kept per URL and ``name`` and rebuilt only when a new feed version has
+    been parsed; concurrent callers wait for a single build.
+    """
+    key = (snapshot.url, name)
+    cached = _derived.get(key)
+    if cached is not None and cached[0] is snapshot.feed:
+        metrics.inc("cache_requests_total", cache="derived", result="hits")
+        return cached[1]
+    with _derived_guard:
+        lock = _derived_locks.setdefault(key, threading.Lock())
+    with lock:
+        cached = _derived.get(key)
+        if cached is not None and cached[0] is snapshot.feed:
+            metrics.inc("cache_requests_total", cache="derived", result="coalesced")
+            return cached[1]
+        metrics.inc("cache_requests_total", cache="derived", result="misses")
+        with metrics.span("transform", name):
+            value = build(snapshot.feed)
+        _derived[key] = (snapshot.feed, value)
+        return value
+
+
+def parse_service_alerts(feed) -> list:
+    """One dict per alert in a service alerts feed.
+
+    ``timestamp`` is the feed header time, when the publisher last updated it.
+    """
+    published = datetime.fromtimestamp(feed.header.timestamp).strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
+    alerts_data = []
+    for entity in feed.entity:
+        alert = entity.alert
 
-        return alerts_data
+        alert_data = {
+            "id": entity.id,
+            "header": alert.header_text.translation[0].text
+            if alert.header_text.translation
+            else "No header",
+            "description": alert.description_text.translation[0].text
+            if alert.description_text.translation
+            else "No description",
+            "effect": str(alert.effect) if alert.effect else "UNKNOWN_EFFECT",
+            "cause": str(alert.cause) if alert.cause else "UNKNOWN_CAUSE",
+            "affected_routes": [
+                entity.route_id for entity in alert.informed_entity if entity.route_id
+            ],
+            "timestamp": published,
+        }
+        alerts_data.append(alert_data)
+    return alerts_data
+
+
+def fetch_service_alerts():
+    """Fetch service alerts from Metro Transit GTFS realtime feed"""
+    try:
+        return parse_service_alerts(load_feed(ALERTS_URL).feed)
 
     except requests.exceptions.RequestException as e:
         return [{"error": f"Error fetching alerts: {e}"}]
@@ -46,63 +357,94 @@ def fetch_service_alerts():
         return [{"error": f"Error processing alerts: {e}"}]
 
 
-def fetch_vehicle_positions():
-    """Fetch and parse vehicle position data from Metro Transit"""
-    url = "https://svc.metrotransit.org/mtgtfs/vehiclepositions.pb"
-    vehicles = []
+def get_vehicle_snapshot() -> VehicleSnapshot:
+    """Columnar vehicle positions, built once per feed version"""
+    try:
+        # Fetch the parsed protobuf message, shared with other viewers
+        snapshot = load_feed(VEHICLE_POSITIONS_URL)
+        return derived(snapshot, "vehicles", VehicleSnapshot.from_feed)
+
+    except requests.RequestException as e:
+        print(f"Error fetching data: {e}")
+        return VehicleSnapshot.empty()
+    except DecodeError as e:
+        print(f"Error decoding protobuf: {e}")
+        return VehicleSnapshot.empty()
+
 
+def _grid_over(vehicles: VehicleSnapshot) -> GridIndex:
+    return GridIndex.from_points(vehicles.latitude, vehicles.longitude)
+
+
+def get_vehicle_grid():
+    """Vehicle snapshot and a spatial index over its rows, built per feed version"""
     try:
-        # Fetch the protobuf data
-        response = requests.get(url)
-        response.raise_for_status()
-
-        # Parse the protobuf message
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-
-        # Process each vehicle position
-        for entity in feed.entity:
-            vehicle = entity.vehicle
-
-            # Convert timestamp to readable format
-            timestamp = datetime.fromtimestamp(vehicle.timestamp)
-
-            # Create vehicle dictionary
-            vehicle_data = {
-                "vehicle_id": vehicle.vehicle.id,
-                "trip_id": vehicle.trip.trip_id,
-                "route_id": vehicle.trip.route_id,
-                "latitude": vehicle.position.latitude,
-                "longitude": vehicle.position.longitude,
-                "speed": vehicle.position.speed
-                if vehicle.position.HasField("speed")
-                else "N/A",
-                "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            }
-            vehicles.append(vehicle_data)
+        snapshot = load_feed(VEHICLE_POSITIONS_URL)
+        vehicles = derived(snapshot, "vehicles", VehicleSnapshot.from_feed)
+        grid = derived(snapshot, "vehicle_grid", lambda _: _grid_over(vehicles))
+        return vehicles, grid
 
-        return vehicles
+    except requests.RequestException as e:
+        print(f"Error fetching data: {e}")
+    except DecodeError as e:
+        print(f"Error decoding protobuf: {e}")
+    vehicles = VehicleSnapshot.empty()
+    return vehicles, _grid_over(vehicles)
+
+
+def _progress_of(vehicles: VehicleSnapshot) -> dict:
+    return route_geometry().lines.match(
+        vehicles.route_id, vehicles.direction_id, vehicles.latitude, vehicles.longitude
+    )
+
+
+def get_vehicle_progress():
+    """Vehicle snapshot and each vehicle's place on its route's line.
+
+    Every vehicle is matched to the line through its route and direction's
+    stops once per feed version (see ``RouteLines.match``).
+    """
+    try:
+        snapshot = load_feed(VEHICLE_POSITIONS_URL)
+        vehicles = derived(snapshot, "vehicles", VehicleSnapshot.from_feed)
+        progress = derived(
+            snapshot, "vehicle_progress", lambda _: _progress_of(vehicles)
+        )
+        return vehicles, progress
 
     except requests.RequestException as e:
         print(f"Error fetching data: {e}")
-        return []
     except DecodeError as e:
         print(f"Error decoding protobuf: {e}")
-        return []
+    vehicles = VehicleSnapshot.empty()
+    return vehicles, _progress_of(vehicles)
+
+
+def vehicles_in_bbox(min_lat, min_lon, max_lat, max_lon) -> VehicleSnapshot:
+    """Current vehicles inside a latitude/longitude box"""
+    vehicles, grid = get_vehicle_grid()
+    return vehicles.select(grid.in_bbox(min_lat, min_lon, max_lat, max_lon))
+
+
+def vehicles_near(latitude, longitude, k: int = 5, max_distance: float = None):
+    """The ``k`` current vehicles nearest a point, and their distances in meters"""
+    vehicles, grid = get_vehicle_grid()
+    rows, distances = grid.nearest(latitude, longitude, k, max_distance)
+    return vehicles.select(rows), distances
+
+
+def fetch_vehicle_positions():
+    """Fetch and parse vehicle position data from Metro Transit"""
+    return get_vehicle_snapshot().to_records()
 
 
 def fetch_trip_updates():
     """Fetch GTFS realtime trip updates from Metro Transit"""
-    url = "https://svc.metrotransit.org/mtgtfs/tripupdates.pb"
     try:
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"Error fetching data: {response.status_code}")
-            return None
-
-        feed = gtfs_realtime_pb2.FeedMessage()
-        feed.ParseFromString(response.content)
-        return feed
+        return load_feed(TRIP_UPDATES_URL).feed
+    except requests.HTTPError as e:
+        print(f"Error fetching data: {e.response.status_code}")
+        return None
     except Exception as e:
         print(f"Error: {e}")
         return None
@@ -113,12 +455,11 @@ def format_timestamp(timestamp):
     return datetime.fromtimestamp(timestamp).strftime("%I:%M %p")
 
 
-def get_trip_updates():
-    """Get trip updates in a format suitable for the template"""
-    feed = fetch_trip_updates()
-    if not feed:
-        return []
+def trip_update_times(feed) -> list:
+    """One dict per trip in a trip updates feed, with its next stop.
 
+    ``arrival`` and ``departure`` are POSIX seconds, or None if not given.
+    """
     updates = []
     for entity in feed.entity:
         if entity.HasField("trip_update"):
@@ -135,13 +476,86 @@ def get_trip_updates():
                 if trip.HasField("schedule_relationship")
                 else "SCHEDULED",
                 "stop_id": stop_time.stop_id if stop_time else "N/A",
-                "arrival": format_timestamp(stop_time.arrival.time)
+                "arrival": stop_time.arrival.time
                 if stop_time and stop_time.HasField("arrival")
-                else "N/A",
-                "departure": format_timestamp(stop_time.departure.time)
+                else None,
+                "departure": stop_time.departure.time
                 if stop_time and stop_time.HasField("departure")
-                else "N/A",
+                else None,
             }
             updates.append(update)
 
     return updates
+
+
+def parse_trip_updates(feed) -> list:
+    """One dict per trip in a trip updates feed, showing its next stop"""
+    return [
+        dict(
+            update,
+            **{
+                key: "N/A" if update[key] is None else format_timestamp(update[key])
+                for key in ("arrival", "departure")
+            },
+        )
+        for update in trip_update_times(feed)
+    ]
+
+
+def get_trip_updates():
+    """Get trip updates in a format suitable for the template"""
+    feed = fetch_trip_updates()
+    if not feed:
+        return []
+    return parse_trip_updates(feed)
+
+
+def get_trip_index() -> TripIndex:
+    """All predicted stop times, indexed by stop and trip once per feed version"""
+    try:
+        snapshot = load_feed(TRIP_UPDATES_URL)
+        return derived(snapshot, "trip_index", TripIndex.from_feed)
+
+    except requests.RequestException as e:
+        print(f"Error fetching data: {e}")
+        return TripIndex.empty()
+    except DecodeError as e:
+        print(f"Error decoding protobuf: {e}")
+        return TripIndex.empty()
+
+
+def _entity_counter(field: str):
+    def count(feed) -> int:
+        return sum(1 for entity in feed.entity if entity.HasField(field))
+
+    return count
+
+
+# Summary name -> (feed URL, count of the feed's items)
+SUMMARY_COUNTS = {
+    "alerts": (ALERTS_URL, _entity_counter("alert")),
+    "vehicles": (VEHICLE_POSITIONS_URL, _entity_counter("vehicle")),
+    "trips": (TRIP_UPDATES_URL, _entity_counter("trip_update")),
+}
+
+
+def feed_summary() -> dict:
+    """Counts of alerts, vehicles and trips from the feeds already in memory.
+
+    Each count is computed once per feed version, and nothing is fetched: a
+    feed that has not been loaded yet reports None. Also gives each feed's
+    version and age in seconds.
+    """
+    summary = {}
+    now = time.time()
+    for name, (url, count) in SUMMARY_COUNTS.items():
+        snapshot = loaded_snapshot(url)
+        if snapshot is None:
+            summary[name] = {"count": None, "version": None, "age": None}
+            continue
+        summary[name] = {
+            "count": derived(snapshot, f"count:{name}", count),
+            "version": snapshot.version,
+            "age": round(snapshot.age(now), 1),
+        }
+    return summary
@@ -0,0 +1,137 @@
+import numpy as np
+
+from utils.spatial import haversine
+
+# A headway shorter than this fraction of its route's median is bunching
+BUNCHING_RATIO = 0.25
+# Vehicles of one route and direction closer than this are bunched right now
+BUNCHING_DISTANCE_M = 400.0
+
+
+def _group_keys(route_ids, direction_ids) -> np.ndarray:
+    # "route/direction" per row, so both can be grouped by with np.unique
+    return np.char.add(
+        np.char.add(np.asarray(route_ids, dtype=str), "/"),
+        np.asarray(direction_ids).astype(str),
+    )
+
+
+def stop_headways(arrivals: dict) -> dict:
+    """Seconds between consecutive vehicles arriving at each stop.
+
+    ``arrivals`` are columns from ``TrajectoryStore.arrivals``. Returns the
+    ``stop``, ``timestamp`` and ``vehicle`` of each follower, its
+    ``leader`` and the ``headway``. Repeat arrivals of one vehicle (a
+    single vehicle on the route, back on a later trip) are not headways.
+    """
+    order = np.lexsort((arrivals["timestamp"], arrivals["stop"]))
+    stop = arrivals["stop"][order]
+    timestamp = arrivals["timestamp"][order]
+    slot = arrivals["slot"][order]
+    pairs = (stop[1:] == stop[:-1]) & (slot[1:] != slot[:-1])
+    return {
+        "stop": stop[1:][pairs],
+        "timestamp": timestamp[1:][pairs],
+        "vehicle": slot[1:][pairs],
+        "leader": slot[:-1][pairs],
+        "headway": np.diff(timestamp)[pairs],
+    }
+
+
+def bunched_pairs(vehicles, distance: float = BUNCHING_DISTANCE_M) -> list:
+    """Pairs of vehicles on the same route and direction within ``distance``.
+
+    One dict per pair, closest first, from a ``VehicleSnapshot``.
+    """
+    keys = _group_keys(vehicles.route_id, vehicles.direction_id)
+    groups, group = np.unique(keys, return_inverse=True)
+    counts = np.bincount(group, minlength=len(groups))
+    pairs = []
+    for code in np.flatnonzero(counts > 1).tolist():
+        rows = np.flatnonzero(group == code)
+        lat, lon = vehicles.latitude[rows], vehicles.longitude[rows]
+        meters = haversine(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+        first, second = np.nonzero(np.triu(meters <= distance, k=1))
+        route_id, direction_id = groups[code].rsplit("/", 1)
+        for a, b in zip(first.tolist(), second.tolist()):
+            pairs.append(
+                {
+                    "route_id": route_id,
+                    "direction_id": int(direction_id),
+                    "vehicles": f"{vehicles.vehicle_id[rows[a]]}, "
+                    f"{vehicles.vehicle_id[rows[b]]}",
+                    "distance": round(float(meters[a, b])),
+                }
+            )
+    return sorted(pairs, key=lambda pair: pair["distance"])
+
+
+def route_summary(store, vehicles) -> list:
+    """Speed, headway and bunching figures per route and direction.
+
+    Speeds and headways come from a ``TrajectoryStore`` with geometry and
+    current vehicle counts and bunching from ``vehicles``, the latest
+    snapshot. One dict per route and direction with vehicles now or
+    headways in the store's window, in route order.
+    """
+    rows = {}
+
+    def row(key):
+        if key not in rows:
+            route_id, direction_id = key.rsplit("/", 1)
+            rows[key] = {
+                "route_id": route_id,
+                "direction_id": int(direction_id),
+                "vehicles": 0,
+                "speed": None,
+                "headway": None,
+                "regularity": None,
+                "headways": 0,
+                "bunched": None,
+                "bunched_now": 0,
+            }
+        return rows[key]
+
+    keys, counts = np.unique(
+        _group_keys(vehicles.route_id, vehicles.direction_id), return_counts=True
+    )
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        row(key)["vehicles"] = count
+    for pair in bunched_pairs(vehicles):
+        row(f"{pair['route_id']}/{pair['direction_id']}")["bunched_now"] += 1
+
+    speeds = store.speeds()
+    if len(speeds["slot"]):
+        names = np.asarray(store.route_ids, dtype=str)[speeds["route"]]
+        keys, group = np.unique(
+            _group_keys(names, speeds["direction"]), return_inverse=True
+        )
+        for code, key in enumerate(keys.tolist()):
+            if key in rows:
+                speed = np.median(speeds["speed"][group == code]) * 3.6
+                rows[key]["speed"] = round(float(speed), 1)
+
+    headways = stop_headways(store.arrivals())
+    if len(headways["stop"]):
+        stops = store.geometry.stops[headways["stop"]]
+        keys, group = np.unique(
+            _group_keys(stops["route_id"], stops["direction_id"]), return_inverse=True
+        )
+        for code, key in enumerate(keys.tolist()):
+            seconds = headways["headway"][group == code].astype(np.float64)
+            median = np.median(seconds)
+            summary = row(key)
+            summary["headway"] = round(float(median) / 60, 1)
+            mean = seconds.mean()
+            if mean > 0:
+                summary["regularity"] = round(float(seconds.std() / mean), 2)
+            summary["headways"] = len(seconds)
+            bunched = np.count_nonzero(seconds < BUNCHING_RATIO * median)
+            summary["bunched"] = round(100 * bunched / len(seconds), 1)
+
+    def order(summary):
+        route_id = summary["route_id"]
+        number = int(route_id) if route_id.isdigit() else float("inf")
+        return number, route_id, summary["direction_id"]
+
+    return sorted(rows.values(), key=order)
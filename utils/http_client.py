@@ -0,0 +1,102 @@
+import email.utils
+import os
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts in seconds for each upstream endpoint
+GTFS_REALTIME_TIMEOUT = (3.05, 10)
+NEXTRIP_TIMEOUT = (3.05, 5)
+DEFAULT_TIMEOUT = (3.05, 15)
+
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.25  # seconds
+BACKOFF_CAP = 4.0  # seconds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _new_session() -> requests.Session:
+    session = requests.Session()
+    # Keep connections to svc.metrotransit.org alive and shared between threads
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+session = _new_session()
+
+
+def _reset_session():
+    global session
+    session = _new_session()
+
+
+# A forked worker must not reuse keep-alive sockets opened by its parent
+os.register_at_fork(after_in_child=_reset_session)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number ``attempt`` (from 0)"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+
+def retry_after(response: requests.Response):
+    """Seconds the server asked to wait in ``Retry-After``, or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, moment.timestamp() - time.time())
+
+
+def get(
+    url: str,
+    *,
+    headers: dict = None,
+    timeout=DEFAULT_TIMEOUT,
+    etag: str = None,
+    last_modified: str = None,
+    retries: int = MAX_RETRIES,
+) -> requests.Response:
+    """GET ``url`` through the shared pooled session.
+
+    Connection errors, timeouts and retryable statuses are retried with
+    jittered backoff, waiting at least as long as a ``Retry-After`` header
+    asks. A response asking for more than ``BACKOFF_CAP`` is returned
+    without retrying, so callers fall back on what they have. Otherwise the
+    last error is raised, or the last response returned.
+    Passing the ``etag``/``last_modified`` of a previous response makes the
+    request conditional, so an unchanged resource comes back as a bodiless 304.
+    """
+    headers = dict(headers or {})
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    for attempt in range(retries + 1):
+        delay = backoff_delay(attempt)
+        try:
+            response = session.get(url, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            asked = retry_after(response)
+            if asked is not None:
+                if asked > BACKOFF_CAP:
+                    return response
+                delay = max(delay, asked)
+            response.close()
+        time.sleep(delay)
@@ -0,0 +1,182 @@
+import numpy as np
+
+from utils.spatial import EARTH_RADIUS_M
+
+# Vehicles farther than this from their line are not matched to it
+MATCH_MAX_OFFSET_M = 500.0
+# Every line's stops are sorted in one array by line * _LINE_SPAN + distance
+_LINE_SPAN = 1e8
+
+
+class RouteLines:
+    """The line through each route direction's stops, for map matching.
+
+    Every line's segments (consecutive stops with a position) are kept in
+    flat arrays in a local planar projection, in meters. ``table`` lists
+    each line's segment indexes padded with -1 to the longest line, so
+    vehicles on different lines are projected in one batched pass: each
+    vehicle is tested against every segment of its own line at once.
+    """
+
+    def __init__(
+        self, keys, offsets, segments, stop_rows, stop_distances, reference_lat
+    ):
+        self.keys = keys
+        self._lines = {key: line for line, key in enumerate(keys)}
+        self.offsets = offsets
+        # Per line: geometry rows of its stops, and their distance along it
+        self.stop_rows = stop_rows
+        self.stop_distances = stop_distances
+        self.reference_lat = reference_lat
+        (
+            self.start_x,
+            self.start_y,
+            self.delta_x,
+            self.delta_y,
+            self.start_distance,
+            self.end_stop,
+        ) = segments
+        self.length = np.array([distances[-1] for distances in stop_distances])
+        self._stop_keys = np.concatenate(
+            [line * _LINE_SPAN + d for line, d in enumerate(stop_distances)]
+            or [np.empty(0)]
+        )
+        self._stop_rows = np.concatenate(stop_rows or [np.empty(0, np.int64)])
+        width = max(np.diff(offsets).max(initial=0), 1)
+        self.table = np.full((len(keys), width), -1, dtype=np.int64)
+        for line, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+            self.table[line, : end - start] = np.arange(start, end)
+
+    @classmethod
+    def from_geometry(cls, geometry) -> "RouteLines":
+        stops = geometry.stops
+        latitude = np.asarray(stops["latitude"], dtype=np.float64)
+        longitude = np.asarray(stops["longitude"], dtype=np.float64)
+        known = np.isfinite(latitude) & np.isfinite(longitude)
+        reference_lat = float(latitude[known].mean()) if known.any() else 0.0
+        x, y = _project(latitude, longitude, reference_lat)
+
+        keys, offsets, stop_rows, stop_distances = [], [0], [], []
+        columns = [[] for _ in range(6)]
+        for route_id in geometry.routes():
+            for direction_id in geometry.directions(route_id):
+                span = geometry.span(route_id, direction_id)
+                rows = np.arange(span.start, span.stop)[known[span]]
+                if len(rows) < 2:
+                    continue
+                dx, dy = np.diff(x[rows]), np.diff(y[rows])
+                along = np.concatenate(([0.0], np.cumsum(np.hypot(dx, dy))))
+                for column, values in zip(
+                    columns,
+                    (x[rows[:-1]], y[rows[:-1]], dx, dy, along[:-1], rows[1:]),
+                ):
+                    column.append(values)
+                keys.append((route_id, direction_id))
+                offsets.append(offsets[-1] + len(rows) - 1)
+                stop_rows.append(rows)
+                stop_distances.append(along)
+
+        segments = tuple(
+            np.concatenate(column) if column else np.empty(0, dtype)
+            for column, dtype in zip(columns, [np.float64] * 5 + [np.int64])
+        )
+        return cls(
+            keys, np.array(offsets), segments, stop_rows, stop_distances, reference_lat
+        )
+
+    def line(self, route_id: str, direction_id: int) -> int:
+        """Index of a route direction's line, or -1 if it has none"""
+        return self._lines.get((str(route_id), int(direction_id)), -1)
+
+    def match(self, route_ids, direction_ids, latitude, longitude) -> dict:
+        """Project each vehicle onto the line of its route and direction.
+
+        Returns one entry per vehicle: ``line`` (index into ``keys``),
+        ``distance`` along the line and ``offset`` from it in meters, and
+        ``next_stop``, the geometry row of the next stop ahead. Vehicles
+        without a line, or more than ``MATCH_MAX_OFFSET_M`` from it, get -1
+        and NaN.
+        """
+        count = len(latitude)
+        lines = np.fromiter(
+            (
+                self._lines.get((route_id, direction_id), -1)
+                for route_id, direction_id in zip(
+                    np.asarray(route_ids, dtype=str).tolist(),
+                    np.asarray(direction_ids).tolist(),
+                )
+            ),
+            dtype=np.int64,
+            count=count,
+        )
+        result = {
+            "line": np.full(count, -1, dtype=np.int64),
+            "distance": np.full(count, np.nan),
+            "offset": np.full(count, np.nan),
+            "next_stop": np.full(count, -1, dtype=np.int64),
+        }
+        rows = np.flatnonzero(lines >= 0)
+        if not len(rows):
+            return result
+
+        x, y = _project(
+            np.asarray(latitude, dtype=np.float64)[rows],
+            np.asarray(longitude, dtype=np.float64)[rows],
+            self.reference_lat,
+        )
+        # (vehicle, segment of its line) for every segment at once
+        segment = self.table[lines[rows]]
+        padding = segment < 0
+        segment = np.where(padding, 0, segment)
+        dx, dy = self.delta_x[segment], self.delta_y[segment]
+        px = x[:, None] - self.start_x[segment]
+        py = y[:, None] - self.start_y[segment]
+        squared = dx * dx + dy * dy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.clip((px * dx + py * dy) / squared, 0.0, 1.0)
+        t[squared == 0] = 0.0
+        offset = np.hypot(px - t * dx, py - t * dy)
+        offset[padding] = np.inf
+
+        best = np.argmin(offset, axis=1)
+        pick = np.arange(len(rows))
+        offset = offset[pick, best]
+        t = t[pick, best]
+        segment = segment[pick, best]
+        matched = offset <= MATCH_MAX_OFFSET_M
+        rows, segment, t = rows[matched], segment[matched], t[matched]
+
+        result["line"][rows] = lines[rows]
+        result["offset"][rows] = offset[matched]
+        result["distance"][rows] = self.start_distance[segment] + t * np.sqrt(
+            squared[pick, best][matched]
+        )
+        result["next_stop"][rows] = self.end_stop[segment]
+        return result
+
+    def stops_between(self, lines, start, end):
+        """Stops passed moving along each line from ``start`` to ``end`` meters.
+
+        Stops after ``start`` up to and including ``end`` are passed, so
+        consecutive moves pass each stop once. A line's first stop, where
+        vehicles lay over, is never passed. Returns one entry per stop
+        passed: the index of its move, its geometry row and its distance.
+        """
+        base = np.asarray(lines) * _LINE_SPAN
+        first = np.searchsorted(self._stop_keys, base + start, side="right")
+        last = np.searchsorted(self._stop_keys, base + end, side="right")
+        counts = np.maximum(last - first, 0)
+        move = np.repeat(np.arange(len(base)), counts)
+        # Position of each stop passed in ``_stop_keys``
+        index = np.repeat(first - np.cumsum(counts) + counts, counts)
+        index += np.arange(len(move))
+        return move, self._stop_rows[index], self._stop_keys[index] - base[move]
+
+
+def _project(latitude, longitude, reference_lat):
+    # Equirectangular projection about ``reference_lat``; well under 1%
+    # error across a metro area
+    scale = np.radians(1.0) * EARTH_RADIUS_M
+    x = np.asarray(longitude) * scale * np.cos(np.radians(reference_lat))
+    y = np.asarray(latitude) * scale
+    return x, y
@@ -0,0 +1,157 @@
+import functools
+import json
+import os
+import threading
+import time
+
+from utils.metrics import metrics
+from utils.nextrip_api import MetroTransitAPI
+from utils.shared import connect, open_store
+
+METADATA_CACHE_PATH = os.environ.get(
+    "METADATA_CACHE_PATH", os.path.join("data", "nextrip_metadata.sqlite3")
+)
+# Routes, directions, agencies and stop lists change a few times a day at most
+METADATA_TTL = float(os.environ.get("METADATA_TTL", str(6 * 60 * 60)))
+# How long one process may take to refresh an entry before another may try
+REFRESH_LEASE = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+
+class MetadataCache:
+    """NexTrip responses stored in SQLite and shared by every worker process.
+
+    Entries younger than ``ttl`` are served as is. Older entries are still
+    served immediately while one process, holding a short lease recorded in
+    the database, refreshes them in the background (stale-while-revalidate).
+    Only a key that was never fetched waits for upstream. Decoded values are
+    kept in memory until the stored entry changes, so a hit returns the same
+    object each time.
+    """
+
+    def __init__(self, path: str = METADATA_CACHE_PATH, ttl: float = METADATA_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._memory = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        open_store(path, _SCHEMA)
+
+    def _store(self, key: str, value):
+        fetched_at = time.time()
+        with connect(self.path) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, body, fetched_at, lease_until)"
+                " VALUES (?, ?, ?, 0)",
+                (key, json.dumps(value), fetched_at),
+            )
+        with self._lock:
+            self._memory[key] = (fetched_at, value)
+
+    def _claim_refresh(self, key: str, fetched_at: float) -> bool:
+        # Take the lease unless another process holds it or already refreshed
+        now = time.time()
+        with connect(self.path) as db:
+            cursor = db.execute(
+                "UPDATE responses SET lease_until = ?"
+                " WHERE key = ? AND fetched_at = ? AND lease_until < ?",
+                (now + REFRESH_LEASE, key, fetched_at, now),
+            )
+            return cursor.rowcount == 1
+
+    def _refresh(self, key: str, fetch):
+        try:
+            self._store(key, fetch())
+        except Exception as e:
+            print(f"Error refreshing cached {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key: str, fetch):
+        """The cached value for ``key``, calling ``fetch()`` to fill or refresh it"""
+        with connect(self.path) as db:
+            row = db.execute(
+                "SELECT fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        with self._lock:
+            cached = self._memory.get(key)
+        if row is not None and (cached is None or cached[0] != row[0]):
+            with connect(self.path) as db:
+                # The entry may have been invalidated since the first read
+                row = db.execute(
+                    "SELECT fetched_at, body FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None:
+                cached = (row[0], json.loads(row[1]))
+                with self._lock:
+                    self._memory[key] = cached
+        if row is None:
+            metrics.inc("cache_requests_total", cache="metadata", result="misses")
+            value = fetch()
+            self._store(key, value)
+            return value
+
+        fetched_at = cached[0]
+        stale = time.time() - fetched_at >= self.ttl
+        metrics.inc(
+            "cache_requests_total", cache="metadata", result="stale" if stale else "hits"
+        )
+        if stale:
+            with self._lock:
+                start = key not in self._refreshing
+                if start:
+                    self._refreshing.add(key)
+            if start and self._claim_refresh(key, fetched_at):
+                threading.Thread(
+                    target=self._refresh, args=(key, fetch), daemon=True
+                ).start()
+            elif start:
+                with self._lock:
+                    self._refreshing.discard(key)
+        return cached[1]
+
+    def invalidate(self, prefix: str = ""):
+        """Forget every entry whose key starts with ``prefix`` (all by default)"""
+        with connect(self.path) as db:
+            db.execute(
+                "DELETE FROM responses WHERE substr(key, 1, ?) = ?",
+                (len(prefix), prefix),
+            )
+        with self._lock:
+            for key in [k for k in self._memory if k.startswith(prefix)]:
+                del self._memory[key]
+
+
+class CachedMetroTransitAPI(MetroTransitAPI):
+    """MetroTransitAPI whose slow-changing metadata comes from a MetadataCache.
+
+    Routes, agencies, directions and stop lists are cached; departures,
+    vehicles and stop details always go upstream.
+    """
+
+    def __init__(self, cache: MetadataCache = None):
+        super().__init__()
+        self.cache = cache or MetadataCache()
+
+    def get_routes(self):
+        return self.cache.get("routes", super().get_routes)
+
+    def get_agencies(self):
+        return self.cache.get("agencies", super().get_agencies)
+
+    def get_directions(self, route_id: str):
+        fetch = functools.partial(super().get_directions, route_id)
+        return self.cache.get(f"directions/{route_id}", fetch)
+
+    def get_stops(self, route_id: str, direction_id: int):
+        fetch = functools.partial(super().get_stops, route_id, direction_id)
+        return self.cache.get(f"stops/{route_id}/{direction_id}", fetch)
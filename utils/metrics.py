@@ -0,0 +1,183 @@
+import bisect
+import contextlib
+import functools
+import os
+import threading
+import time
+
+NAMESPACE = "metro_transit"
+# Upper bounds (seconds) of the duration buckets, from protobuf parses
+# (well under a millisecond) to slow upstream requests
+DURATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+HELP = {
+    "stage_seconds": "Time spent in each stage of serving the dashboard",
+    "upstream_errors_total": "Failed requests to upstream services, by kind",
+    "cache_requests_total": "Cache lookups, by cache and result",
+    "requests_in_flight": "HTTP requests this process is serving right now",
+    "feed_age_seconds": "Seconds since each feed was last confirmed current",
+    "feed_version": "Header timestamp of the feed being served",
+    "stream_clients": "Open server-sent event streams in this process",
+    "stream_events_total": "Vehicle update events handed to open streams",
+    "render_cache_bytes": "Serialized renders this process keeps in memory",
+    "trajectory_samples": "Vehicle positions held in the trajectory store",
+    "alerts_active": "Service alerts in the latest alerts feed version",
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """Counters, gauges and stage-duration histograms for this process.
+
+    Values are kept in memory and rendered in the Prometheus text format by
+    ``render``. Gunicorn workers each have their own, so every series
+    carries a ``pid`` label and a scrape of any worker never looks like a
+    counter reset. Components that already keep counters report them
+    through ``collect`` callbacks run at scrape time.
+    """
+
+    def __init__(self, namespace: str = NAMESPACE, buckets=DURATION_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Add ``amount`` to the counter or gauge ``name`` with ``labels``"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, name: str, amount: float = 1, **labels):
+        self.inc(name, -amount, **labels)
+
+    def observe(self, stage: str, name: str, seconds: float):
+        """Record that ``stage`` of ``name`` took ``seconds``"""
+        key = (("name", name), ("stage", stage))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                histogram[0][index] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextlib.contextmanager
+    def span(self, stage: str, name: str):
+        """Time the block as ``stage`` of ``name``, whether or not it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, name, time.perf_counter() - start)
+
+    def timed(self, stage: str, name: str):
+        """Decorator timing every call of a function as ``stage`` of ``name``"""
+
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(stage, name):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def collect(self, collector):
+        """Call ``collector()`` at every scrape; it yields (name, labels, value)"""
+        self._collectors.append(collector)
+        return collector
+
+    def _samples(self):
+        with self._lock:
+            samples = [
+                (name, dict(labels), value)
+                for (name, labels), value in self._values.items()
+            ]
+        for collector in self._collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                print(f"Error collecting metrics from {collector.__name__}: {e}")
+        return samples
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        pid = ("pid", str(os.getpid()))
+        grouped = {}
+        for name, labels, value in self._samples():
+            grouped.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(grouped):
+            metric = f"{self.namespace}_{name}"
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for labels, value in grouped[name]:
+                label_pairs = sorted(labels.items()) + [pid]
+                lines.append(f"{metric}{_format_labels(label_pairs)} {value}")
+
+        metric = f"{self.namespace}_stage_seconds"
+        with self._lock:
+            histograms = {
+                key: (list(counts), total, count)
+                for key, (counts, total, count) in self._histograms.items()
+            }
+        if histograms:
+            lines.append(f"# HELP {metric} {HELP['stage_seconds']}")
+            lines.append(f"# TYPE {metric} histogram")
+        for key in sorted(histograms):
+            counts, total, count = histograms[key]
+            labels = list(key) + [pid]
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                le = _format_labels(labels + [("le", repr(bound))])
+                lines.append(f"{metric}_bucket{le} {cumulative}")
+            le = _format_labels(labels + [("le", "+Inf")])
+            lines.append(f"{metric}_bucket{le} {count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def cache_samples(cache: str, stats: dict, results=("hits", "misses", "coalesced")):
+    """cache_requests_total samples from a cache's ``stats()`` counters"""
+    return [
+        ("cache_requests_total", {"cache": cache, "result": result}, stats[result])
+        for result in results
+        if result in stats
+    ]
@@ -1,42 +1,86 @@
-import requests
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 
+import requests
+
+from utils import http_client
+from utils.metrics import metrics
+
+# Requests an AsyncMetroTransitAPI keeps in flight at once; stays below the
+# shared session's per-host connection pool so no request waits for a socket
+MAX_CONCURRENT_REQUESTS = 16
+
+NEXTRIP_BASE_URL = os.environ.get(
+    "NEXTRIP_BASE_URL", "https://svc.metrotransit.org/nextrip"
+)
+
+# NexTrip endpoints whose path starts with their name
+NAMED_ENDPOINTS = {"agencies", "directions", "routes", "stops", "vehicles"}
+
+
+def _endpoint(path: str) -> str:
+    # Endpoint of a request path without its ids, to label metrics by
+    first = path.split("/", 1)[0]
+    if first in NAMED_ENDPOINTS:
+        return first
+    return "departures" if first == path else "stop-details"
+
 
 class MetroTransitAPI:
     def __init__(self):
-        self.base_url = "https://svc.metrotransit.org/nextrip"
+        self.base_url = NEXTRIP_BASE_URL
+
+    def _get(self, path: str):
+        """GET a NexTrip endpoint through the shared pooled session.
+
+        Raises ``requests.HTTPError`` on error statuses, so error bodies are
+        never returned (or cached) as data.
+        """
+        endpoint = _endpoint(path)
+        try:
+            with metrics.span("fetch", f"nextrip:{endpoint}"):
+                response = http_client.get(
+                    f"{self.base_url}/{path}",
+                    headers={"Accept": "application/json"},
+                    timeout=http_client.NEXTRIP_TIMEOUT,
+                )
+        except requests.RequestException as e:
+            metrics.inc(
+                "upstream_errors_total", upstream="nextrip", kind=type(e).__name__
+            )
+            raise
+        if response.status_code >= 400:
+            metrics.inc(
+                "upstream_errors_total",
+                upstream="nextrip",
+                kind=str(response.status_code),
+            )
+            response.raise_for_status()
+        return response
 
     def get_routes(self) -> List[Dict]:
         """Get all available routes"""
-        response = requests.get(
-            f"{self.base_url}/routes", headers={"Accept": "application/json"}
-        )
+        response = self._get("routes")
         return response.json()
 
     def get_directions(self, route_id: str) -> List[Dict]:
         """Get directions for a specific route"""
-        response = requests.get(
-            f"{self.base_url}/directions/{route_id}",
-            headers={"Accept": "application/json"},
-        )
+        response = self._get(f"directions/{route_id}")
         return response.json()
 
     def get_stops(self, route_id: str, direction_id: int) -> List[Dict]:
         """Get stops for a route and direction"""
-        response = requests.get(
-            f"{self.base_url}/stops/{route_id}/{direction_id}",
-            headers={"Accept": "application/json"},
-        )
+        response = self._get(f"stops/{route_id}/{direction_id}")
         return response.json()
 
     def get_stop_details(
         self, route_id: str, direction_id: int, place_code: str
     ) -> Dict:
         """Get details for a specific stop by its route_id, direction_id, and place_code"""
-        response = requests.get(
-            f"{self.base_url}/{route_id}/{direction_id}/{place_code}",
-            headers={"Accept": "application/json"},
-        )
+        response = self._get(f"{route_id}/{direction_id}/{place_code}")
         data = response.json()
         # According to the schema, the stop details are in a 'stops' array
         if (
@@ -52,22 +96,84 @@ class MetroTransitAPI:
 
     def get_agencies(self) -> List[Dict]:
         """Get all transit agencies"""
-        response = requests.get(
-            f"{self.base_url}/agencies", headers={"Accept": "application/json"}
-        )
+        response = self._get("agencies")
         return response.json()
 
     def get_departures_by_stop(self, stop_id: int) -> Dict:
         """Get departures, stops, and alerts for a given stop_id"""
-        response = requests.get(
-            f"{self.base_url}/{stop_id}", headers={"Accept": "application/json"}
-        )
+        response = self._get(str(stop_id))
         return response.json()
 
     def get_vehicles(self, route_id: str) -> List[Dict]:
         """Get vehicle positions for a specific route"""
-        response = requests.get(
-            f"{self.base_url}/vehicles/{route_id}",
-            headers={"Accept": "application/json"},
-        )
+        response = self._get(f"vehicles/{route_id}")
         return response.json()
+
+
+class AsyncMetroTransitAPI:
+    """asyncio version of MetroTransitAPI for fanning out many lookups.
+
+    Each method has the same name and arguments as on MetroTransitAPI but is
+    a coroutine. Requests run on a worker pool over the shared pooled HTTP
+    session, with at most ``max_concurrency`` in flight; the pool is released
+    when the client is used as an ``async with`` block or ``close`` is called.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_REQUESTS):
+        self._api = MetroTransitAPI()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_concurrency, thread_name_prefix="nextrip-async"
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    async def _call(self, method, *args):
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(method, *args)
+            )
+
+    async def get_routes(self) -> List[Dict]:
+        return await self._call(self._api.get_routes)
+
+    async def get_directions(self, route_id: str) -> List[Dict]:
+        return await self._call(self._api.get_directions, route_id)
+
+    async def get_stops(self, route_id: str, direction_id: int) -> List[Dict]:
+        return await self._call(self._api.get_stops, route_id, direction_id)
+
+    async def get_stop_details(
+        self, route_id: str, direction_id: int, place_code: str
+    ) -> Dict:
+        return await self._call(
+            self._api.get_stop_details, route_id, direction_id, place_code
+        )
+
+    async def get_agencies(self) -> List[Dict]:
+        return await self._call(self._api.get_agencies)
+
+    async def get_departures_by_stop(self, stop_id: int) -> Dict:
+        return await self._call(self._api.get_departures_by_stop, stop_id)
+
+    async def get_vehicles(self, route_id: str) -> List[Dict]:
+        return await self._call(self._api.get_vehicles, route_id)
+
+    async def get_many_stop_details(self, stops: List[tuple]) -> List[Dict]:
+        """Details for many (route_id, direction_id, place_code) stops at once.
+
+        Results are in the order of ``stops``; a stop whose request failed
+        gets None instead of failing the whole batch.
+        """
+        results = await asyncio.gather(
+            *(self.get_stop_details(*stop) for stop in stops), return_exceptions=True
+        )
+        return [None if isinstance(r, Exception) else r for r in results]
@@ -0,0 +1,218 @@
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+from plotly.io.json import to_json_plotly
+
+from utils.gtfs_api import feed_version, loaded_snapshot
+from utils.metrics import metrics
+from utils.shared import Inflight, connect, open_store
+
+RENDER_CACHE_PATH = os.environ.get(
+    "RENDER_CACHE_PATH", os.path.join("data", "render_cache.sqlite3")
+)
+# Serialized renders each worker keeps in memory, in bytes
+RENDER_CACHE_BYTES = int(os.environ.get("RENDER_CACHE_BYTES", str(64 << 20)))
+# Serialized renders kept in the shared store, in bytes; the least recently
+# stored are deleted first, which are those of superseded feed versions
+RENDER_STORE_BYTES = int(os.environ.get("RENDER_STORE_BYTES", str(256 << 20)))
+# How long one process may take to render before another may take over
+RENDER_LEASE = 10.0
+# Seconds between checks of the store while another process renders
+RENDER_POLL = 0.02
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS renders (
+    key TEXT PRIMARY KEY,
+    body BLOB,
+    size INTEGER NOT NULL DEFAULT 0,
+    stored_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+
+def _loaded_version(url: str):
+    # Version of a feed already in memory; never the first fetch of one
+    if loaded_snapshot(url) is None:
+        return None
+    return feed_version(url)
+
+
+def render_key(name: str, versions, params=None) -> str:
+    """Cache key of a render of ``name`` from these feed versions and parameters"""
+    return json.dumps([name, list(versions), params or {}], sort_keys=True, default=str)
+
+
+class RenderCache:
+    """Serialized page renders, kept in memory and shared between workers.
+
+    Each render is stored as the JSON Dash would send for it, under a key
+    naming what it was rendered from (see ``render_key``); a key built from
+    feed versions never goes stale, it just stops being asked for. Workers
+    keep a least-recently-used set of renders bounded to ``max_bytes`` and
+    share every render through SQLite. The first process to miss a key
+    takes a lease on it and renders while other processes wait for the
+    stored result, and concurrent misses in one process wait for a single
+    lookup, so a burst of viewers on a new feed version costs one render.
+    """
+
+    def __init__(
+        self,
+        path: str = RENDER_CACHE_PATH,
+        max_bytes: int = RENDER_CACHE_BYTES,
+        store_bytes: int = RENDER_STORE_BYTES,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.store_bytes = store_bytes
+        self._memory = collections.OrderedDict()
+        self._bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        open_store(path, _SCHEMA)
+
+    def _remember(self, key: str, body: bytes):
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _claim(self, db, key: str, row) -> bool:
+        # Take the render lease unless another process holds an unexpired one
+        now = time.time()
+        if row is None:
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO renders (key, stored_at, lease_until)"
+                " VALUES (?, ?, ?)",
+                (key, now, now + RENDER_LEASE),
+            )
+        else:
+            cursor = db.execute(
+                "UPDATE renders SET lease_until = ?"
+                " WHERE key = ? AND body IS NULL AND lease_until < ?",
+                (now + RENDER_LEASE, key, now),
+            )
+        return cursor.rowcount == 1
+
+    def _store(self, key: str, body: bytes):
+        with connect(self.path) as db:
+            db.execute(
+                "UPDATE renders SET body = ?, size = ?, stored_at = ?, lease_until = 0"
+                " WHERE key = ?",
+                (body, len(body), time.time(), key),
+            )
+            # Keep the newest renders that fit in the store
+            db.execute(
+                "DELETE FROM renders WHERE key IN (SELECT key FROM ("
+                " SELECT key, SUM(size) OVER (ORDER BY stored_at DESC, key) AS total"
+                " FROM renders) WHERE total > ?)",
+                (self.store_bytes,),
+            )
+
+    def _release(self, key: str):
+        with connect(self.path) as db:
+            db.execute("DELETE FROM renders WHERE key = ? AND body IS NULL", (key,))
+
+    def _load(self, key: str, render) -> bytes:
+        # The stored render of ``key``, rendering it if no process has
+        while True:
+            with connect(self.path) as db:
+                row = db.execute(
+                    "SELECT body FROM renders WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[0] is not None:
+                    metrics.inc("cache_requests_total", cache="render", result="shared")
+                    return bytes(row[0])
+                claimed = self._claim(db, key, row)
+            if claimed:
+                break
+            time.sleep(RENDER_POLL)
+
+        metrics.inc("cache_requests_total", cache="render", result="misses")
+        try:
+            body = to_json_plotly(render()).encode()
+        except BaseException:
+            # Let the next request, here or in another process, try again
+            self._release(key)
+            raise
+        self._store(key, body)
+        return body
+
+    def get(self, key: str, render):
+        """The JSON-decoded output of ``render()``, rendered once per ``key``"""
+        with self._lock:
+            body = self._memory.get(key)
+            if body is not None:
+                self._memory.move_to_end(key)
+                result = "hits"
+            else:
+                inflight = self._inflight.get(key)
+                leader = inflight is None
+                if leader:
+                    inflight = self._inflight[key] = Inflight()
+                result = None if leader else "coalesced"
+
+        if body is None and not leader:
+            body = inflight.wait()
+        elif body is None:
+            try:
+                body = self._load(key, render)
+            except BaseException as e:
+                with self._lock:
+                    del self._inflight[key]
+                inflight.fail(e)
+                raise
+            self._remember(key, body)
+            with self._lock:
+                del self._inflight[key]
+            inflight.resolve(body)
+        if result is not None:
+            metrics.inc("cache_requests_total", cache="render", result=result)
+        return json.loads(body)
+
+    def cached_layout(self, name: str, feeds, layout):
+        """Wrap a page layout so it renders once per version of ``feeds``.
+
+        The layout's arguments (path variables and query parameters) are part
+        of the key. Until every one of ``feeds`` has been loaded the page is
+        rendered on every request, since what it shows is not versioned.
+        """
+
+        @functools.wraps(layout)
+        def wrapper(**kwargs):
+            versions = [_loaded_version(url) for url in feeds]
+            if None in versions:
+                return layout(**kwargs)
+            key = render_key(name, versions, kwargs)
+            return self.get(key, functools.partial(layout, **kwargs))
+
+        return wrapper
+
+    def clear(self):
+        """Forget every render, in memory and in the shared store"""
+        with self._lock:
+            self._memory.clear()
+            self._bytes = 0
+        with connect(self.path) as db:
+            db.execute("DELETE FROM renders WHERE body IS NOT NULL")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._memory), "bytes": self._bytes}
+
+
+render_cache = RenderCache()
+
+
+@metrics.collect
+def _render_samples():
+    stats = render_cache.stats()
+    return [("render_cache_bytes", {}, stats["bytes"])]
@@ -0,0 +1,186 @@
+import functools
+import glob
+import json
+import os
+
+import numpy as np
+
+from utils.map_matching import RouteLines
+from utils.spatial import GridIndex
+
+# Built by `python extract_route_stops.py --all`
+ROUTE_GEOMETRY_PATH = os.path.join("assets", "route_geometry.npy")
+LEGACY_STOPS_PATTERN = os.path.join("assets", "*_stops.json")
+
+STOP_FIELDS = [
+    ("route_id", "U"),
+    ("direction_id", "i1"),
+    ("stop_id", "i8"),
+    ("place_code", "U"),
+    ("description", "U"),
+    ("latitude", "f8"),
+    ("longitude", "f8"),
+]
+
+
+def stops_to_array(stops: list) -> np.ndarray:
+    """Pack stop dicts (as written by extract_route_stops.py) into a structured array.
+
+    String fields are sized to the longest value, and rows are grouped by
+    route and direction while keeping each line's stop order.
+    """
+    stops = sorted(stops, key=lambda s: (str(s["route_id"]), s["direction_id"]))
+    dtype = []
+    for name, kind in STOP_FIELDS:
+        if kind == "U":
+            width = max((len(str(s.get(name) or "")) for s in stops), default=1)
+            kind = f"U{max(width, 1)}"
+        dtype.append((name, kind))
+    return np.array(
+        [
+            (
+                str(s["route_id"]),
+                s["direction_id"],
+                s.get("stop_id") or 0,
+                s.get("place_code") or "",
+                s.get("description") or "",
+                s.get("latitude") if s.get("latitude") is not None else np.nan,
+                s.get("longitude") if s.get("longitude") is not None else np.nan,
+            )
+            for s in stops
+        ],
+        dtype=dtype,
+    )
+
+
+def write_route_geometry(stops: list, path: str = ROUTE_GEOMETRY_PATH):
+    """Write every route's stops to a single memory-mappable .npy file.
+
+    Running workers have the old file mapped, so the new one is written
+    under a temporary name and moved into place; truncating a mapped file
+    would crash them.
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        np.save(f, stops_to_array(stops), allow_pickle=False)
+    os.replace(temporary, path)
+
+
+def _concatenate(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    # Widen string fields so neither array's values are truncated
+    dtype = [
+        (name, np.promote_types(first.dtype[name], second.dtype[name]))
+        for name in first.dtype.names
+    ]
+    return np.concatenate((first.astype(dtype), second.astype(dtype)))
+
+
+class RouteGeometry:
+    """Stop geometry for every route, indexed by route and direction.
+
+    ``stops`` is a structured array with one row per stop. Rows for one
+    (route_id, direction_id) are contiguous and in line order, so a lookup
+    returns a slice of the array without copying.
+    """
+
+    def __init__(self, stops: np.ndarray, version=0):
+        self.stops = stops
+        self.version = version
+        self._index = {}
+        if len(stops):
+            route_id = stops["route_id"]
+            direction_id = stops["direction_id"]
+            starts = np.concatenate(
+                (
+                    [0],
+                    np.flatnonzero(
+                        (route_id[1:] != route_id[:-1])
+                        | (direction_id[1:] != direction_id[:-1])
+                    )
+                    + 1,
+                    [len(stops)],
+                )
+            )
+            for start, end in zip(starts[:-1].tolist(), starts[1:].tolist()):
+                key = (str(route_id[start]), int(direction_id[start]))
+                self._index[key] = slice(start, end)
+
+    @classmethod
+    def load(cls, path: str = ROUTE_GEOMETRY_PATH, legacy_pattern=LEGACY_STOPS_PATTERN):
+        """Memory-map the geometry file, falling back to per-route JSON assets.
+
+        Routes that only exist as ``assets/<route_id>_stops.json`` are
+        included either way, so hand-made files keep working.
+        """
+        stops = None
+        version = 0
+        if os.path.exists(path):
+            stops = np.load(path, mmap_mode="r", allow_pickle=False)
+            version = os.path.getmtime(path)
+
+        known = set() if stops is None else set(np.unique(stops["route_id"]).tolist())
+        legacy = []
+        for legacy_path in sorted(glob.glob(legacy_pattern)):
+            route_id = os.path.basename(legacy_path).rsplit("_stops.json", 1)[0]
+            if route_id in known:
+                continue
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                legacy.extend(json.load(f))
+            version = max(version, os.path.getmtime(legacy_path))
+
+        if legacy:
+            legacy_stops = stops_to_array(legacy)
+            stops = legacy_stops if stops is None else _concatenate(stops, legacy_stops)
+        if stops is None:
+            stops = stops_to_array([])
+        return cls(stops, version=version)
+
+    def routes(self) -> list:
+        """Route ids that have geometry"""
+        return sorted({route_id for route_id, _ in self._index})
+
+    def directions(self, route_id: str) -> list:
+        """Direction ids with geometry for ``route_id``"""
+        return sorted(d for r, d in self._index if r == str(route_id))
+
+    def span(self, route_id: str, direction_id: int = None) -> slice:
+        """Rows of one direction of a route, or of all its directions"""
+        route_id = str(route_id)
+        if direction_id is not None:
+            return self._index.get((route_id, int(direction_id)), slice(0, 0))
+        spans = [self._index[(route_id, d)] for d in self.directions(route_id)]
+        if not spans:
+            return slice(0, 0)
+        return slice(spans[0].start, spans[-1].stop)
+
+    def stops_for(self, route_id: str, direction_id: int = None) -> np.ndarray:
+        """Stops of one direction of a route, or of all its directions"""
+        return self.stops[self.span(route_id, direction_id)]
+
+    @functools.cached_property
+    def grid(self) -> GridIndex:
+        """Spatial index over the stop rows, built on first use"""
+        return GridIndex.from_points(self.stops["latitude"], self.stops["longitude"])
+
+    @functools.cached_property
+    def lines(self) -> RouteLines:
+        """Line through each route direction's stops, built on first use"""
+        return RouteLines.from_geometry(self)
+
+    def stops_in_bbox(self, min_lat, min_lon, max_lat, max_lon) -> np.ndarray:
+        """Stop rows inside a latitude/longitude box, in array order"""
+        return self.stops[self.grid.in_bbox(min_lat, min_lon, max_lat, max_lon)]
+
+    def nearest_stops(self, latitude, longitude, k: int = 5, max_distance=None):
+        """The ``k`` stop rows nearest a point, and their distances in meters.
+
+        A stop served by several routes or directions has a row for each.
+        """
+        rows, distances = self.grid.nearest(latitude, longitude, k, max_distance)
+        return self.stops[rows], distances
+
+
+@functools.lru_cache(maxsize=1)
+def route_geometry() -> RouteGeometry:
+    """The route geometry loaded once per process"""
+    return RouteGeometry.load()
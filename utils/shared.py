@@ -0,0 +1,56 @@
+import contextlib
+import os
+import sqlite3
+import threading
+
+
+class Inflight:
+    """Result slot shared by every caller waiting on the same piece of work.
+
+    The first caller does the work and calls ``resolve`` or ``fail``; the
+    others call ``wait`` and get its result or its exception.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def resolve(self, value):
+        self.value = value
+        self.done.set()
+
+    def fail(self, error: BaseException):
+        self.error = error
+        self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def open_store(path: str, schema: str):
+    """Create a SQLite store shared between worker processes, in WAL mode"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with connect(path) as db:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(schema)
+
+
+@contextlib.contextmanager
+def connect(path: str):
+    """A connection to ``path`` for one transaction, closed afterwards.
+
+    One short-lived connection per call keeps the stores safe across threads
+    and forked workers.
+    """
+    db = sqlite3.connect(path, timeout=5)
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
@@ -0,0 +1,124 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6_371_008.8
+# Grid cell size in degrees: about 1.1 km north-south and 0.8 km east-west
+# in the Twin Cities, so a neighbourhood query touches a handful of cells
+GRID_CELL_DEG = 0.01
+# Row stride of the cell keys; larger than the number of longitude columns
+_COLUMNS = 1 << 20
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in meters, broadcasting over array arguments"""
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2)
+    )
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GridIndex:
+    """Points bucketed into a fixed latitude/longitude grid.
+
+    Point indexes are sorted by cell, so the points of one cell are a
+    contiguous run of ``order`` located with ``searchsorted`` on the sorted
+    cell keys; a bounding box is answered one grid row at a time and only
+    the candidates from those cells are tested exactly. Points without a
+    position (NaN) are never returned. Boxes crossing the antimeridian are
+    not supported.
+    """
+
+    __slots__ = ("latitude", "longitude", "cell_size", "keys", "order")
+
+    def __init__(self, latitude, longitude, cell_size, keys, order):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.cell_size = cell_size
+        self.keys = keys
+        self.order = order
+
+    @classmethod
+    def from_points(cls, latitude, longitude, cell_size: float = GRID_CELL_DEG):
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        valid = np.flatnonzero(np.isfinite(latitude) & np.isfinite(longitude))
+        keys = cls._cell_keys(latitude[valid], longitude[valid], cell_size)
+        sort = np.argsort(keys, kind="stable")
+        return cls(latitude, longitude, cell_size, keys[sort], valid[sort])
+
+    @staticmethod
+    def _cell(value, cell_size):
+        return np.floor(np.asarray(value) / cell_size).astype(np.int64)
+
+    @classmethod
+    def _cell_keys(cls, latitude, longitude, cell_size):
+        return cls._cell(latitude, cell_size) * _COLUMNS + (
+            cls._cell(longitude, cell_size) + _COLUMNS // 2
+        )
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon) -> np.ndarray:
+        """Indexes of the points inside a latitude/longitude box, ascending"""
+        if not len(self.order) or min_lat > max_lat or min_lon > max_lon:
+            return np.empty(0, dtype=np.intp)
+        size = self.cell_size
+        rows = np.arange(self._cell(min_lat, size), self._cell(max_lat, size) + 1)
+        if len(rows) > len(self.order):
+            # A box taller than there are points: testing them all is cheaper
+            candidates = self.order
+        else:
+            first = rows * _COLUMNS + self._cell(min_lon, size) + _COLUMNS // 2
+            last = rows * _COLUMNS + self._cell(max_lon, size) + _COLUMNS // 2
+            starts = np.searchsorted(self.keys, first, side="left")
+            stops = np.searchsorted(self.keys, last, side="right")
+            candidates = np.concatenate(
+                [self.order[a:b] for a, b in zip(starts.tolist(), stops.tolist())]
+            )
+        lat = self.latitude[candidates]
+        lon = self.longitude[candidates]
+        inside = (
+            (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        )
+        return np.sort(candidates[inside])
+
+    def _box(self, latitude, longitude, meters):
+        # Box around a point that contains every point within ``meters``
+        dlat = np.degrees(meters / EARTH_RADIUS_M)
+        dlon = dlat / max(np.cos(np.radians(latitude)), 1e-6)
+        return latitude - dlat, longitude - dlon, latitude + dlat, longitude + dlon
+
+    def within(self, latitude, longitude, meters):
+        """Indexes and distances of the points within ``meters``, nearest first"""
+        rows = self.in_bbox(*self._box(latitude, longitude, meters))
+        distances = haversine(
+            latitude, longitude, self.latitude[rows], self.longitude[rows]
+        )
+        keep = distances <= meters
+        rows, distances = rows[keep], distances[keep]
+        sort = np.argsort(distances, kind="stable")
+        return rows[sort], distances[sort]
+
+    def nearest(self, latitude, longitude, k: int = 5, max_distance: float = None):
+        """Indexes and distances (meters) of the ``k`` nearest points, nearest first.
+
+        The search radius starts at one cell and doubles until it holds
+        ``k`` points; every point outside it is farther than those inside,
+        so they are the nearest. Fewer are returned if ``max_distance`` is
+        reached first.
+        """
+        k = min(k, len(self.order))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        radius = np.radians(self.cell_size) * EARTH_RADIUS_M
+        limit = np.pi * EARTH_RADIUS_M if max_distance is None else max_distance
+        while True:
+            radius = min(radius, limit)
+            rows, distances = self.within(latitude, longitude, radius)
+            if len(rows) >= k or radius >= limit:
+                return rows[:k], distances[:k]
+            radius *= 2
@@ -0,0 +1,195 @@
+import math
+import re
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+# Dash DataTable filter operators, by every spelling the table can emit
+OPERATORS = {
+    "=": "eq",
+    "eq": "eq",
+    "!=": "ne",
+    "ne": "ne",
+    "<": "lt",
+    "lt": "lt",
+    "<=": "le",
+    "le": "le",
+    ">": "gt",
+    "gt": "gt",
+    ">=": "ge",
+    "ge": "ge",
+    "contains": "contains",
+    "datestartswith": "datestartswith",
+}
+
+_EXPRESSION = re.compile(
+    r"""^\{(?P<column>[^}]+)\}\s+
+        (?P<case>[is]?)(?P<operator>!=|<=|>=|=|<|>|eq|ne|lt|le|gt|ge|contains|datestartswith)
+        \s+(?P<value>.*)$""",
+    re.VERBOSE,
+)
+
+
+def parse_filter_query(filter_query: str) -> list:
+    """Split a DataTable ``filter_query`` into (column, operator, value, case) terms.
+
+    Values written in quotes stay strings; bare numeric values become numbers.
+    ``case`` is "i" for the case-insensitive operator forms and "" otherwise.
+    Terms that are not understood are skipped.
+    """
+    terms = []
+    expressions = (s.strip() for s in (filter_query or "").split(" && "))
+    for expression in filter(None, expressions):
+        match = _EXPRESSION.match(expression)
+        if not match:
+            continue
+        value = match["value"].strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'`":
+            value = value[1:-1]
+        else:
+            try:
+                value = float(value) if "." in value else int(value)
+            except ValueError:
+                pass
+        terms.append(
+            (match["column"], OPERATORS[match["operator"]], value, match["case"])
+        )
+    return terms
+
+
+def _sort_key(value):
+    # Numbers sort before text and missing values go last, like the native table
+    if isinstance(value, bool):
+        return (0, int(value))
+    if isinstance(value, (int, float)):
+        return (2, "") if math.isnan(value) else (0, value)
+    if value is None:
+        return (2, "")
+    return (1, str(value))
+
+
+class TableQueryEngine:
+    """Filter, sort and paginate a list of rows for a server-side DataTable.
+
+    Each column gets a sorted index the first time it is filtered or sorted
+    on. Comparisons and equality filters are then binary searches over that
+    index, and sorting reuses it, so repeated page requests against the same
+    data only pay for the rows they return.
+    """
+
+    def __init__(self, rows: list):
+        self.rows = rows
+        self._orders = {}
+        self._keys = {}
+        self._ranks = {}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _index(self, column: str):
+        """Row order sorting ``column`` ascending, and the sort keys in that order"""
+        if column not in self._orders:
+            keys = [_sort_key(row.get(column)) for row in self.rows]
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            self._orders[column] = np.asarray(order, dtype=np.intp)
+            self._keys[column] = [keys[i] for i in order]
+        return self._orders[column], self._keys[column]
+
+    def _rank(self, column: str) -> np.ndarray:
+        """Dense rank of every row by ``column``; equal values share a rank"""
+        if column not in self._ranks:
+            order, keys = self._index(column)
+            changes = np.fromiter(
+                (i > 0 and keys[i] != keys[i - 1] for i in range(len(keys))),
+                dtype=bool,
+                count=len(keys),
+            )
+            rank = np.empty(len(order), dtype=np.intp)
+            rank[order] = np.cumsum(changes)
+            self._ranks[column] = rank
+        return self._ranks[column]
+
+    def _rows_between(self, column: str, lo: int, hi: int, mask: np.ndarray):
+        order, _ = self._index(column)
+        mask[order[lo:hi]] = True
+
+    def _term_mask(self, column: str, operator: str, value, case: str) -> np.ndarray:
+        mask = np.zeros(len(self.rows), dtype=bool)
+        if operator in ("contains", "datestartswith"):
+            needle = str(value)
+            if case == "i":
+                needle = needle.lower()
+            for i, row in enumerate(self.rows):
+                cell = row.get(column)
+                if cell is None:
+                    continue
+                cell = str(cell).lower() if case == "i" else str(cell)
+                if operator == "contains":
+                    mask[i] = needle in cell
+                else:
+                    mask[i] = cell.startswith(needle)
+            return mask
+
+        if case == "i" and isinstance(value, str) and operator in ("eq", "ne"):
+            needle = value.lower()
+            mask[:] = [str(row.get(column, "")).lower() == needle for row in self.rows]
+            return ~mask if operator == "ne" else mask
+
+        order, keys = self._index(column)
+        # A bare number also matches cells holding the same text, e.g. route "10"
+        candidates = [_sort_key(value)]
+        if not isinstance(value, str):
+            candidates.append(_sort_key(str(value)))
+        if operator in ("eq", "ne"):
+            for key in candidates:
+                self._rows_between(
+                    column, bisect_left(keys, key), bisect_right(keys, key), mask
+                )
+            return ~mask if operator == "ne" else mask
+
+        # Ordered comparisons stay within numbers or within text
+        key = candidates[0]
+        start = bisect_left(keys, (key[0],))
+        end = bisect_left(keys, (key[0] + 1,))
+        if operator == "lt":
+            self._rows_between(column, start, bisect_left(keys, key), mask)
+        elif operator == "le":
+            self._rows_between(column, start, bisect_right(keys, key), mask)
+        elif operator == "gt":
+            self._rows_between(column, bisect_right(keys, key), end, mask)
+        elif operator == "ge":
+            self._rows_between(column, bisect_left(keys, key), end, mask)
+        return mask
+
+    def query(
+        self,
+        filter_query: str = "",
+        sort_by: list = None,
+        page_current: int = 0,
+        page_size: int = None,
+    ):
+        """Rows for one page of the table, and the number of pages.
+
+        Arguments mirror the DataTable properties of the same names.
+        """
+        mask = np.ones(len(self.rows), dtype=bool)
+        for term in parse_filter_query(filter_query):
+            mask &= self._term_mask(*term)
+
+        if sort_by:
+            # Rank of each row per sort column; lexsort wants the primary key last
+            ranks = []
+            for sort in reversed(sort_by):
+                rank = self._rank(sort["column_id"])
+                ranks.append(-rank if sort.get("direction") == "desc" else rank)
+            order = np.lexsort(ranks)
+            matched = order[mask[order]]
+        else:
+            matched = np.flatnonzero(mask)
+
+        if not page_size:
+            return [self.rows[i] for i in matched.tolist()], 1
+        page_count = max(1, math.ceil(len(matched) / page_size))
+        start = (page_current or 0) * page_size
+        page = matched[start : start + page_size]
+        return [self.rows[i] for i in page.tolist()], page_count
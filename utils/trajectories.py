@@ -0,0 +1,344 @@
+import os
+import threading
+
+import numpy as np
+
+from utils.gtfs_api import VEHICLE_POSITIONS_URL, derived
+from utils.metrics import metrics
+from utils.route_geometry import route_geometry
+from utils.spatial import haversine
+from utils.vehicles import VehicleSnapshot
+
+# Seconds of history kept per vehicle
+TRAJECTORY_WINDOW = float(os.environ.get("TRAJECTORY_WINDOW", str(4 * 60 * 60)))
+# Vehicles report about every 15 seconds; the ring holds a full window of those
+TRAJECTORY_CADENCE = 15.0
+# Vehicles tracked at once; the one seen least recently gives up its slot
+TRAJECTORY_VEHICLES = int(os.environ.get("TRAJECTORY_VEHICLES", "1500"))
+# Stops passed between samples further apart than this are not timed
+PASSAGE_MAX_GAP = 300
+# A vehicle this far behind its progress along its line has started a new trip
+BACKTRACK_M = 200.0
+# A vehicle this close to the end of its line has reached its last stop
+TERMINAL_REACH_M = 50.0
+
+# Per-sample columns and their types; 19 bytes per sample
+_COLUMNS = {
+    "timestamp": np.int64,
+    "latitude": np.float32,
+    "longitude": np.float32,
+    "route": np.int16,
+    "direction": np.int8,
+}
+
+
+class TrajectoryStore:
+    """Recent positions of every vehicle, in fixed-size ring buffers.
+
+    Each column is one preallocated ``(vehicles, capacity)`` array, so
+    memory is fixed when the store is created and never grows: a vehicle
+    has a row, and its newest sample overwrites its oldest. A vehicle's
+    position is stored only when its timestamp moves on, so ingesting the
+    same feed twice, or a feed in which a vehicle did not report, adds
+    nothing. When every row is taken, a new vehicle reuses the row of the
+    vehicle seen least recently.
+
+    With ``geometry``, each sample is matched to its route direction's
+    line, and the stops between a vehicle's furthest point so far and its
+    new distance along the line are passed: each passage is timed by
+    interpolating between the two samples and kept in a ring of its own.
+    Headways are computed from those passages (see utils/headways.py)
+    without reading the rest of the history.
+    """
+
+    def __init__(
+        self,
+        window: float = TRAJECTORY_WINDOW,
+        vehicles: int = TRAJECTORY_VEHICLES,
+        cadence: float = TRAJECTORY_CADENCE,
+        geometry=None,
+    ):
+        self.window = window
+        self.capacity = max(int(window // cadence), 2)
+        self.geometry = geometry
+        # Zero-filled arrays are only paged in as rows are used
+        shape = (vehicles, self.capacity)
+        self.columns = {
+            name: np.zeros(shape, dtype) for name, dtype in _COLUMNS.items()
+        }
+        self.head = np.zeros(vehicles, dtype=np.int64)
+        self.count = np.zeros(vehicles, dtype=np.int64)
+        self.last_seen = np.zeros(vehicles, dtype=np.int64)
+        # Line each vehicle was last matched to, and the furthest it got along it
+        self.line = np.full(vehicles, -1, dtype=np.int64)
+        self.progress = np.full(vehicles, np.nan)
+        # Stop passages: one a minute per vehicle on average fills the window
+        size = max(vehicles * self.capacity // 4, 1)
+        self.passages = {
+            "slot": np.full(size, -1, dtype=np.int32),
+            "stop": np.zeros(size, dtype=np.int64),
+            "timestamp": np.zeros(size, dtype=np.int64),
+        }
+        self._passage_head = 0
+        self.vehicle_ids = np.full(vehicles, None, dtype=object)
+        self.route_ids = []
+        self._route_codes = {}
+        self._slots = {}
+        self._free = list(range(vehicles - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values()) + sum(
+            column.nbytes for column in self.passages.values()
+        )
+
+    def _route_code(self, route_id: str) -> int:
+        code = self._route_codes.get(route_id)
+        if code is None:
+            code = self._route_codes[route_id] = len(self.route_ids)
+            self.route_ids.append(route_id)
+        return code
+
+    def _assign(self, vehicle_ids: list) -> np.ndarray:
+        # Row of each vehicle, giving new vehicles free rows and then the rows
+        # of the vehicles seen least recently; -1 for any left without one.
+        # A vehicle listed twice in one feed gets one row.
+        slots = np.array(
+            [self._slots.get(v, -1) for v in vehicle_ids], dtype=np.int64
+        )
+        missing = np.flatnonzero(slots < 0)
+        new_ids = list(dict.fromkeys(vehicle_ids[row] for row in missing.tolist()))
+        shortfall = len(new_ids) - len(self._free)
+        if shortfall > 0:
+            # Rows of vehicles that are tracked but absent from this feed
+            spare = np.not_equal(self.vehicle_ids, None)
+            spare[slots[slots >= 0]] = False
+            candidates = np.flatnonzero(spare)
+            order = np.argsort(self.last_seen[candidates], kind="stable")
+            reused = candidates[order[:shortfall]].tolist()
+        else:
+            reused = []
+        for slot in reused:
+            del self._slots[self.vehicle_ids[slot]]
+            self.vehicle_ids[slot] = None
+            self.head[slot] = self.count[slot] = self.last_seen[slot] = 0
+            self.line[slot] = -1
+            self.progress[slot] = np.nan
+            self.columns["timestamp"][slot] = 0
+            self.passages["slot"][self.passages["slot"] == slot] = -1
+            self._free.append(int(slot))
+        for vehicle_id in new_ids:
+            if not self._free:
+                break
+            slot = self._slots[vehicle_id] = self._free.pop()
+            self.vehicle_ids[slot] = vehicle_id
+        for row in missing.tolist():
+            slots[row] = self._slots.get(vehicle_ids[row], -1)
+        return slots
+
+    def ingest(self, vehicles: VehicleSnapshot) -> int:
+        """Append each vehicle's position if it is newer than its last; returns
+        how many were appended"""
+        reported = np.flatnonzero(
+            (vehicles.timestamp > 0)
+            & np.isfinite(vehicles.latitude)
+            & np.isfinite(vehicles.longitude)
+        )
+        vehicles = vehicles.select(reported)
+        if self.geometry is not None:
+            matched = self.geometry.lines.match(
+                vehicles.route_id,
+                vehicles.direction_id,
+                vehicles.latitude,
+                vehicles.longitude,
+            )
+        else:
+            matched = {
+                "line": np.full(len(vehicles), -1, dtype=np.int64),
+                "distance": np.full(len(vehicles), np.nan),
+            }
+
+        with self._lock:
+            slots = self._assign(vehicles.vehicle_id.tolist())
+            new = (slots >= 0) & (vehicles.timestamp > self.last_seen[slots])
+            rows, slots = np.flatnonzero(new), slots[new]
+            # A vehicle listed twice in one feed keeps its last entry
+            slots, last = np.unique(slots[::-1], return_index=True)
+            rows = rows[::-1][last]
+            if not len(rows):
+                return 0
+            codes = np.array(
+                [self._route_code(r) for r in vehicles.routes.tolist()], dtype=np.int16
+            )
+            position = self.head[slots]
+            self._pass_stops(
+                slots,
+                matched["line"][rows],
+                matched["distance"][rows],
+                vehicles.timestamp[rows],
+            )
+            values = {
+                "timestamp": vehicles.timestamp[rows],
+                "latitude": vehicles.latitude[rows],
+                "longitude": vehicles.longitude[rows],
+                "route": codes[vehicles.route_code[rows]],
+                "direction": vehicles.direction_id[rows],
+            }
+            for name, value in values.items():
+                self.columns[name][slots, position] = value
+            self.head[slots] = (position + 1) % self.capacity
+            self.count[slots] = np.minimum(self.count[slots] + 1, self.capacity)
+            self.last_seen[slots] = values["timestamp"]
+        return len(rows)
+
+    def _pass_stops(self, slots, line, distance, timestamp):
+        # Record the stops each vehicle passed since its previous sample,
+        # then move its progress on
+        previous = self.last_seen[slots]
+        progress = self.progress[slots]
+        on_line = np.flatnonzero(line >= 0)
+        if len(on_line):
+            length = self.geometry.lines.length[line[on_line]]
+            distance[on_line] = np.where(
+                distance[on_line] >= length - TERMINAL_REACH_M,
+                length,
+                distance[on_line],
+            )
+        with np.errstate(invalid="ignore"):
+            moved = (
+                (line >= 0)
+                & (line == self.line[slots])
+                & (distance > progress)
+                & (timestamp - previous <= PASSAGE_MAX_GAP)
+            )
+            restart = (line != self.line[slots]) | (distance < progress - BACKTRACK_M)
+        self.line[slots] = line
+        self.progress[slots] = np.where(restart, distance, np.fmax(progress, distance))
+        if not moved.any():
+            return
+        start, end = progress[moved], distance[moved]
+        move, stop, at = self.geometry.lines.stops_between(line[moved], start, end)
+        fraction = (at - start[move]) / (end - start)[move]
+        elapsed = (timestamp - previous)[moved][move]
+        self._record_passages(
+            slots[moved][move],
+            stop,
+            previous[moved][move] + np.round(fraction * elapsed).astype(np.int64),
+        )
+
+    def _record_passages(self, slots, stops, timestamps):
+        size = len(self.passages["slot"])
+        count = min(len(slots), size)
+        position = (self._passage_head + np.arange(count)) % size
+        values = {"slot": slots, "stop": stops, "timestamp": timestamps}
+        for name, value in values.items():
+            self.passages[name][position] = value[len(value) - count :]
+        self._passage_head = (self._passage_head + count) % size
+
+    def ingest_feed(self, snapshot):
+        """Feed poller listener: ingest each new vehicle positions version"""
+        if snapshot.url == VEHICLE_POSITIONS_URL:
+            self.ingest(derived(snapshot, "vehicles", VehicleSnapshot.from_feed))
+
+    def newest(self) -> int:
+        """Timestamp of the newest stored sample, or 0 if there is none"""
+        with self._lock:
+            return int(self.last_seen.max(initial=0))
+
+    def samples(self, since: float = None) -> dict:
+        """Every sample newer than ``since`` (default: the window), as flat columns.
+
+        ``slot`` names each sample's vehicle (see ``vehicle_ids``) and
+        ``route`` indexes ``route_ids``. Samples are sorted by vehicle and
+        then time.
+        """
+        with self._lock:
+            newest = int(self.last_seen.max(initial=0))
+            if since is None:
+                since = newest - self.window
+            # Each row read from its oldest sample on, so no sort is needed
+            ring = (self.head[:, None] + np.arange(self.capacity)) % self.capacity
+            timestamp = np.take_along_axis(self.columns["timestamp"], ring, axis=1)
+            slot, position = np.nonzero((timestamp > 0) & (timestamp > since))
+            position = ring[slot, position]
+            columns = {
+                name: column[slot, position] for name, column in self.columns.items()
+            }
+        columns["slot"] = slot
+        return columns
+
+    def arrivals(self, since: float = None) -> dict:
+        """Stop passages newer than ``since`` (default: the window), in no order.
+
+        Columns: ``slot`` (the vehicle), ``stop`` (a row of ``geometry``)
+        and ``timestamp``, interpolated between the samples either side.
+        """
+        with self._lock:
+            newest = int(self.last_seen.max(initial=0))
+            if since is None:
+                since = newest - self.window
+            passages = self.passages
+            kept = np.flatnonzero(
+                (passages["slot"] >= 0) & (passages["timestamp"] > since)
+            )
+            return {name: column[kept] for name, column in passages.items()}
+
+    def speeds(self) -> dict:
+        """Each vehicle's speed (m/s) between its last two samples.
+
+        Columns: ``slot``, and the ``route`` and ``direction`` of the last
+        sample. Vehicles with a single sample are left out.
+        """
+        with self._lock:
+            slot = np.flatnonzero(self.count >= 2)
+            last = (self.head[slot] - 1) % self.capacity
+            previous = (self.head[slot] - 2) % self.capacity
+            columns = self.columns
+            meters = haversine(
+                columns["latitude"][slot, previous],
+                columns["longitude"][slot, previous],
+                columns["latitude"][slot, last],
+                columns["longitude"][slot, last],
+            )
+            seconds = (
+                columns["timestamp"][slot, last] - columns["timestamp"][slot, previous]
+            )
+            return {
+                "slot": slot,
+                "route": columns["route"][slot, last],
+                "direction": columns["direction"][slot, last],
+                "speed": meters / seconds,
+            }
+
+    def trajectory(self, vehicle_id) -> dict:
+        """One vehicle's samples in the window, oldest first"""
+        with self._lock:
+            slot = self._slots.get(vehicle_id)
+            if slot is None:
+                return {name: column[0, :0] for name, column in self.columns.items()}
+            since = int(self.last_seen.max()) - self.window
+            ring = (self.head[slot] + np.arange(self.capacity)) % self.capacity
+            timestamp = self.columns["timestamp"][slot, ring]
+            ring = ring[(timestamp > 0) & (timestamp > since)]
+            return {name: column[slot, ring] for name, column in self.columns.items()}
+
+    def stats(self) -> dict:
+        with self._lock:
+            newest = int(self.last_seen.max(initial=0))
+            timestamp = self.columns["timestamp"]
+            oldest = timestamp[(timestamp > 0) & (timestamp > newest - self.window)]
+            return {
+                "since": int(oldest.min(initial=newest)),
+                "vehicles": len(self._slots),
+                "samples": int(self.count.sum()),
+                "bytes": self.nbytes,
+            }
+
+
+trajectories = TrajectoryStore(geometry=route_geometry())
+
+
+@metrics.collect
+def _trajectory_samples():
+    return [("trajectory_samples", {}, trajectories.stats()["samples"])]
@@ -0,0 +1,186 @@
+import time
+
+import numpy as np
+
+
+class TripIndex:
+    """Every stop time update of one trip updates feed, indexed by stop and trip.
+
+    One row per (trip, stop) prediction is kept in NumPy columns. Rows are in
+    feed order, so each trip's stops are a contiguous slice found through the
+    sorted ``trip_ids`` array. ``by_stop`` orders the rows by stop and then by
+    time, so the arrivals at a stop are a slice as well and "after a given
+    time" is one more binary search inside it. Times are POSIX seconds, with
+    -1 where the feed gives none.
+    """
+
+    __slots__ = (
+        "trip_ids",
+        "trip_route",
+        "trip_offsets",
+        "stops",
+        "stop_code",
+        "stop_sequence",
+        "arrival",
+        "departure",
+        "time",
+        "by_stop",
+        "stop_offsets",
+    )
+
+    def __init__(
+        self,
+        trip_ids,
+        trip_route,
+        trip_offsets,
+        stops,
+        stop_code,
+        stop_sequence,
+        arrival,
+        departure,
+    ):
+        # Trips are stored sorted by id; trip_offsets[i]:trip_offsets[i + 1]
+        # are the rows of trip i
+        self.trip_ids = trip_ids
+        self.trip_route = trip_route
+        self.trip_offsets = trip_offsets
+        self.stops = stops
+        self.stop_code = stop_code
+        self.stop_sequence = stop_sequence
+        self.arrival = arrival
+        self.departure = departure
+        # Arrival time, or departure time at stops that only predict one
+        self.time = np.where(arrival >= 0, arrival, departure)
+        self.by_stop = np.lexsort((self.time, stop_code))
+        self.stop_offsets = np.searchsorted(
+            stop_code[self.by_stop], np.arange(len(stops) + 1)
+        )
+
+    @classmethod
+    def empty(cls) -> "TripIndex":
+        return cls.from_trips([])
+
+    @classmethod
+    def from_trips(cls, trips: list) -> "TripIndex":
+        """Build an index from (trip_id, route_id, [(stop_id, sequence, arrival,
+        departure), ...]) tuples, with -1 for a missing sequence or time"""
+        trips = sorted(trips, key=lambda trip: trip[0])
+        trip_ids = np.array([trip[0] for trip in trips], dtype=str)
+        trip_route = np.array([trip[1] for trip in trips], dtype=str)
+        lengths = [len(trip[2]) for trip in trips]
+        trip_offsets = np.zeros(len(trips) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=trip_offsets[1:])
+
+        rows = [row for trip in trips for row in trip[2]]
+        stops, stop_code = np.unique(
+            np.array([row[0] for row in rows], dtype=str), return_inverse=True
+        )
+        return cls(
+            trip_ids=trip_ids,
+            trip_route=trip_route,
+            trip_offsets=trip_offsets,
+            stops=stops,
+            stop_code=stop_code.astype(np.int32),
+            stop_sequence=np.array([row[1] for row in rows], dtype=np.int32),
+            arrival=np.array([row[2] for row in rows], dtype=np.int64),
+            departure=np.array([row[3] for row in rows], dtype=np.int64),
+        )
+
+    @classmethod
+    def from_feed(cls, feed) -> "TripIndex":
+        """Index all stop time updates of a trip updates feed"""
+        trips = []
+        for entity in feed.entity:
+            if not entity.HasField("trip_update"):
+                continue
+            trip_update = entity.trip_update
+            trip = trip_update.trip
+            stop_times = [
+                (
+                    stop_time.stop_id,
+                    stop_time.stop_sequence
+                    if stop_time.HasField("stop_sequence")
+                    else -1,
+                    stop_time.arrival.time if stop_time.HasField("arrival") else -1,
+                    stop_time.departure.time
+                    if stop_time.HasField("departure")
+                    else -1,
+                )
+                for stop_time in trip_update.stop_time_update
+            ]
+            trips.append((trip.trip_id, trip.route_id, stop_times))
+        return cls.from_trips(trips)
+
+    def __len__(self) -> int:
+        return len(self.stop_code)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the index arrays"""
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    def _trip_position(self, trip_id: str):
+        i = int(np.searchsorted(self.trip_ids, trip_id))
+        if i < len(self.trip_ids) and self.trip_ids[i] == trip_id:
+            return i
+        return None
+
+    def _row_trips(self, rows: np.ndarray) -> np.ndarray:
+        # The trip of each row, from the trip slice the row falls into
+        return np.searchsorted(self.trip_offsets, rows, side="right") - 1
+
+    def _records(self, rows: np.ndarray) -> list:
+        trips = self._row_trips(rows)
+        return [
+            {
+                "trip_id": trip_id,
+                "route_id": route_id,
+                "stop_id": stop_id,
+                "stop_sequence": None if sequence < 0 else sequence,
+                "arrival": None if arrival < 0 else arrival,
+                "departure": None if departure < 0 else departure,
+            }
+            for trip_id, route_id, stop_id, sequence, arrival, departure in zip(
+                self.trip_ids[trips].tolist(),
+                self.trip_route[trips].tolist(),
+                self.stops[self.stop_code[rows]].tolist(),
+                self.stop_sequence[rows].tolist(),
+                self.arrival[rows].tolist(),
+                self.departure[rows].tolist(),
+            )
+        ]
+
+    def stop_rows(self, stop_id: str, after: float = None) -> np.ndarray:
+        """Rows of predictions at ``stop_id`` in time order, from ``after`` on"""
+        code = int(np.searchsorted(self.stops, stop_id))
+        if code >= len(self.stops) or self.stops[code] != stop_id:
+            return self.by_stop[:0]
+        start, end = self.stop_offsets[code], self.stop_offsets[code + 1]
+        if after is not None:
+            times = self.time[self.by_stop[start:end]]
+            start += int(np.searchsorted(times, after, side="left"))
+        return self.by_stop[start:end]
+
+    def arrivals(self, stop_id: str, after: float = None, limit: int = None) -> list:
+        """Upcoming predictions at a stop, soonest first.
+
+        ``after`` defaults to now; pass 0 to include past predictions too.
+        """
+        after = time.time() if after is None else after
+        rows = self.stop_rows(str(stop_id), after)
+        if limit is not None:
+            rows = rows[:limit]
+        return self._records(rows)
+
+    def trip_stops(self, trip_id: str) -> list:
+        """Every predicted stop of a trip, in feed order"""
+        i = self._trip_position(str(trip_id))
+        if i is None:
+            return []
+        rows = np.arange(self.trip_offsets[i], self.trip_offsets[i + 1])
+        return self._records(rows)
+
+    def next_stops(self) -> list:
+        """The first predicted stop of every trip that has one"""
+        starts = self.trip_offsets[:-1]
+        return self._records(starts[starts < self.trip_offsets[1:]])
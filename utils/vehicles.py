@@ -0,0 +1,197 @@
+import time
+
+import numpy as np
+
+from utils.feed_decode import format_posix, vehicle_columns
+
+# Feed fields kept in a snapshot, in from_columns argument order
+SNAPSHOT_FIELDS = (
+    "vehicle_id",
+    "trip_id",
+    "route_id",
+    "direction_id",
+    "latitude",
+    "longitude",
+    "bearing",
+    "speed",
+    "timestamp",
+)
+
+
+class VehicleSnapshot:
+    """Column-oriented view of one vehicle positions feed.
+
+    Each attribute is a NumPy array with one row per vehicle; ``route_id`` is
+    stored as integer codes into the sorted ``routes`` array so filtering by
+    route compares small integers instead of strings. Timestamps stay POSIX
+    seconds and are only formatted for the rows actually displayed.
+    """
+
+    __slots__ = (
+        "vehicle_id",
+        "trip_id",
+        "routes",
+        "route_code",
+        "direction_id",
+        "latitude",
+        "longitude",
+        "bearing",
+        "speed",
+        "timestamp",
+    )
+
+    def __init__(
+        self,
+        vehicle_id,
+        trip_id,
+        routes,
+        route_code,
+        direction_id,
+        latitude,
+        longitude,
+        bearing,
+        speed,
+        timestamp,
+    ):
+        self.vehicle_id = vehicle_id
+        self.trip_id = trip_id
+        self.routes = routes
+        self.route_code = route_code
+        self.direction_id = direction_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.bearing = bearing
+        self.speed = speed
+        self.timestamp = timestamp
+
+    @classmethod
+    def empty(cls) -> "VehicleSnapshot":
+        return cls.from_columns([], [], [], [], [], [], [], [], [])
+
+    @classmethod
+    def from_columns(
+        cls,
+        vehicle_id,
+        trip_id,
+        route_id,
+        direction_id,
+        latitude,
+        longitude,
+        bearing,
+        speed,
+        timestamp,
+    ) -> "VehicleSnapshot":
+        """Build a snapshot from equal-length per-vehicle sequences.
+
+        Missing ``direction_id`` values are -1 and missing ``bearing`` and
+        ``speed`` values are NaN.
+        """
+        routes, route_code = np.unique(
+            np.asarray(route_id, dtype=str), return_inverse=True
+        )
+        return cls(
+            vehicle_id=np.asarray(vehicle_id, dtype=object),
+            trip_id=np.asarray(trip_id, dtype=object),
+            routes=routes,
+            route_code=route_code.astype(np.int16),
+            direction_id=np.asarray(direction_id, dtype=np.int8),
+            latitude=np.asarray(latitude, dtype=np.float32),
+            longitude=np.asarray(longitude, dtype=np.float32),
+            bearing=np.asarray(bearing, dtype=np.float32),
+            speed=np.asarray(speed, dtype=np.float32),
+            timestamp=np.asarray(timestamp, dtype=np.int64),
+        )
+
+    @classmethod
+    def from_feed(cls, feed) -> "VehicleSnapshot":
+        """Extract the displayed vehicle fields from a vehicle positions feed"""
+        columns = vehicle_columns(feed, SNAPSHOT_FIELDS)
+        return cls.from_columns(*(columns[name] for name in SNAPSHOT_FIELDS))
+
+    def __len__(self) -> int:
+        return len(self.vehicle_id)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the columns, excluding the id strings"""
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    @property
+    def route_id(self) -> np.ndarray:
+        """Route id per vehicle, decoded from the route codes"""
+        return self.routes[self.route_code]
+
+    def select(self, rows) -> "VehicleSnapshot":
+        """A snapshot of the vehicles picked by a boolean mask or index array"""
+        return VehicleSnapshot(
+            routes=self.routes,
+            **{
+                name: getattr(self, name)[rows]
+                for name in self.__slots__
+                if name != "routes"
+            },
+        )
+
+    def route_mask(self, *route_ids) -> np.ndarray:
+        """Boolean mask of vehicles serving any of ``route_ids``"""
+        codes = np.flatnonzero(np.isin(self.routes, route_ids))
+        return np.isin(self.route_code, codes)
+
+    def for_route(self, *route_ids) -> "VehicleSnapshot":
+        """Vehicles serving any of ``route_ids``"""
+        return self.select(self.route_mask(*route_ids))
+
+    def bbox_mask(self, min_lat, min_lon, max_lat, max_lon) -> np.ndarray:
+        """Boolean mask of vehicles inside a latitude/longitude box"""
+        return (
+            (self.latitude >= min_lat)
+            & (self.latitude <= max_lat)
+            & (self.longitude >= min_lon)
+            & (self.longitude <= max_lon)
+        )
+
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon) -> "VehicleSnapshot":
+        """Vehicles inside a latitude/longitude box"""
+        return self.select(self.bbox_mask(min_lat, min_lon, max_lat, max_lon))
+
+    def fresh(self, max_age: float, now: float = None) -> "VehicleSnapshot":
+        """Vehicles that reported a position within the last ``max_age`` seconds"""
+        now = time.time() if now is None else now
+        return self.select(self.timestamp >= now - max_age)
+
+    def format_timestamps(self, fmt: str = "%Y-%m-%d %H:%M:%S") -> list:
+        """Local-time strings for each vehicle's last report"""
+        return format_posix(self.timestamp, fmt)
+
+    def display_columns(self) -> dict:
+        """Columns for plotting, with timestamps formatted for these rows only"""
+        return {
+            "vehicle_id": self.vehicle_id,
+            "route_id": self.route_id,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "timestamp": self.format_timestamps(),
+        }
+
+    def to_records(self) -> list:
+        """One dict per vehicle, in the shape of ``fetch_vehicle_positions``"""
+        return [
+            {
+                "vehicle_id": vehicle_id,
+                "trip_id": trip_id,
+                "route_id": route_id,
+                "latitude": latitude,
+                "longitude": longitude,
+                "speed": "N/A" if speed != speed else speed,
+                "timestamp": timestamp,
+            }
+            for vehicle_id, trip_id, route_id, latitude, longitude, speed, timestamp in zip(
+                self.vehicle_id.tolist(),
+                self.trip_id.tolist(),
+                self.route_id.tolist(),
+                self.latitude.tolist(),
+                self.longitude.tolist(),
+                self.speed.tolist(),
+                self.format_timestamps(),
+            )
+        ]